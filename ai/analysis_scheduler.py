@@ -0,0 +1,348 @@
+"""
+Analysis Scheduler Module
+Kamera bo'yicha moslashuvchan tahlil tezligi (sahna faolligiga qarab).
+"""
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from dataclasses import dataclass
+
+from utils.config import (
+    ANALYSIS_MIN_FPS, ANALYSIS_MAX_FPS, ANALYSIS_CPU_BUDGET, ANALYSIS_IDLE_HALF_LIFE
+)
+from utils.logger import logger
+from ai.motion_detector import motion_gate
+
+
+@dataclass
+class CameraSchedule:
+    """Kamera tahlil jadvali."""
+    camera_id: int
+    min_fps: float
+    max_fps: float
+    rate: float                 # Faollik bo'yicha so'ralgan tezlik (fps)
+    effective_rate: float = 0.0 # CPU budjeti qo'llangandan keyingi tezlik
+    next_due: float = 0.0
+    last_run: float = 0.0
+    analyzed: int = 0
+    active_tracks: int = 0
+    motion: bool = False
+
+
+class AnalysisScheduler:
+    """
+    Moslashuvchan tahlil rejalashtiruvchisi.
+    
+    Aktiv tracklar yoki harakat bo'lsa kamera tezligi ``max_fps`` gacha
+    ko'tariladi, sahna bo'sh qolganda esa ``ANALYSIS_IDLE_HALF_LIFE``
+    yarim yemirilish bilan ``min_fps`` gacha pasayadi. Barcha kameralar
+    bitta ishchi oqimda navbat bilan tahlil qilinadi; umumiy yuklama
+    ``cpu_budget`` (CPU yadro ulushi) dan oshsa tezliklar mutanosib
+    kamaytiriladi, lekin ``min_fps`` dan pastga tushmaydi.
+    
+    Kadrlar stream_manager obunasi orqali (sub-stream) olinadi, shuning
+    uchun kamera bir marta dekodlanadi va capture boshqa oqimlar bilan
+    bo'lishilmaydi. ``camera_source`` berilsa kameralar ro'yxati
+    ishlash davomida qayta o'qiladi.
+    """
+    
+    # Tracks seen within this many seconds count as scene activity
+    TRACK_RECENT_SECONDS = 5.0
+    # Seconds between re-reads of the camera list (cameras added or removed at runtime)
+    CAMERA_REFRESH_SECONDS = 10.0
+    
+    def __init__(self, detector=None, tracker=None,
+                 min_fps: float = ANALYSIS_MIN_FPS, max_fps: float = ANALYSIS_MAX_FPS,
+                 cpu_budget: float = ANALYSIS_CPU_BUDGET,
+                 idle_half_life: float = ANALYSIS_IDLE_HALF_LIFE):
+        """
+        Args:
+            detector: ObjectDetector (default: global detector)
+            tracker: MultiObjectTracker (default: global object_tracker)
+            min_fps, max_fps: Default per-camera rate limits
+            cpu_budget: Share of one CPU core analysis may use
+            idle_half_life: Seconds for an idle camera's rate to halve
+        """
+        self.detector = detector
+        self.tracker = tracker
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.cpu_budget = cpu_budget
+        self.idle_half_life = idle_half_life
+        
+        self.schedules: Dict[int, CameraSchedule] = {}
+        self.result_callbacks: List[Callable] = []
+        self.frame_source: Optional[Callable] = None
+        self.camera_source: Optional[Callable[[], List[int]]] = None
+        self._subscriptions: Dict[int, object] = {}  # camera -> FrameSubscription
+        self._cameras_synced = 0.0
+        
+        # Moving average of one inference (detect + track) in seconds; gate-skipped frames excluded
+        self.avg_cost = 0.0
+        
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def add_camera(self, camera_id: int, min_fps: float = None, max_fps: float = None):
+        """Kamerani tahlilga qo'shish."""
+        min_fps = self.min_fps if min_fps is None else min_fps
+        max_fps = self.max_fps if max_fps is None else max_fps
+        
+        with self._lock:
+            self.schedules[camera_id] = CameraSchedule(
+                camera_id=camera_id,
+                min_fps=min_fps,
+                max_fps=max_fps,
+                rate=min_fps,
+                effective_rate=min_fps
+            )
+            self._apply_budget()
+    
+    def remove_camera(self, camera_id: int):
+        """Kamerani tahlildan olib tashlash."""
+        with self._lock:
+            self.schedules.pop(camera_id, None)
+            self._apply_budget()
+        
+        self._unsubscribe(camera_id)
+    
+    def sync_cameras(self, camera_ids: List[int]):
+        """Tahlil qilinadigan kameralarni ro'yxatga moslash (yangilari qo'shiladi, yo'qlari olinadi)."""
+        wanted = set(camera_ids)
+        with self._lock:
+            current = set(self.schedules)
+        
+        for camera_id in wanted - current:
+            self.add_camera(camera_id)
+        for camera_id in current - wanted:
+            self.remove_camera(camera_id)
+    
+    def set_limits(self, camera_id: int, min_fps: float = None, max_fps: float = None):
+        """Kamera uchun min/max tezlikni o'zgartirish."""
+        with self._lock:
+            schedule = self.schedules.get(camera_id)
+            if schedule is None:
+                return
+            
+            if min_fps is not None:
+                schedule.min_fps = min_fps
+            if max_fps is not None:
+                schedule.max_fps = max_fps
+            schedule.rate = min(max(schedule.rate, schedule.min_fps), schedule.max_fps)
+            self._apply_budget()
+    
+    def add_result_callback(self, callback: Callable):
+        """
+        Natija callback qo'shish: callback(camera_id, frame, detections).
+        
+        Faqat haqiqiy inference natijalari yuboriladi; motion gate o'tkazib
+        yuborgan kadrlar callbacklarga bormaydi.
+        """
+        self.result_callbacks.append(callback)
+    
+    def _apply_budget(self):
+        """Scale requested rates down to the CPU budget (never below min_fps)."""
+        total = sum(s.rate for s in self.schedules.values())
+        scale = 1.0
+        
+        if total > 0 and self.avg_cost > 0:
+            scale = min(1.0, self.cpu_budget / (total * self.avg_cost))
+        
+        for schedule in self.schedules.values():
+            schedule.effective_rate = max(schedule.min_fps, schedule.rate * scale)
+    
+    def update_rate(self, camera_id: int, active_tracks: int, motion: bool,
+                    now: float = None) -> float:
+        """
+        Faollik bo'yicha kamera tezligini yangilash.
+        
+        Returns:
+            Budget qo'llangan tezlik (fps)
+        """
+        now = time.time() if now is None else now
+        
+        with self._lock:
+            schedule = self.schedules.get(camera_id)
+            if schedule is None:
+                return 0.0
+            
+            if active_tracks or motion:
+                schedule.rate = schedule.max_fps
+            else:
+                elapsed = now - schedule.last_run if schedule.last_run else 0.0
+                decay = 0.5 ** (elapsed / self.idle_half_life) if self.idle_half_life else 0.0
+                schedule.rate = max(schedule.min_fps, schedule.rate * decay)
+            
+            schedule.active_tracks = active_tracks
+            schedule.motion = motion
+            schedule.last_run = now
+            
+            self._apply_budget()
+            schedule.next_due = now + 1.0 / schedule.effective_rate
+            return schedule.effective_rate
+    
+    def _active_tracks(self, camera_id: int) -> int:
+        """Kamerada yaqinda ko'rilgan aktiv tracklar soni."""
+        cutoff = datetime.now() - timedelta(seconds=self.TRACK_RECENT_SECONDS)
+        return sum(
+            1 for track in self.tracker.get_active_tracks(camera_id=camera_id)
+            if track.last_seen >= cutoff
+        )
+    
+    def _get_frame(self, camera_id: int):
+        """Tahlil uchun eng yangi kadr (sub-stream obunasidan, bo'lsa)."""
+        if self.frame_source is not None:
+            return self.frame_source(camera_id)
+        
+        from camera.stream_manager import stream_manager
+        
+        subscription = self._subscriptions.get(camera_id)
+        if subscription is None or not subscription.active:
+            # Subscribing connects synchronously; offline cameras are left to the supervisor
+            camera = stream_manager.cameras.get(camera_id)
+            if camera is None or not camera.is_connected:
+                return None
+            
+            with self._lock:
+                schedule = self.schedules.get(camera_id)
+            fps = schedule.max_fps if schedule else self.max_fps
+            subscription = stream_manager.subscribe(camera_id, 'analysis', fps=fps, queue_size=1, stream='sub')
+            if subscription is None:
+                return None
+            self._subscriptions[camera_id] = subscription
+        
+        item = subscription.get(timeout=0)
+        return item[0] if item else None
+    
+    def _unsubscribe(self, camera_id: int):
+        subscription = self._subscriptions.pop(camera_id, None)
+        if subscription is not None:
+            from camera.stream_manager import stream_manager
+            stream_manager.unsubscribe(subscription)
+    
+    def analyze(self, camera_id: int) -> Optional[List[dict]]:
+        """Kamerani bir marta tahlil qilish va tezligini yangilash."""
+        frame = self._get_frame(camera_id)
+        if frame is None:
+            self.update_rate(camera_id, 0, False)
+            return None
+        
+        started = time.time()
+        detections, inferred = self.detector.detect_gated(frame, camera_id=camera_id)
+        if inferred:
+            # Replayed detections of a gate-skipped frame would keep tracks fresh forever
+            self.tracker.update(detections, camera_id)
+        if inferred:
+            # Skipped frames cost almost nothing and would understate the budget scale
+            cost = time.time() - started
+            self.avg_cost = cost if not self.avg_cost else self.avg_cost * 0.9 + cost * 0.1
+        
+        score = motion_gate.get_score(camera_id, max_age=5.0)
+        motion = bool(score and score.triggered and not score.forced)
+        self.update_rate(camera_id, self._active_tracks(camera_id), motion)
+        
+        with self._lock:
+            schedule = self.schedules.get(camera_id)
+            if schedule is not None:
+                schedule.analyzed += 1
+        
+        if not inferred:
+            return detections
+        
+        for callback in self.result_callbacks:
+            try:
+                callback(camera_id, frame, detections)
+            except Exception as e:
+                logger.error(f"Analysis callback error: {e}")
+        
+        return detections
+    
+    def _run(self):
+        """Navbatdagi kameralarni tahlil qilish sikli."""
+        while not self._stop.is_set():
+            if self.camera_source is not None and time.time() - self._cameras_synced >= self.CAMERA_REFRESH_SECONDS:
+                self._cameras_synced = time.time()
+                try:
+                    self.sync_cameras(self.camera_source())
+                except Exception as e:
+                    logger.error(f"Analysis camera list error: {e}")
+            
+            with self._lock:
+                due = sorted(self.schedules.values(), key=lambda s: s.next_due)
+            
+            now = time.time()
+            if not due or due[0].next_due > now:
+                wait = due[0].next_due - now if due else 1.0
+                self._stop.wait(min(1.0, max(0.01, wait)))
+                continue
+            
+            try:
+                self.analyze(due[0].camera_id)
+            except Exception as e:
+                logger.error(f"Analysis error for camera {due[0].camera_id}: {e}")
+                self.update_rate(due[0].camera_id, 0, False)
+    
+    def start(self):
+        """Tahlilni fon oqimida boshlash."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        if self.detector is None:
+            from ai.detector import detector
+            self.detector = detector
+        if self.tracker is None:
+            from ai.object_tracker import object_tracker
+            self.tracker = object_tracker
+        
+        if self.camera_source is not None:
+            self._cameras_synced = time.time()
+            self.sync_cameras(self.camera_source())
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='analysis-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Analysis scheduler started ({len(self.schedules)} cameras)")
+    
+    def stop(self):
+        """Tahlilni to'xtatish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        
+        for camera_id in list(self._subscriptions):
+            self._unsubscribe(camera_id)
+    
+    def get_rates(self) -> Dict[int, dict]:
+        """Kameralar bo'yicha joriy tahlil tezligi (hisoblash qayerga ketayotganini ko'rish uchun)."""
+        with self._lock:
+            return {
+                camera_id: {
+                    'rate': round(s.rate, 3),
+                    'effective_rate': round(s.effective_rate, 3),
+                    'min_fps': s.min_fps,
+                    'max_fps': s.max_fps,
+                    'active_tracks': s.active_tracks,
+                    'motion': s.motion,
+                    'analyzed': s.analyzed,
+                }
+                for camera_id, s in self.schedules.items()
+            }
+    
+    def get_load(self) -> dict:
+        """Umumiy tahlil yuklamasi."""
+        rates = self.get_rates()
+        total_fps = sum(r['effective_rate'] for r in rates.values())
+        return {
+            'cameras': len(rates),
+            'total_fps': round(total_fps, 3),
+            'avg_cost_ms': round(self.avg_cost * 1000, 1),
+            'cpu_share': round(total_fps * self.avg_cost, 3),
+            'cpu_budget': self.cpu_budget,
+        }
+
+
+# Global instance
+analysis_scheduler = AnalysisScheduler()
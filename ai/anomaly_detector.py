@@ -11,6 +11,7 @@ from dataclasses import dataclass
 from enum import Enum
 
 from utils.logger import logger
+from ai.motion_detector import motion_gate
 
 
 class AnomalyType(Enum):
@@ -43,6 +44,8 @@ class Anomaly:
     camera_id: int = None
     bbox: tuple = None
     frame: np.ndarray = None
+    motion_score: float = None  # Motion gate bahosi (0..1)
+    clip_path: str = None  # Hodisa klipi (pre/post-roll), yozilgach qo'shiladi
 
 
 @dataclass
@@ -64,6 +67,8 @@ class AnomalyDetector:
     LOITERING_TIME_THRESHOLD = 300  # seconds (5 min)
     CROWD_THRESHOLD = 5  # number of people
     FALLING_ACCELERATION = 10.0
+    MOTION_SCORE_MAX_AGE = 5.0  # seconds
+    MOTION_HISTORY_SIZE = 1000
     
     def __init__(self):
         self.tracks: Dict[int, PersonTrack] = {}
@@ -79,8 +84,26 @@ class AnomalyDetector:
         """Alert callback qo'shish."""
         self.alert_callbacks.append(callback)
     
+    def _motion_score(self, camera_id: int = None) -> Optional[float]:
+        """Kameraning motion gate bahosi (yangi bo'lsa)."""
+        if camera_id is None:
+            return None
+        
+        motion = motion_gate.get_score(camera_id, max_age=self.MOTION_SCORE_MAX_AGE)
+        return motion.score if motion else None
+    
     def _notify_alert(self, anomaly: Anomaly):
         """Alert yuborish."""
+        if anomaly.motion_score is None:
+            anomaly.motion_score = self._motion_score(anomaly.camera_id)
+        
+        # Pre/post-roll clip from the camera's packet ring, attached and saved once written
+        if anomaly.camera_id is not None:
+            from camera.video_recorder import video_recorder
+            clip = video_recorder.capture_event_clip(anomaly.camera_id, anomaly.timestamp)
+            if clip is not None:
+                clip.add_done_callback(lambda done: self._attach_clip(anomaly, done.result()))
+        
         self.alerts.append(anomaly)
         for callback in self.alert_callbacks:
             try:
@@ -88,6 +111,21 @@ class AnomalyDetector:
             except Exception as e:
                 logger.error(f"Alert callback error: {e}")
     
+    def _attach_clip(self, anomaly: Anomaly, clip_path: Optional[str]):
+        """Yozilgan klipni anomaliyaga biriktirish va detection_events ga saqlash."""
+        anomaly.clip_path = clip_path
+        if clip_path is None:
+            return
+        
+        try:
+            from database.v2_models import v2db
+            v2db.add_detection_event(anomaly.camera_id, anomaly.type.value,
+                                     confidence=anomaly.confidence,
+                                     video_clip_path=clip_path,
+                                     description_uzbek=anomaly.description)
+        except Exception as e:
+            logger.error(f"Error saving anomaly clip: {e}")
+    
     def update_tracks(self, detections: List[dict], camera_id: int = None):
         """Kuzatuvlarni yangilash."""
         current_time = datetime.now()
@@ -321,6 +359,17 @@ class AnomalyDetector:
         
         all_anomalies.extend(self.detect_unusual_time(camera_id))
         
+        # Reuse the motion gate score instead of differencing frames again
+        motion_score = self._motion_score(camera_id)
+        if motion_score is not None:
+            self.motion_history.append((datetime.now(), camera_id, motion_score))
+            if len(self.motion_history) > self.MOTION_HISTORY_SIZE:
+                self.motion_history = self.motion_history[-self.MOTION_HISTORY_SIZE:]
+            
+            for anomaly in all_anomalies:
+                if anomaly.motion_score is None:
+                    anomaly.motion_score = motion_score
+        
         return all_anomalies
     
     def get_recent_alerts(self, hours: int = 24, 
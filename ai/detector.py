@@ -2,9 +2,11 @@
 import cv2
 import numpy as np
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from ultralytics import YOLO
-from utils.config import YOLO_MODEL, CONFIDENCE_THRESHOLD, MODELS_DIR
+from utils.config import YOLO_MODEL, CONFIDENCE_THRESHOLD, MODELS_DIR, MOTION_GATE_ENABLED
+from ai.motion_detector import motion_gate
+from utils.geometry import scale_bbox
 from utils.logger import logger
 
 class ObjectDetector:
@@ -16,6 +18,9 @@ class ObjectDetector:
         self.confidence = confidence
         self.model: Optional[YOLO] = None
         
+        # Last detections per camera, reused for frames the motion gate skips
+        self._last_detections: Dict[int, List[dict]] = {}
+        
         logger.info(f"Initializing YOLOv8 detector with model: {model_name}")
         self._load_model()
     
@@ -35,10 +40,14 @@ class ObjectDetector:
             logger.error(f"Error loading YOLO model: {e}")
             raise
     
-    def detect(self, frame: np.ndarray) -> List[dict]:
+    def detect(self, frame: np.ndarray, camera_id: int = None) -> List[dict]:
         """
         Detect objects in frame.
         
+        With ``camera_id`` the frame first goes through the camera's motion
+        gate; when nothing moved, inference is skipped and the camera's
+        previous detections are returned.
+        
         Returns:
             List of detections with format:
             {
@@ -47,9 +56,23 @@ class ObjectDetector:
                 'bbox': (x, y, w, h)
             }
         """
+        return self.detect_gated(frame, camera_id)[0]
+    
+    def detect_gated(self, frame: np.ndarray, camera_id: int = None) -> Tuple[List[dict], bool]:
+        """
+        Like detect(), also telling whether inference actually ran.
+        
+        Returns:
+            (detections, inferred); ``inferred`` is False when the motion
+            gate skipped the frame and the previous detections were replayed
+        """
         if self.model is None:
             logger.error("Model not loaded")
-            return []
+            return [], False
+        
+        if camera_id is not None and MOTION_GATE_ENABLED:
+            if not motion_gate.check(camera_id, frame).triggered:
+                return self._last_detections.get(camera_id, []), False
         
         try:
             # Run inference
@@ -81,11 +104,29 @@ class ObjectDetector:
                     
                     detections.append(detection)
             
-            return detections
+            if camera_id is not None:
+                self._last_detections[camera_id] = detections
+            
+            return detections, True
             
         except Exception as e:
             logger.error(f"Error during detection: {e}")
-            return []
+            return [], False
+    
+    def scale_detections(self, detections: List[dict], from_shape: tuple,
+                         to_shape: tuple) -> List[dict]:
+        """
+        Map detections to another resolution of the same view.
+        
+        Used to draw or crop sub-stream detections on the main-stream frame.
+        """
+        if tuple(from_shape[:2]) == tuple(to_shape[:2]):
+            return detections
+        
+        return [
+            {**det, 'bbox': scale_bbox(det['bbox'], from_shape, to_shape)}
+            for det in detections
+        ]
     
     def draw_detections(self, frame: np.ndarray, detections: List[dict]) -> np.ndarray:
         """Draw bounding boxes and labels on frame."""
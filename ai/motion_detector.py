@@ -0,0 +1,186 @@
+"""
+Motion Detection Module
+YOLO'dan oldin arzon harakat filtri (kadrlar farqi yoki MOG2).
+"""
+import cv2
+import numpy as np
+import time
+import threading
+from typing import Dict, List, Optional
+from collections import deque
+from dataclasses import dataclass
+
+from utils.config import (
+    MOTION_METHOD, MOTION_THRESHOLD, MOTION_KEYFRAME_INTERVAL, MOTION_FRAME_WIDTH
+)
+
+
+@dataclass
+class MotionScore:
+    """Bitta kadr uchun harakat bahosi."""
+    camera_id: int
+    score: float            # O'zgargan piksellar ulushi (0..1)
+    timestamp: float        # time.time()
+    triggered: bool         # Kadr detektorga uzatildimi
+    forced: bool = False    # Harakatsiz, lekin davriy majburiy kadr
+
+
+class _CameraMotion:
+    """Kamera bo'yicha filtr holati."""
+    
+    def __init__(self):
+        self.previous: Optional[np.ndarray] = None
+        self.subtractor = None
+        self.last_forwarded = 0.0
+        self.frames = 0
+        self.forwarded = 0
+        self.last_score: Optional[MotionScore] = None
+        self.history = deque(maxlen=300)
+
+
+class MotionGate:
+    """
+    Harakat filtri - har kamera uchun alohida.
+    
+    Kadr kichraytirilib kulrangga o'tkaziladi, so'ng oldingi kadrdan farqi
+    ('diff') yoki MOG2 fon modeli ('mog2') bilan o'zgargan piksellar ulushi
+    hisoblanadi. Ulush kamera chegarasidan oshsa yoki oxirgi uzatilgan
+    kadrdan beri ``keyframe_interval`` soniya o'tgan bo'lsa, kadr
+    detektorga uzatiladi. Baholar AnomalyDetector, ZoneMonitor va
+    recorder tomonidan qayta ishlatiladi.
+    """
+    
+    # Pixel brightness change counted as motion (diff method)
+    PIXEL_DELTA = 25
+    
+    def __init__(self, method: str = MOTION_METHOD, threshold: float = MOTION_THRESHOLD,
+                 keyframe_interval: float = MOTION_KEYFRAME_INTERVAL,
+                 width: int = MOTION_FRAME_WIDTH):
+        self.method = method
+        self.default_threshold = threshold
+        self.keyframe_interval = keyframe_interval
+        self.width = width
+        
+        self.thresholds: Dict[int, float] = {}
+        self._states: Dict[int, _CameraMotion] = {}
+        self._lock = threading.Lock()
+    
+    def set_threshold(self, camera_id: int, threshold: float):
+        """Kamera uchun harakat chegarasini o'rnatish."""
+        self.thresholds[camera_id] = threshold
+    
+    def get_threshold(self, camera_id: int) -> float:
+        """Kamera harakat chegarasi."""
+        return self.thresholds.get(camera_id, self.default_threshold)
+    
+    def _state(self, camera_id: int) -> _CameraMotion:
+        with self._lock:
+            state = self._states.get(camera_id)
+            if state is None:
+                state = _CameraMotion()
+                self._states[camera_id] = state
+            return state
+    
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Kichraytirilgan, xiralashtirilgan kulrang kadr."""
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, height * self.width // width)),
+                               interpolation=cv2.INTER_AREA)
+        
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+    
+    def measure(self, camera_id: int, frame: np.ndarray) -> float:
+        """O'zgargan piksellar ulushini hisoblash (kamera holatini yangilaydi)."""
+        state = self._state(camera_id)
+        gray = self._prepare(frame)
+        
+        if self.method == 'mog2':
+            if state.subtractor is None:
+                state.subtractor = cv2.createBackgroundSubtractorMOG2(
+                    history=500, varThreshold=16, detectShadows=False
+                )
+            mask = state.subtractor.apply(gray)
+            return cv2.countNonZero(mask) / mask.size
+        
+        previous = state.previous
+        state.previous = gray
+        
+        # First frame or the stream changed resolution (main/sub switch)
+        if previous is None or previous.shape != gray.shape:
+            return 1.0
+        
+        diff = cv2.absdiff(gray, previous)
+        _, changed = cv2.threshold(diff, self.PIXEL_DELTA, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) / changed.size
+    
+    def check(self, camera_id: int, frame: np.ndarray) -> MotionScore:
+        """Kadrni baholash va detektorga uzatish kerakligini aniqlash."""
+        state = self._state(camera_id)
+        now = time.time()
+        score = self.measure(camera_id, frame)
+        
+        triggered = score >= self.get_threshold(camera_id)
+        forced = not triggered and now - state.last_forwarded >= self.keyframe_interval
+        
+        result = MotionScore(
+            camera_id=camera_id,
+            score=round(score, 4),
+            timestamp=now,
+            triggered=triggered or forced,
+            forced=forced
+        )
+        
+        state.frames += 1
+        if result.triggered:
+            state.forwarded += 1
+            state.last_forwarded = now
+        state.last_score = result
+        state.history.append((now, result.score))
+        
+        return result
+    
+    def get_score(self, camera_id: int, max_age: float = None) -> Optional[MotionScore]:
+        """Kameraning oxirgi harakat bahosi (``max_age`` soniyadan eski bo'lsa None)."""
+        state = self._states.get(camera_id)
+        if state is None or state.last_score is None:
+            return None
+        
+        if max_age is not None and time.time() - state.last_score.timestamp > max_age:
+            return None
+        
+        return state.last_score
+    
+    def get_history(self, camera_id: int, seconds: float = 60) -> List[tuple]:
+        """Oxirgi ``seconds`` soniyadagi (timestamp, score) juftliklari."""
+        state = self._states.get(camera_id)
+        if state is None:
+            return []
+        
+        cutoff = time.time() - seconds
+        return [item for item in state.history if item[0] >= cutoff]
+    
+    def reset(self, camera_id: int):
+        """Kamera holatini tozalash."""
+        with self._lock:
+            self._states.pop(camera_id, None)
+    
+    def get_stats(self) -> Dict[int, dict]:
+        """Kameralar bo'yicha filtr statistikasi."""
+        stats = {}
+        
+        for camera_id, state in list(self._states.items()):
+            stats[camera_id] = {
+                'threshold': self.get_threshold(camera_id),
+                'frames': state.frames,
+                'forwarded': state.forwarded,
+                'skip_ratio': round(1 - state.forwarded / state.frames, 3) if state.frames else 0.0,
+                'last_score': state.last_score.score if state.last_score else None,
+            }
+        
+        return stats
+
+
+# Global instance
+motion_gate = MotionGate()
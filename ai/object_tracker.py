@@ -166,6 +166,9 @@ class MultiObjectTracker:
                     continue
                 if track.class_name != det_class:
                     continue
+                # Boxes of different cameras are unrelated coordinates
+                if camera_id is not None and track.camera_id != camera_id:
+                    continue
                 
                 iou = self._iou(det_bbox, track.bbox)
                 if iou > best_iou:
@@ -229,11 +232,13 @@ class MultiObjectTracker:
             np.random.randint(50, 255)
         )
     
-    def get_active_tracks(self, class_filter: str = None) -> List[Track]:
-        """Aktiv tracklarni olish."""
+    def get_active_tracks(self, class_filter: str = None, camera_id: int = None) -> List[Track]:
+        """Aktiv tracklarni olish (``camera_id`` berilsa faqat shu kameraniki)."""
         tracks = [t for t in self.tracks.values() if t.is_active]
         if class_filter:
             tracks = [t for t in tracks if t.class_name == class_filter]
+        if camera_id is not None:
+            tracks = [t for t in tracks if t.camera_id == camera_id]
         return tracks
     
     def get_track_by_id(self, track_id: int) -> Optional[Track]:
@@ -12,6 +12,7 @@ import json
 import os
 
 from utils.logger import logger
+from ai.motion_detector import motion_gate
 
 
 class ZoneType(Enum):
@@ -119,6 +120,7 @@ class ZoneEvent:
     timestamp: datetime
     object_info: dict = field(default_factory=dict)
     screenshot_path: str = None
+    clip_path: str = None  # Hodisa klipi (pre/post-roll), yozilgach qo'shiladi
 
 
 class ZoneMonitor:
@@ -297,6 +299,18 @@ class ZoneMonitor:
             description=description,
             timestamp=datetime.now()
         )
+        
+        # Motion gate score of the zone's camera
+        motion = motion_gate.get_score(zone.camera_id, max_age=5.0)
+        if motion is not None:
+            event.object_info['motion_score'] = motion.score
+        
+        # Pre/post-roll clip from the camera's packet ring, attached and saved once written
+        from camera.video_recorder import video_recorder
+        clip = video_recorder.capture_event_clip(zone.camera_id, event.timestamp)
+        if clip is not None:
+            clip.add_done_callback(lambda done: self._attach_clip(event, zone.camera_id, done.result()))
+        
         self.events.append(event)
         self.next_event_id += 1
         
@@ -306,6 +320,21 @@ class ZoneMonitor:
         
         return event
     
+    def _attach_clip(self, event: ZoneEvent, camera_id: int, clip_path: Optional[str]):
+        """Yozilgan klipni hodisaga biriktirish va detection_events ga saqlash."""
+        event.clip_path = clip_path
+        if clip_path is None:
+            return
+        
+        try:
+            from database.v2_models import v2db
+            v2db.add_detection_event(camera_id, event.alert_type.value,
+                                     video_clip_path=clip_path,
+                                     screenshot_path=event.screenshot_path,
+                                     description_uzbek=event.description)
+        except Exception as e:
+            logger.error(f"Error saving zone event clip: {e}")
+    
     def process_frame(self, frame: np.ndarray, camera_id: int,
                       detections: List[dict]) -> Tuple[np.ndarray, List[ZoneEvent]]:
         """Frame'ni qayta ishlash va hududlarni tekshirish."""
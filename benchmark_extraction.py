@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark archive frame extraction: serial iter_frames() vs the process pool."""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from camera.frame_extractor import frame_extractor
+from utils.config import ARCHIVE_WORKER_FRAME_WIDTH, EXTRACT_WORKERS
+
+
+def run(label, frames):
+    """Consume a frame iterator and print its throughput."""
+    started = time.perf_counter()
+    count = sum(1 for _ in frames)
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    print(f"{label:<22} {count:>6} frames  {elapsed:>7.2f} s  {rate:>8.1f} frames/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('camera_id', type=int)
+    parser.add_argument('start', help="Range start, e.g. 2024-05-01T10:00")
+    parser.add_argument('--hours', type=float, default=1.0, help="Range length (default 1)")
+    parser.add_argument('--interval', type=float, default=2.0, help="Seconds between samples (default 2)")
+    parser.add_argument('--width', type=int, default=ARCHIVE_WORKER_FRAME_WIDTH,
+                        help="Frame width returned (0 = full size)")
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({2, EXTRACT_WORKERS}),
+                        help="Worker counts to try")
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start)
+    end = start + timedelta(hours=args.hours)
+
+    print(f"Camera {args.camera_id}, {start} - {end}, every {args.interval}s, width {args.width or 'full'}")
+
+    serial = run("serial", frame_extractor.iter_frames(
+        args.camera_id, start, end, args.interval, resize=args.width))
+
+    for workers in args.workers:
+        rate = run(f"parallel ({workers} workers)", frame_extractor.iter_frames_parallel(
+            args.camera_id, start, end, args.interval, resize=args.width, workers=workers))
+        if serial:
+            print(f"{'':<22} x{rate / serial:.2f} vs serial")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,10 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from database.models import db
 from camera.stream_manager import stream_manager
+from camera.snapshot_cache import snapshot_cache
 from utils.logger import logger
 from utils.messages import msg
 from ai.gemini_ai import gemini_ai
-import cv2
 import io
 import os
 
@@ -239,31 +239,24 @@ class AISearchHandler:
             camera_name = camera['name']
             
             try:
-                # Get camera client with proper connection
-                cam_client = stream_manager.get_or_connect_camera(camera_id)
+                # Get camera client; reconnects are left to the supervisor
+                cam_client = await stream_manager.wait_for_camera(camera_id)
                 
-                if cam_client is None or not cam_client.is_connected:
-                    logger.warning(f"Camera {camera_name} not available for AI search")
-                    continue
-                
-                # Capture frame
-                frame = cam_client.get_frame()
-                
-                if frame is None:
-                    # Try reconnect
-                    cam_client.reconnect()
-                    frame = cam_client.get_frame()
-                
-                if frame is None:
+                if cam_client is None:
+                    logger.warning(
+                        f"Camera {camera_name} not available for AI search "
+                        f"(state: {stream_manager.get_camera_state(camera_id)})"
+                    )
                     continue
                 
-                # Encode to JPEG
-                success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                # Shared pre-encoded snapshot
+                snapshot = await snapshot_cache.get_async(camera_id)
                 
-                if not success:
+                if snapshot is None:
+                    stream_manager.report_frame_failure(camera_id)
                     continue
                 
-                image_data = buffer.tobytes()
+                image_data = snapshot.jpeg
                 
                 # Analyze with AI
                 analysis = gemini_ai.analyze_image(image_data, search_query)
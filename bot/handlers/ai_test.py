@@ -1,10 +1,12 @@
 """AI detection test handler."""
+import asyncio
 import io
 import cv2
 from telegram import Update
 from telegram.ext import ContextTypes
 from database.models import db
 from camera.stream_manager import stream_manager
+from camera.snapshot_cache import snapshot_cache
 from ai.detector import detector
 from utils.logger import logger
 
@@ -33,24 +35,23 @@ class AITestHandler:
             stream_manager.load_cameras_from_db()
         
         for cam_data in cameras:
-            camera = stream_manager.get_camera(cam_data['id'])
-            
-            if not camera:
+            if not stream_manager.get_camera(cam_data['id']):
                 continue
             
-            # Connect if not connected
-            if not camera.is_connected:
-                success = camera.connect()
-                if not success:
-                    await update.message.reply_text(
-                        f"❌ '{cam_data['name']}' kamerasiga ulanib bo'lmadi"
-                    )
-                    continue
+            # Wait for the supervisor's connection without blocking the bot
+            camera = await stream_manager.wait_for_camera(cam_data['id'])
+            if camera is None:
+                await update.message.reply_text(
+                    f"❌ '{cam_data['name']}' kamerasiga ulanib bo'lmadi"
+                )
+                continue
             
-            # Get frame from camera
-            frame = camera.get_frame()
+            # Get frame from the shared snapshot cache
+            snapshot = await snapshot_cache.get_async(cam_data['id'])
+            frame = snapshot.frame if snapshot else None
             
             if frame is None:
+                stream_manager.report_frame_failure(cam_data['id'])
                 await update.message.reply_text(
                     f"❌ '{cam_data['name']}' kamerasidan kadr olib bo'lmadi"
                 )
@@ -58,7 +59,12 @@ class AITestHandler:
             
             # Run detection
             try:
-                detections = detector.detect(frame)
+                # Detect on the low-resolution sub-stream, draw on the main frame
+                analytics_frame = await asyncio.to_thread(camera.get_analytics_frame)
+                if analytics_frame is None:
+                    analytics_frame = frame
+                detections = detector.detect(analytics_frame)
+                detections = detector.scale_detections(detections, analytics_frame.shape, frame.shape)
                 
                 # Draw detections on frame
                 annotated_frame = detector.draw_detections(frame, detections)
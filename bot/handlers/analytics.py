@@ -37,17 +37,8 @@ class AnalyticsHandler:
         recent_detections = db.get_recent_detections(limit=10)
         detection_count = len(recent_detections)
         
-        # Calculate storage usage
-        storage_mb = 0
-        try:
-            from utils.config import CACHE_DIR
-            recordings_dir = CACHE_DIR / 'recordings'
-            if recordings_dir.exists():
-                for f in recordings_dir.iterdir():
-                    if f.is_file():
-                        storage_mb += f.stat().st_size / (1024 * 1024)
-        except:
-            pass
+        # Storage usage (running total of the recorder's storage ledger)
+        storage_mb = video_recorder.get_storage_stats(user_org_id)['total_size_mb']
         
         keyboard = [
             [InlineKeyboardButton("📹 Kameralar statistikasi", callback_data="stats_cameras")],
@@ -151,41 +142,27 @@ class AnalyticsHandler:
         query = update.callback_query
         await query.answer()
         
-        storage_info = {
-            'total_mb': 0,
-            'video_count': 0,
-            'oldest': None,
-            'newest': None
-        }
-        
-        try:
-            from utils.config import CACHE_DIR
-            recordings_dir = CACHE_DIR / 'recordings'
-            if recordings_dir.exists():
-                files = list(recordings_dir.glob('*.mp4'))
-                storage_info['video_count'] = len(files)
-                
-                for f in files:
-                    storage_info['total_mb'] += f.stat().st_size / (1024 * 1024)
-                
-                if files:
-                    sorted_files = sorted(files, key=lambda x: x.stat().st_mtime)
-                    oldest_time = datetime.fromtimestamp(sorted_files[0].stat().st_mtime)
-                    newest_time = datetime.fromtimestamp(sorted_files[-1].stat().st_mtime)
-                    storage_info['oldest'] = oldest_time.strftime('%Y-%m-%d %H:%M')
-                    storage_info['newest'] = newest_time.strftime('%Y-%m-%d %H:%M')
-        except Exception as e:
-            logger.error(f"Error getting storage stats: {e}")
+        user = db.get_user(update.effective_user.id)
+        
+        # Running totals of the recorder's storage ledger, no filesystem walk
+        stats = video_recorder.get_storage_stats((user or {}).get('organization_id'))
+        oldest = stats['oldest'].strftime('%Y-%m-%d %H:%M') if stats['oldest'] else 'N/A'
+        newest = stats['newest'].strftime('%Y-%m-%d %H:%M') if stats['newest'] else 'N/A'
+        quota = f"{stats['quota_gb']:.0f} GB" if stats['quota_gb'] else "cheklanmagan"
+        clip_cache = f"🗂️ Klip keshi: {stats['clip_cache_mb']:.1f} MB\n" if stats['clip_cache_mb'] is not None else ""
         
         message = (
             "💾 **SAQLASH HOLATI**\n\n"
-            f"📂 Video fayllar: {storage_info['video_count']} ta\n"
-            f"📦 Hajmi: {storage_info['total_mb']:.1f} MB\n"
-            f"📅 Eng eski: {storage_info['oldest'] or 'N/A'}\n"
-            f"📅 Eng Jana: {storage_info['newest'] or 'N/A'}\n\n"
+            f"📂 Video fayllar: {stats['segment_count']} ta\n"
+            f"📦 Hajmi: {stats['total_size_mb']:.1f} MB\n"
+            f"📊 Kvota: {quota}\n"
+            f"🎬 Hodisa kliplari: {stats['event_clips_mb']:.1f} MB\n"
+            f"{clip_cache}"
+            f"📅 Eng eski: {oldest}\n"
+            f"📅 Eng Jana: {newest}\n\n"
             f"━━━━━━━━━━━━━━━━━━━━━━\n\n"
             f"🗑️ Tozalash: /cleanup_archives\n"
-            f"⚙️ Saqlash muddati: 30 kun"
+            f"⚙️ Saqlash muddati: {stats['retention_days']} kun"
         )
         
         keyboard = [[InlineKeyboardButton("« Orqaga", callback_data="menu_analytics")]]
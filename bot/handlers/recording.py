@@ -4,6 +4,14 @@ from telegram.ext import ContextTypes
 from database.models import db
 from camera.video_recorder import video_recorder
 from utils.logger import logger
+from utils.config import ARCHIVE_RETENTION_DAYS
+
+# Recording policy names shown to users
+POLICY_LABELS = {
+    'continuous': "uzluksiz",
+    'motion': "faqat harakatda",
+    'scheduled': "jadval bo'yicha",
+}
 
 class RecordingHandler:
     """Handle video recording management."""
@@ -33,7 +41,7 @@ class RecordingHandler:
             f"✅ Barcha kameralarda yozuv boshlandi!\n\n"
             f"📊 Yozuvlar:\n"
             f"- Davomiyligi: 10 daqiqalik segmentlar\n"
-            f"- Saqlash: 30 kun\n"
+            f"- Saqlash: {ARCHIVE_RETENTION_DAYS} kun\n"
             f"- To'xtatish: /stop_recording"
         )
     
@@ -60,8 +68,9 @@ class RecordingHandler:
             is_recording = video_recorder.is_recording.get(camera['id'], False)
             status_icon = "🔴" if is_recording else "⚫️"
             status_text = "Yozilmoqda" if is_recording else "To'xtagan"
+            policy = POLICY_LABELS.get(camera.get('recording_policy') or 'continuous', '')
             
-            message += f"{status_icon} **{camera['name']}**: {status_text}\n"
+            message += f"{status_icon} **{camera['name']}**: {status_text} ({policy})\n"
         
         message += (
             f"\n💾 Arxiv: `recordings/` papkada\n"
@@ -12,6 +12,21 @@ from utils.messages import msg
 EDIT_NAME = 100
 EDIT_PHONE = 101
 
+# Archive quality codes (organizations.archive_quality) and their labels
+QUALITY_LABELS = {'1080': 'HD 1080p', '720': 'SD 720p', '480': 'Low 480p'}
+
+
+def _archive_quality(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Label of the archive quality aging segments are compacted to (HD 1080p: none, kept as recorded)."""
+    user = db.get_user(update.effective_user.id)
+    org_id = (user or {}).get('organization_id')
+    organization = db.get_organization(org_id) if org_id is not None else None
+    
+    quality = (organization or {}).get('archive_quality')
+    if quality in QUALITY_LABELS:
+        return QUALITY_LABELS[quality]
+    return context.user_data.get('archive_quality') or 'HD 1080p'
+
 
 class SettingsHandler:
     """Handle user settings with premium UI."""
@@ -356,7 +371,7 @@ class SettingsHandler:
         
         # Get retention from context or default
         retention = context.user_data.get('archive_retention', 30)
-        quality = context.user_data.get('archive_quality', 'HD 1080p')
+        quality = _archive_quality(update, context)
         
         text = (
             "━━━━━━━━━━━━\n"
@@ -429,7 +444,7 @@ class SettingsHandler:
         query = update.callback_query
         await query.answer()
         
-        current = context.user_data.get('archive_quality', 'HD 1080p')
+        current = _archive_quality(update, context)
         
         text = (
             "━━━━━━━━━━━━\n"
@@ -454,9 +469,15 @@ class SettingsHandler:
         query = update.callback_query
         await query.answer("✅ Saqlandı!")
         
-        quality_map = {'1080': 'HD 1080p', '720': 'SD 720p', '480': 'Low 480p'}
         quality_code = query.data.replace('quality_', '')
-        context.user_data['archive_quality'] = quality_map.get(quality_code, 'HD 1080p')
+        if quality_code not in QUALITY_LABELS:
+            quality_code = '1080'
+        context.user_data['archive_quality'] = QUALITY_LABELS[quality_code]
+        
+        # Stored on the organization, the archive compactor re-encodes aging segments to it
+        user = db.get_user(update.effective_user.id)
+        if user and user.get('organization_id') is not None:
+            db.update_archive_quality(user['organization_id'], quality_code)
         
         await SettingsHandler.show_archive(update, context)
     
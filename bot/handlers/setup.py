@@ -1,8 +1,9 @@
 """Setup handler for camera configuration via Telegram bot."""
+import asyncio
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 from database.models import db
-from camera.rtsp_client import detect_camera_type
+from camera.rtsp_client import detect_camera
 from camera.stream_manager import stream_manager
 from utils.logger import logger
 from utils.config import get_rtsp_url
@@ -188,8 +189,11 @@ class SetupHandler:
         port = context.user_data['camera_port']
         username = context.user_data['camera_username']
         
-        # Detect camera type
-        camera_type = detect_camera_type(ip, username, password)
+        # Detect camera type and port (probes run off the event loop)
+        detected = await asyncio.to_thread(detect_camera, ip, username, password, port)
+        camera_type = 'generic'
+        if detected:
+            camera_type, port = detected
         
         # Generate RTSP URL
         rtsp_url = get_rtsp_url(camera_type, ip, port, username, password)
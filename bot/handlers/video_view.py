@@ -7,11 +7,12 @@ from telegram.ext import ContextTypes, ConversationHandler
 from datetime import datetime, timedelta
 from database.models import db
 from camera.stream_manager import stream_manager
+from camera.snapshot_cache import snapshot_cache
 from utils.logger import logger
 from utils.access_control import access_control, time_helper
+import asyncio
 import io
 import os
-import cv2
 
 # Conversation states
 TIME_RANGE_INPUT = 1
@@ -72,6 +73,9 @@ class VideoViewHandler:
                 "━━━━━━━━━━━━"
             )
             
+            # Reopen idle streams while the user picks a camera
+            stream_manager.prefetch([cam['id'] for cam in cameras])
+            
             keyboard = []
             for cam in cameras:
                 status_icon = "🟢" if cam.get('status') == 'active' else "🔴"
@@ -109,16 +113,10 @@ class VideoViewHandler:
         )
         
         try:
-            # Get or create camera connection
-            cam_client = stream_manager.get_or_connect_camera(camera_id)
+            # Connection is owned by the supervisor; wait without blocking other users
+            cam_client = await stream_manager.wait_for_camera(camera_id)
             
             if cam_client is None:
-                # Camera not in manager, try to add and connect
-                cam_client = stream_manager.add_camera(camera_id)
-                if cam_client:
-                    cam_client.connect()
-            
-            if cam_client is None or not cam_client.is_connected:
                 text = (
                     f"━━━━━━━━━━━━\n"
                     f"   ❌ ULANISH XATOSI       \n"
@@ -141,32 +139,20 @@ class VideoViewHandler:
                 await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
                 return
             
-            # Capture frame
-            frame = cam_client.get_frame()
-            
-            if frame is None:
-                # Try to reconnect and capture again
-                cam_client.reconnect()
-                frame = cam_client.get_frame()
+            # Shared pre-encoded snapshot (one decode + encode per camera per second)
+            snapshot = await snapshot_cache.get_async(camera_id)
             
-            if frame is None:
+            if snapshot is None:
+                # Supervisor reconnects in the background
+                stream_manager.report_frame_failure(camera_id)
                 raise Exception("Kameradan rasm olib bo'lmadi")
             
-            # Encode frame to JPEG
-            success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            
-            if not success:
-                raise Exception("Rasm kodlash xatosi")
-            
             # Send photo
-            photo_bytes = io.BytesIO(buffer.tobytes())
+            photo_bytes = io.BytesIO(snapshot.jpeg)
             photo_bytes.name = f"{camera['name']}_snapshot.jpg"
             
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Get camera info
-            cam_info = cam_client.get_info()
-            resolution = f"{cam_info.get('width', '?')}x{cam_info.get('height', '?')}"
+            timestamp = datetime.fromtimestamp(snapshot.captured_at).strftime('%Y-%m-%d %H:%M:%S')
+            resolution = f"{snapshot.width}x{snapshot.height}"
             
             caption = (
                 f"📹 {camera['name']}\n"
@@ -181,9 +167,6 @@ class VideoViewHandler:
                 caption=caption
             )
             
-            # Update camera status to active
-            db.update_camera_status(camera_id, 'active')
-            
             # Show success with refresh button
             text = (
                 f"━━━━━━━━━━━━\n"
@@ -205,9 +188,6 @@ class VideoViewHandler:
         except Exception as e:
             logger.error(f"Realtime capture error: {e}")
             
-            # Update camera status to inactive
-            db.update_camera_status(camera_id, 'inactive')
-            
             text = (
                 f"━━━━━━━━━━━━\n"
                 f"   ❌ XATOLIK              \n"
@@ -325,32 +305,57 @@ class VideoViewHandler:
     
     @staticmethod
     async def extract_archive_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Extract and send video from archive."""
+        """Extract and send video from archive (archive_exact_<id>: cut on the exact frame)."""
         query = update.callback_query
         await query.answer()
         
         camera_id = int(query.data.split('_')[-1])
         camera = db.get_camera(camera_id)
+        accurate = query.data.startswith('archive_exact_')
         
         start_time = context.user_data.get('archive_start')
         end_time = context.user_data.get('archive_end')
         label = context.user_data.get('archive_label', '')
         
+        def processing_text(status: str) -> str:
+            return (
+                f"━━━━━━━━━━━━\n"
+                f"   ⏳ TAYYORLANMOQDA       \n"
+                f"━━━━━━━━━━━━\n\n"
+                f"📹 {camera['name']}\n"
+                f"📅 {label}\n\n"
+                f"⏳ {status}"
+            )
+        
         # Show processing message
-        await query.edit_message_text(
-            f"━━━━━━━━━━━━\n"
-            f"   ⏳ TAYYORLANMOQDA       \n"
-            f"━━━━━━━━━━━━\n\n"
-            f"📹 {camera['name']}\n"
-            f"📅 {label}\n\n"
-            f"⏳ Video qayta ishlanmoqda..."
-        )
+        await query.edit_message_text(processing_text("Video qayta ishlanmoqda..."))
+        
+        async def report_progress(fraction: float):
+            try:
+                await query.edit_message_text(processing_text(f"Video qayta ishlanmoqda... {fraction:.0%}"))
+            except Exception:
+                pass  # unchanged text or message already gone
         
         try:
             # Try to extract video from archive
             from camera.video_recorder import video_recorder
             
-            video_path = video_recorder.extract_clip(camera_id, start_time, end_time)
+            # Runs as its own task so navigating away can cancel it (cancel_pending_clip)
+            VideoViewHandler._cancel_clip_task(context)
+            task = asyncio.create_task(
+                video_recorder.extract_clip_async(camera_id, start_time, end_time,
+                                                  progress=report_progress, accurate=accurate)
+            )
+            context.user_data['clip_task'] = task
+            
+            try:
+                video_path = await task
+            except asyncio.CancelledError:
+                logger.info(f"Archive clip for camera {camera_id} cancelled")
+                return
+            finally:
+                if context.user_data.get('clip_task') is task:
+                    context.user_data.pop('clip_task', None)
             
             if video_path and os.path.exists(video_path):
                 # Send video
@@ -369,6 +374,17 @@ class VideoViewHandler:
                     f"📹 {camera['name']}\n"
                     f"📅 {label}"
                 )
+            elif await asyncio.to_thread(video_recorder.find_segment_records, camera_id, start_time, end_time):
+                # Footage exists but cutting it failed - never send the wrong video instead
+                text = (
+                    f"━━━━━━━━━━━━\n"
+                    f"   ❌ VIDEO TAYYORLANMADI  \n"
+                    f"━━━━━━━━━━━━\n\n"
+                    f"📹 {camera['name']}\n"
+                    f"📅 {label}\n\n"
+                    f"Arxivdan videoni kesib bo'lmadi.\n"
+                    f"Birozdan so'ng qayta urinib ko'ring."
+                )
             else:
                 text = (
                     f"━━━━━━━━━━━━\n"
@@ -385,6 +401,9 @@ class VideoViewHandler:
                 [InlineKeyboardButton("📅 Boshqa Vaqt", callback_data="view_archive")],
                 [InlineKeyboardButton("« Bas Menyu", callback_data="menu_main")]
             ]
+            if video_path and not accurate:
+                # Clips start at the keyframe before the requested time; offer the exact cut
+                keyboard.insert(0, [InlineKeyboardButton("🎯 Aniq kesish", callback_data=f"archive_exact_{camera_id}")])
             
             await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
             
@@ -399,6 +418,22 @@ class VideoViewHandler:
             keyboard = [[InlineKeyboardButton("« Orqaga", callback_data="view_archive")]]
             await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
+    @staticmethod
+    def _cancel_clip_task(context: ContextTypes.DEFAULT_TYPE):
+        """Cancel the user's clip extraction that is still running."""
+        task = context.user_data.pop('clip_task', None)
+        if task is not None and not task.done():
+            task.cancel()
+    
+    @staticmethod
+    async def cancel_pending_clip(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Any other button while a clip is being prepared means the user moved on."""
+        if context.user_data is None or not update.callback_query:
+            return
+        
+        if not (update.callback_query.data or '').startswith(('archive_cam_', 'archive_exact_')):
+            VideoViewHandler._cancel_clip_task(context)
+    
     @staticmethod
     async def show_bookmarks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show saved bookmarks from database."""
@@ -10,7 +10,7 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
-from utils.config import BOT_TOKEN
+from utils.config import BOT_TOKEN, ANALYSIS_ENABLED, COMPACTION_ENABLED
 from utils.logger import logger
 
 # Import handlers
@@ -44,6 +44,7 @@ from bot.handlers.analytics import AnalyticsHandler
 
 # Import utilities
 from camera.stream_manager import stream_manager
+from camera.snapshot_cache import snapshot_cache
 
 
 def main():
@@ -200,6 +201,9 @@ def main():
     # ADD HANDLERS (Order matters!)
     # =====================================================
     
+    # Any button press first cancels a clip the user is no longer waiting for
+    application.add_handler(CallbackQueryHandler(VideoViewHandler.cancel_pending_clip), group=-1)
+    
     # Conversation handlers first
     application.add_handler(registration_conv)
     application.add_handler(camera_wizard_conv)
@@ -239,7 +243,8 @@ def main():
     ))
     application.add_handler(CallbackQueryHandler(
         VideoViewHandler.extract_archive_video,
-        pattern='^archive_cam_\\d+$'
+        pattern='^archive_(cam|exact)_\\d+$',
+        block=False  # clip extraction must not hold up other users' updates
     ))
     application.add_handler(CallbackQueryHandler(
         VideoViewHandler.show_bookmarks,
@@ -532,13 +537,46 @@ def main():
     # STARTUP
     # =====================================================
     
-    # Load existing cameras
+    # Load existing cameras; the supervisor connects and reconnects them in the background
     try:
         stream_manager.load_cameras_from_db()
+        stream_manager.start_supervisor()
+        snapshot_cache.start_refresh()
         logger.info("✅ Cameras loaded from database")
     except Exception as e:
         logger.warning(f"Could not load cameras: {e}")
     
+    # Register segments recorded while the bot was down, drop records of deleted files, apply retention
+    try:
+        from camera.video_recorder import video_recorder
+        video_recorder.reconcile_catalog_in_background()
+    except Exception as e:
+        logger.warning(f"Could not reconcile video archive: {e}")
+    
+    # Re-encode aging segments to the organization's archive quality in niced background processes
+    if COMPACTION_ENABLED:
+        try:
+            from camera.video_recorder import video_recorder
+            video_recorder.start_compaction()
+        except Exception as e:
+            logger.warning(f"Could not start archive compaction: {e}")
+    
+    # Live analysis at an activity-driven rate per camera
+    if ANALYSIS_ENABLED:
+        try:
+            from ai.analysis_scheduler import analysis_scheduler
+            from ai.anomaly_detector import anomaly_detector
+            from database.models import db
+            
+            # Re-read while running, so cameras added later are analysed too
+            analysis_scheduler.camera_source = lambda: [camera['id'] for camera in db.get_all_cameras()]
+            analysis_scheduler.add_result_callback(
+                lambda camera_id, frame, detections: anomaly_detector.analyze_frame(detections, camera_id)
+            )
+            analysis_scheduler.start()
+        except Exception as e:
+            logger.warning(f"Could not start live analysis: {e}")
+    
     # Start bot
     logger.info("✅ Bot started successfully!")
     logger.info("📱 Telegram'da /start buyrug'ini yuboring")
@@ -0,0 +1,286 @@
+"""
+Background compaction of aging archive segments.
+
+Recent video stays as the camera sent it. Once a segment is older than
+COMPACTION_AFTER_DAYS it is re-encoded to its organization's archive
+quality (a lower resolution and bitrate), which keeps several times more
+history in the same disk space. Re-encodes are lossy, so only organizations
+that chose an archive quality are compacted. Encodes run in a small pool of
+niced ffmpeg processes held to a CPU budget, and the result replaces the
+original file atomically before the catalog and the storage ledger are
+updated.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from camera.keyframe_index import build_index
+from camera.storage_ledger import StorageLedger
+from utils.logger import logger
+from utils.config import (
+    FFMPEG_BINARY, COMPACTION_AFTER_DAYS, COMPACTION_WORKERS,
+    COMPACTION_CPU_BUDGET, COMPACTION_NICE, COMPACTION_INTERVAL
+)
+
+# Archive quality -> (maximum height, video bitrate in kbit/s)
+QUALITY_TIERS = {
+    '1080': (1080, 2000),
+    '720': (720, 1000),
+    '480': (480, 500),
+}
+
+# Segments already this close to a tier's bitrate (and not taller) are kept as they are
+KEEP_BITRATE_MARGIN = 1.1
+
+# Keyframe spacing of compacted segments, so archive seeks stay cheap
+COMPACTED_KEYFRAME_INTERVAL = 2  # seconds
+
+FAILED_TIER = 'failed'  # marked so a segment ffmpeg cannot read is not retried every pass
+TMP_MARKER = '.compact-'
+
+
+class ArchiveCompactor:
+    """
+    Re-encodes aging segments to their organization's archive quality.
+    
+    Each pass takes the oldest uncompacted segments past the age limit from
+    the catalog, of cameras whose organization set ``archive_quality``. A
+    segment already at or below its tier's height and bitrate, or one whose
+    re-encode would not be smaller, only gets its ``tier`` set. Otherwise
+    the new file is written next to the original and swapped in with
+    os.replace() while holding the retention lock, so a segment retention is
+    deleting is never brought back.
+    
+    ffmpeg runs under ``nice`` (and idle-class ``ionice`` where available).
+    After each encode a worker rests until its CPU time averages out to its
+    share of ``cpu_budget`` cores.
+    """
+    
+    def __init__(self, storage: StorageLedger, lock: threading.Lock,
+                 probe: Callable[[str], Dict],
+                 after_days: float = COMPACTION_AFTER_DAYS,
+                 workers: int = COMPACTION_WORKERS,
+                 cpu_budget: float = COMPACTION_CPU_BUDGET,
+                 niceness: int = COMPACTION_NICE):
+        self.storage = storage
+        self.lock = lock  # the recorder's retention lock
+        self.probe = probe
+        self.after_days = after_days
+        self.workers = max(1, workers)
+        self.cpu_budget = cpu_budget
+        self.niceness = niceness
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._processes: Dict[int, subprocess.Popen] = {}
+        self._processes_lock = threading.Lock()
+        
+        self.compacted = 0
+        self.kept = 0
+        self.failed = 0
+        self.saved_bytes = 0
+    
+    def start(self, interval: float = COMPACTION_INTERVAL):
+        """Run a pass now and then every ``interval`` seconds in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"Archive compaction pass failed: {e}")
+                self._stop.wait(interval)
+        
+        self._thread = threading.Thread(target=run, name='archive-compactor', daemon=True)
+        self._thread.start()
+        logger.info(f"Archive compaction started (after {self.after_days:g} days, "
+                    f"{self.workers} workers, {self.cpu_budget:g} CPU)")
+    
+    def stop(self):
+        """Stop after the current encodes are killed (their originals stay untouched)."""
+        self._stop.set()
+        with self._processes_lock:
+            for process in self._processes.values():
+                process.kill()
+    
+    def run_once(self, limit: int = None) -> Dict[str, int]:
+        """
+        Compact the segments that are due (at most ``limit``).
+        
+        Returns:
+            {'compacted': n, 'kept': n, 'failed': n}
+        """
+        from database.v2_models import v2db
+        
+        cutoff = datetime.now() - timedelta(days=self.after_days)
+        result = {'compacted': 0, 'kept': 0, 'failed': 0}
+        
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='compactor') as pool:
+            while not self._stop.is_set():
+                remaining = None if limit is None else limit - sum(result.values())
+                if remaining is not None and remaining <= 0:
+                    break
+                
+                rows = v2db.get_compaction_candidates(cutoff, list(QUALITY_TIERS),
+                                                      limit=self.workers * 4)[:remaining]
+                if not rows:
+                    break
+                
+                for outcome in pool.map(self.compact_segment, rows):
+                    result[outcome] += 1
+        
+        if any(result.values()):
+            logger.info(f"Archive compaction: {result['compacted']} compacted, {result['kept']} kept, "
+                        f"{result['failed']} failed, {self.saved_bytes / (1024 ** 3):.2f} GB saved in total")
+        return result
+    
+    def compact_segment(self, row: Dict) -> str:
+        """Compact one candidate segment to its ``archive_quality``: 'compacted', 'kept' or 'failed'."""
+        from database.v2_models import v2db
+        
+        path = row['file_path']
+        quality = row['archive_quality']
+        height, kbps = QUALITY_TIERS[quality]
+        old_size = int(round((row['size_mb'] or 0) * 1024 * 1024))
+        
+        if not os.path.exists(path):
+            v2db.update_segment_tier(row['id'], FAILED_TIER)
+            self.failed += 1
+            return 'failed'
+        
+        duration = row['duration_seconds'] or 0
+        source_kbps = old_size * 8 / 1000 / duration if duration else float('inf')
+        if row['height'] and row['height'] <= height and source_kbps <= kbps * KEEP_BITRATE_MARGIN:
+            v2db.update_segment_tier(row['id'], quality)
+            self.kept += 1
+            return 'kept'
+        
+        tmp_path = f"{path[:-4]}{TMP_MARKER}{uuid.uuid4().hex[:8]}.mp4"
+        try:
+            started = time.monotonic()
+            ok, cpu_seconds = self._encode(path, tmp_path, height, kbps)
+            self._throttle(cpu_seconds, time.monotonic() - started)
+            
+            if self._stop.is_set():
+                return 'failed'  # interrupted, retried next time
+            
+            probe = self.probe(tmp_path) if ok else {}
+            if not probe.get('frame_count'):
+                v2db.update_segment_tier(row['id'], FAILED_TIER)
+                self.failed += 1
+                return 'failed'
+            
+            new_size = os.path.getsize(tmp_path)
+            if new_size >= old_size:
+                v2db.update_segment_tier(row['id'], quality)
+                self.kept += 1
+                return 'kept'
+            
+            with self.lock:
+                if v2db.get_archive_size(path) is None or not os.path.exists(path):
+                    return 'failed'  # deleted by retention meanwhile
+                
+                os.replace(tmp_path, path)
+                v2db.update_segment_tier(row['id'], quality, size_mb=new_size / (1024 * 1024),
+                                         frame_count=probe.get('frame_count'), codec=probe.get('codec'),
+                                         width=probe.get('width'), height=probe.get('height'))
+                self.storage.add(row['camera_id'], datetime.fromisoformat(row['start_time']),
+                                 new_size, previous_size=old_size)
+            
+            # Keyframes moved; the old sidecar is stale by mtime, replace it now
+            build_index(path)
+            
+            self.compacted += 1
+            self.saved_bytes += old_size - new_size
+            logger.debug(f"Compacted {path} to {quality}p: {old_size / 1024 ** 2:.1f} -> "
+                         f"{new_size / 1024 ** 2:.1f} MB")
+            return 'compacted'
+        except Exception as e:
+            logger.error(f"Error compacting {path}: {e}")
+            v2db.update_segment_tier(row['id'], FAILED_TIER)
+            self.failed += 1
+            return 'failed'
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _command(self, source: str, output: str, height: int, kbps: int) -> List[str]:
+        """Niced ffmpeg command re-encoding ``source`` to at most ``height`` lines at ``kbps``."""
+        threads = max(1, int(self.cpu_budget / self.workers))
+        command = [
+            FFMPEG_BINARY, '-v', 'error', '-y', '-i', source,
+            '-map', '0:v:0', '-map', '0:a?',
+            '-vf', f"scale=-2:'min({height},ih)'",
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+            '-b:v', f'{kbps}k', '-maxrate', f'{kbps}k', '-bufsize', f'{kbps * 2}k',
+            '-force_key_frames', f'expr:gte(t,n_forced*{COMPACTED_KEYFRAME_INTERVAL})',
+            '-threads', str(threads),
+            '-c:a', 'copy', '-movflags', '+faststart', output
+        ]
+        
+        if shutil.which('ionice'):
+            command = ['ionice', '-c', '3'] + command
+        if shutil.which('nice'):
+            command = ['nice', '-n', str(self.niceness)] + command
+        return command
+    
+    def _encode(self, source: str, output: str, height: int, kbps: int) -> tuple:
+        """Run the encode; (succeeded, CPU seconds it used)."""
+        command = self._command(source, output, height, kbps)
+        
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL, stderr=stderr)
+            with self._processes_lock:
+                self._processes[process.pid] = process
+            
+            try:
+                cpu_seconds = 0.0
+                if hasattr(os, 'wait4'):
+                    # wait4 reports the child's CPU time (nice/ionice exec ffmpeg in place)
+                    _, status, usage = os.wait4(process.pid, 0)
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    cpu_seconds = usage.ru_utime + usage.ru_stime
+                else:
+                    process.wait()
+            finally:
+                with self._processes_lock:
+                    self._processes.pop(process.pid, None)
+            
+            if process.returncode != 0:
+                stderr.seek(0)
+                logger.warning(f"Compaction of {source} failed: "
+                               f"{stderr.read().decode(errors='replace').strip()[-300:]}")
+                return False, cpu_seconds
+        
+        return True, cpu_seconds
+    
+    def _throttle(self, cpu_seconds: float, wall_seconds: float):
+        """Rest until this worker's CPU use averages out to its share of the budget."""
+        share = self.cpu_budget / self.workers
+        if share <= 0:
+            return
+        
+        rest = cpu_seconds / share - wall_seconds
+        if rest > 0:
+            self._stop.wait(rest)
+    
+    def get_stats(self) -> dict:
+        """Compaction statistics."""
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'compacted': self.compacted,
+            'kept': self.kept,
+            'failed': self.failed,
+            'saved_mb': round(self.saved_bytes / (1024 * 1024), 2),
+        }
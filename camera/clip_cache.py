@@ -0,0 +1,259 @@
+"""Content-addressed cache of extracted archive clips with a disk-size budget."""
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.logger import logger
+from utils.config import CLIP_CACHE_MAX_MB, CLIP_CACHE_QUANTUM
+
+TMP_MARKER = '.tmp-'
+
+
+def quantize_range(start_time: datetime, end_time: datetime,
+                   quantum: float = CLIP_CACHE_QUANTUM) -> Tuple[datetime, datetime]:
+    """Widen a time range to whole ``quantum``-second steps (start down, end up)."""
+    if quantum <= 0:
+        return start_time, end_time
+    
+    step = timedelta(seconds=quantum)
+    origin = datetime(start_time.year, start_time.month, start_time.day, tzinfo=start_time.tzinfo)
+    start = origin + ((start_time - origin) // step) * step
+    end = origin - ((origin - end_time) // step) * step  # ceil
+    return start, max(end, start + step)
+
+
+class ClipCache:
+    """
+    Extracted clips on disk, named by a hash of what they contain.
+    
+    The key covers the camera, the quantized time range and the size and
+    mtime of every source segment, so taps on the same search result or
+    bookmark reuse one file, while a range that overlapped a still-growing
+    segment is rebuilt once the segment has changed. Files are written to a
+    temporary name and renamed into place, concurrent requests for the same
+    key share one build (threads via get_or_create(), the event loop via
+    get_or_create_async()), and the least recently used clips are deleted
+    once the directory exceeds ``max_bytes``.
+    """
+    
+    def __init__(self, directory: str, max_bytes: int = int(CLIP_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # path -> size, oldest first
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._async_builds: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._loaded = False
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _load(self):
+        """Index clips already on disk (oldest use first) and drop unfinished writes."""
+        os.makedirs(self.directory, exist_ok=True)
+        clips = []
+        
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if TMP_MARKER in entry.name:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            if entry.name.endswith('.mp4'):
+                stat = entry.stat()
+                clips.append((stat.st_mtime, entry.path, stat.st_size))
+        
+        for _, path, size in sorted(clips):
+            self._entries[path] = size
+        self._loaded = True
+    
+    def key(self, camera_id: int, start_time: datetime, end_time: datetime,
+            segments: List[str], variant: str = '') -> str:
+        """Cache key of a clip built from ``segments`` for the given range (``variant``: build options)."""
+        parts = [str(camera_id), start_time.isoformat(), end_time.isoformat(), variant]
+        
+        for path in segments:
+            try:
+                stat = os.stat(path)
+                parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+            except OSError:
+                parts.append(f"{path}:missing")
+        
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+    
+    def path_for(self, camera_id: int, key: str) -> str:
+        return os.path.join(self.directory, f"clip_{camera_id}_{key}.mp4")
+    
+    def _build_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            lock = self._build_locks.get(path)
+            if lock is None:
+                lock = threading.Lock()
+                self._build_locks[path] = lock
+            return lock
+    
+    def _touch(self, path: str):
+        """Mark a clip as used (the file mtime keeps the order across restarts)."""
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    
+    def get_or_create(self, camera_id: int, start_time: datetime, end_time: datetime,
+                      segments: List[str], build: Callable[[str], bool], variant: str = '') -> Optional[str]:
+        """
+        Path of the cached clip, building it with ``build(output_path)`` on a miss.
+        
+        ``build`` writes the clip to the path it is given and returns True on
+        success; the file only becomes visible under its final name afterwards.
+        """
+        path = self._lookup(camera_id, start_time, end_time, segments, variant)
+        
+        if self._hit(path):
+            return path
+        
+        # Single flight: concurrent identical requests wait for one build
+        with self._build_lock(path):
+            try:
+                if self._hit(path):
+                    return path
+            
+                self.misses += 1
+                tmp_path = self._tmp_path(path)
+            
+                try:
+                    if not build(tmp_path) or not os.path.exists(tmp_path):
+                        return None
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            finally:
+                # Failed builds too, or every failing key would keep a lock
+                with self._lock:
+                    self._build_locks.pop(path, None)
+        
+        self._add(path)
+        return path
+    
+    async def get_or_create_async(self, camera_id: int, start_time: datetime, end_time: datetime,
+                                  segments: List[str], build: Callable[[str], Awaitable[bool]],
+                                  variant: str = '') -> Optional[str]:
+        """
+        get_or_create() for the event loop, with an async ``build``.
+        
+        Identical requests await one shared build task. A request cancelled
+        while waiting only detaches; the build itself is cancelled when its
+        last waiter is gone.
+        """
+        path = await asyncio.to_thread(self._lookup, camera_id, start_time, end_time, segments, variant)
+        
+        if self._hit(path):
+            return path
+        
+        task = self._async_builds.get(path)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._build_async(path, build))
+            self._async_builds[path] = task
+            self._waiters[path] = 0
+        
+        self._waiters[path] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[path] -= 1
+            if not self._waiters[path]:
+                self._waiters.pop(path, None)
+                if not task.done():
+                    task.cancel()
+    
+    async def _build_async(self, path: str, build: Callable[[str], Awaitable[bool]]) -> Optional[str]:
+        tmp_path = self._tmp_path(path)
+        
+        try:
+            if not await build(tmp_path) or not os.path.exists(tmp_path):
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            self._async_builds.pop(path, None)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        self._add(path)
+        return path
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        
+    def _lookup(self, camera_id: int, start_time: datetime, end_time: datetime,
+                segments: List[str], variant: str = '') -> str:
+        """Final path of a clip (loads the index of existing clips on first use)."""
+        self._ensure_loaded()
+        return self.path_for(camera_id, self.key(camera_id, start_time, end_time, segments, variant))
+    
+    def _hit(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        
+        self.hits += 1
+        self._touch(path)
+        return True
+    
+    def _tmp_path(self, path: str) -> str:
+        return f"{path[:-4]}{TMP_MARKER}{uuid.uuid4().hex[:8]}.mp4"
+    
+    def _add(self, path: str):
+        """Account a finished clip and make room for it."""
+        with self._lock:
+            self._entries[path] = os.path.getsize(path)
+        
+        self._evict(keep=path)
+    
+    def _evict(self, keep: str = None):
+        """Delete least recently used clips until the cache fits its budget."""
+        with self._lock:
+            total = sum(self._entries.values())
+            
+            for path in list(self._entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                
+                total -= self._entries.pop(path)
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except OSError:
+                    pass
+                logger.debug(f"Evicted cached clip {path}")
+    
+    def get_stats(self) -> dict:
+        """Cache statistics (clips left on disk by earlier runs included)."""
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                'clips': len(self._entries),
+                'size_mb': round(sum(self._entries.values()) / (1024 * 1024), 2),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
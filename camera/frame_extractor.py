@@ -4,12 +4,66 @@ Video arxivdan keyframe'larni olish.
 """
 import os
 import cv2
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+from itertools import islice
+from typing import List, Optional, Dict, Iterator, Tuple, Union, Callable
 import numpy as np
 
 from camera.video_recorder import video_recorder, VIDEO_DIR, SEGMENT_DURATION
+from camera.keyframe_index import seek_frame
+from utils.frame_workers import segment_frames, extract_segment, init_worker, detect_objects
 from utils.logger import logger
+from utils.config import EXTRACT_WORKERS, EXTRACT_ANALYZER_WORKERS, ARCHIVE_WORKER_FRAME_WIDTH
+
+# Parallel extraction: a task decodes one window of a segment and its frames are pickled back,
+# so windows hold about TASK_BYTES of frames (analyzer results are small, TASK_MAX_FRAMES)
+TASK_BYTES = 8 * 1024 * 1024
+TASK_MAX_FRAMES = 64
+
+
+def _task_frames(resize, grayscale: bool, analyzer: Optional[Callable]) -> int:
+    """Grid points per worker task, from the (estimated) size of the returned frames."""
+    if analyzer is not None:
+        return TASK_MAX_FRAMES
+    
+    if isinstance(resize, int) and resize:
+        width, height = resize, resize * 9 // 16
+    elif resize:
+        width, height = resize
+    else:
+        width, height = 1920, 1080
+    
+    frame_bytes = width * height * (1 if grayscale else 3)
+    return max(1, min(TASK_MAX_FRAMES, TASK_BYTES // max(1, frame_bytes)))
+
+
+def _task_windows(record: Dict, start_time: datetime, end_time: datetime,
+                  interval_seconds: float, frames: int) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a segment's part of the range into windows of ``frames`` grid points.
+    
+    Windows start on the sampling grid and end just before the next one,
+    so each grid point is sampled by exactly one task; the last window runs
+    to ``end_time`` like a whole-segment task would.
+    """
+    interval = timedelta(seconds=interval_seconds)
+    segment_end = min(end_time, record.get('end_time') or end_time)
+    
+    window_start = start_time
+    if record['start_time'] > start_time:
+        window_start = start_time + -((start_time - record['start_time']) // interval) * interval
+    
+    windows = []
+    while True:
+        window_end = window_start + frames * interval
+        if window_end >= segment_end:
+            windows.append((window_start, end_time))
+            return windows
+        windows.append((window_start, window_end - timedelta(microseconds=1)))
+        window_start = window_end
 
 
 class VideoFrameExtractor:
@@ -18,18 +72,160 @@ class VideoFrameExtractor:
     def __init__(self):
         self.video_dir = VIDEO_DIR
     
+    def iter_frames(self, camera_id: int,
+                    start_time: datetime,
+                    end_time: datetime,
+                    interval_seconds: float = 2.0,
+                    resize: Union[int, Tuple[int, int], None] = None,
+                    grayscale: bool = False,
+                    max_frames: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Vaqt oralig'idagi frame'larni birma-bir qaytarish (generator).
+        
+        Segmentlar ketma-ket dekodlanadi: har segmentda bitta seek, keyin
+        grab() bilan oldinga yuriladi va faqat kerakli kadrlar retrieve()
+        qilinadi. Bir vaqtda xotirada faqat bitta kadr turadi.
+        
+        Args:
+            camera_id: Kamera ID
+            start_time: Boshlanish vaqti
+            end_time: Tugash vaqti
+            interval_seconds: Har necha sekundda 1 frame (default 2)
+            resize: Kenglik (nisbat saqlanadi) yoki (kenglik, balandlik)
+            grayscale: Kulrang kadrlar
+            max_frames: Ko'pi bilan shuncha kadr
+            
+        Yields:
+            {'frame': np.array, 'timestamp': datetime, 'camera_id': int}
+        """
+        records = video_recorder.find_segment_records(camera_id, start_time, end_time)
+        
+        if not records:
+            logger.warning(f"No video segments found for camera {camera_id}")
+            return
+        
+        yielded = 0
+        
+        for record in records:
+            if not os.path.exists(record['file_path']):
+                continue
+            
+            for frame_timestamp, frame in segment_frames(record['file_path'], record['start_time'],
+                                                         start_time, end_time, interval_seconds,
+                                                         resize, grayscale):
+                yield {
+                    'frame': frame,
+                    'timestamp': frame_timestamp,
+                    'camera_id': camera_id
+                }
+                
+                yielded += 1
+                if max_frames is not None and yielded >= max_frames:
+                    return
+    
+    def iter_frames_parallel(self, camera_id: int,
+                             start_time: datetime,
+                             end_time: datetime,
+                             interval_seconds: float = 2.0,
+                             resize: Union[int, Tuple[int, int], None] = ARCHIVE_WORKER_FRAME_WIDTH,
+                             grayscale: bool = False,
+                             analyzer: Optional[Callable] = None,
+                             workers: Optional[int] = None) -> Iterator[Dict]:
+        """
+        iter_frames() ning parallel varianti: segmentlar ProcessPoolExecutor
+        worker'larida dekodlanadi, natijalar vaqt tartibida qaytadi.
+        
+        Jarayonlar orasida piksel tashimaslik uchun kadrlar worker ichida
+        kichraytiriladi (``resize``), ``analyzer`` berilsa esa kadr o'rniga
+        tayyor natija (masalan detect_objects) qaytadi. Har vazifa segmentning
+        qisqa oynasini (taxminan TASK_BYTES kadr) dekodlaydi va bir vaqtda
+        ``workers`` ta vazifa bajariladi, shuning uchun xotira segment
+        uzunligiga bog'liq emas.
+        
+        Worker'lar faqat yengil ``utils.frame_workers`` modulini import
+        qiladi. Analyzer (masalan YOLO) har worker'da o'z modelini
+        yuklaydi, shuning uchun u bilan standart worker soni kichik.
+        
+        Args:
+            analyzer: kadr -> natija, ``utils.frame_workers`` dagi kabi
+                      modul darajasidagi (pickle qilinadigan) funksiya
+            workers: Worker jarayonlar soni (1 - shu jarayonda, ketma-ket;
+                     default: analyzer bilan EXTRACT_ANALYZER_WORKERS,
+                     aks holda EXTRACT_WORKERS)
+            
+        Yields:
+            {'frame' yoki 'detections', 'timestamp': datetime, 'camera_id': int}
+        """
+        records = [r for r in video_recorder.find_segment_records(camera_id, start_time, end_time)
+                   if os.path.exists(r['file_path'])]
+        
+        if not records:
+            logger.warning(f"No video segments found for camera {camera_id}")
+            return
+        
+        if workers is None:
+            workers = EXTRACT_ANALYZER_WORKERS if analyzer else EXTRACT_WORKERS
+        
+        key = 'detections' if analyzer else 'frame'
+        
+        if workers <= 1:
+            for record in records:
+                for frame_timestamp, frame in segment_frames(record['file_path'], record['start_time'],
+                                                             start_time, end_time, interval_seconds,
+                                                             resize, grayscale):
+                    yield {key: analyzer(frame) if analyzer else frame,
+                           'timestamp': frame_timestamp, 'camera_id': camera_id}
+            return
+        
+        frames = _task_frames(resize, grayscale, analyzer)
+        tasks = [(record['file_path'], record['start_time'], window_start, window_end, interval_seconds,
+                  resize, grayscale, analyzer)
+                 for record in records
+                 for window_start, window_end in _task_windows(record, start_time, end_time,
+                                                               interval_seconds, frames)]
+        
+        workers = min(workers, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                 initializer=init_worker) as executor:
+            # One task per worker in flight, consumed in submission (= time) order
+            pending = deque()
+            remaining = iter(tasks)
+            
+            for task in islice(remaining, workers):
+                pending.append(executor.submit(extract_segment, *task))
+            
+            try:
+                while pending:
+                    segment_results = pending.popleft().result()
+                
+                    task = next(remaining, None)
+                    if task is not None:
+                        pending.append(executor.submit(extract_segment, *task))
+                
+                    for frame_timestamp, value in segment_results:
+                        yield {key: value, 'timestamp': frame_timestamp, 'camera_id': camera_id}
+            finally:
+                for future in pending:
+                    future.cancel()
+    
     def extract_frames(self, camera_id: int, 
                        start_time: datetime, 
                        end_time: datetime,
-                       interval_seconds: float = 2.0) -> List[Dict]:
+                       interval_seconds: float = 2.0,
+                       parallel: bool = False) -> List[Dict]:
         """
         Vaqt oralig'idagi frame'larni olish.
         
+        Barcha kadrlar ro'yxatda qaytadi; katta oraliqlar uchun iter_frames()
+        dan foydalaning.
+        
         Args:
             camera_id: Kamera ID
             start_time: Boshlanish vaqti
             end_time: Tugash vaqti
             interval_seconds: Har necha sekundda 1 frame (default 2)
+            parallel: Segmentlarni worker jarayonlarda dekodlash
+                      (kadrlar ARCHIVE_WORKER_FRAME_WIDTH gacha kichraytiriladi)
             
         Returns:
             List of {'frame': np.array, 'timestamp': datetime, 'camera_id': int}
@@ -37,64 +233,9 @@ class VideoFrameExtractor:
         frames = []
         
         try:
-            # Find relevant video segments
-            segments = video_recorder._find_segments(camera_id, start_time, end_time)
-            
-            if not segments:
-                logger.warning(f"No video segments found for camera {camera_id}")
-                return frames
-            
-            for segment_path in segments:
-                if not os.path.exists(segment_path):
-                    continue
-                
-                # Parse segment start time from filename
-                try:
-                    seg_filename = os.path.basename(segment_path)
-                    time_str = seg_filename.replace('.mp4', '')
-                    date_str = os.path.basename(os.path.dirname(segment_path))
-                    seg_start = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H-%M-%S')
-                except Exception:
-                    continue
-                
-                # Open video
-                cap = cv2.VideoCapture(segment_path)
-                if not cap.isOpened():
-                    continue
-                
-                fps = cap.get(cv2.CAP_PROP_FPS) or 15
-                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                duration = total_frames / fps
-                
-                # Calculate which frames to extract
-                frames_to_skip = int(interval_seconds * fps)
-                current_frame = 0
-                
-                while True:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                    ret, frame = cap.read()
-                    
-                    if not ret:
-                        break
-                    
-                    # Calculate timestamp for this frame
-                    frame_time_offset = current_frame / fps
-                    frame_timestamp = seg_start + timedelta(seconds=frame_time_offset)
-                    
-                    # Only include frames within requested time range
-                    if start_time <= frame_timestamp <= end_time:
-                        frames.append({
-                            'frame': frame,
-                            'timestamp': frame_timestamp,
-                            'camera_id': camera_id
-                        })
-                    
-                    current_frame += frames_to_skip
-                    
-                    if current_frame >= total_frames:
-                        break
-                
-                cap.release()
+            iterate = self.iter_frames_parallel if parallel else self.iter_frames
+            for item in iterate(camera_id, start_time, end_time, interval_seconds):
+                frames.append(item)
             
             logger.info(f"Extracted {len(frames)} frames from camera {camera_id}")
             
@@ -108,25 +249,27 @@ class VideoFrameExtractor:
         """Aniq vaqtdagi frame'ni olish."""
         try:
             # Find the segment containing this timestamp
-            segments = video_recorder._find_segments(
+            records = video_recorder.find_segment_records(
                 camera_id, 
                 timestamp - timedelta(seconds=1),
                 timestamp + timedelta(seconds=1)
             )
             
-            if not segments:
+            if not records:
                 return None
             
-            segment_path = segments[0]
+            record = next((r for r in records if r['start_time'] <= timestamp < r['end_time']), records[0])
+            segment_path = record['file_path']
             
             if not os.path.exists(segment_path):
                 return None
             
-            # Parse segment start time
-            seg_filename = os.path.basename(segment_path)
-            time_str = seg_filename.replace('.mp4', '')
-            date_str = os.path.basename(os.path.dirname(segment_path))
-            seg_start = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H-%M-%S')
+            offset_seconds = max(0.0, (timestamp - record['start_time']).total_seconds())
+            
+            # Keyframe index: jump to the nearest keyframe instead of decoding whole GOPs
+            frame, _ = seek_frame(segment_path, offset_seconds)
+            if frame is not None:
+                return frame
             
             # Open video
             cap = cv2.VideoCapture(segment_path)
@@ -136,7 +279,6 @@ class VideoFrameExtractor:
             fps = cap.get(cv2.CAP_PROP_FPS) or 15
             
             # Calculate frame position
-            offset_seconds = (timestamp - seg_start).total_seconds()
             frame_pos = int(offset_seconds * fps)
             
             cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, frame_pos))
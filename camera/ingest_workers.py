@@ -0,0 +1,673 @@
+"""
+Multi-process camera ingest.
+
+Cameras are sharded across worker processes (``camera_id % workers``). Each
+worker owns decode and reconnection for its shard and writes frames into
+``multiprocessing.shared_memory`` ring buffers; only small metadata tuples
+travel over a queue. In the bot process every camera is represented by a
+``SharedFrameCamera`` that reads frames straight out of the ring, so frames
+never get pickled. Other processes (analytics workers) can attach the same
+rings by name, see ``IngestPool.get_ring_info``. A camera's sub-stream is
+only opened in its worker while the bot asks for it (analytics reads or
+``stream='sub'`` subscribers). The pool's dispatcher respawns a worker that
+died and marks its cameras disconnected until the new worker reconnects them.
+"""
+import multiprocessing as mp
+import queue
+import threading
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.logger import logger
+from utils.config import (
+    INGEST_WORKERS, INGEST_RING_SLOTS, CONNECT_DEADLINE, FRAME_MAX_AGE, SUPERVISOR_INTERVAL,
+    CAMERA_STALE_AFTER, SUBSTREAM_ENABLED, SUBSTREAM_IDLE_TIMEOUT, get_substream_url
+)
+
+# Seconds between the bot's requests to keep a camera's sub-stream open
+SUBSTREAM_REQUEST_INTERVAL = 5.0
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frames in one shared memory block.
+    
+    Layout: a ``(slots, 2)`` float64 header of ``[seq, timestamp]`` followed
+    by ``slots`` frames of ``shape``. The writer marks a slot with seq -1
+    while overwriting it; readers copy a slot and re-check its seq, so a
+    frame overwritten mid-copy is reported as missing instead of torn.
+    """
+    
+    HEADER_FIELDS = 2
+    
+    # Guards the resource_tracker patch in attach() against a concurrent create()
+    _tracker_lock = threading.Lock()
+    
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, shape: tuple, owner: bool):
+        self.shm = shm
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.owner = owner
+        self.seq = 0
+        
+        header_bytes = slots * self.HEADER_FIELDS * 8
+        self.header = np.ndarray((slots, self.HEADER_FIELDS), dtype=np.float64, buffer=shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=header_bytes)
+    
+    @property
+    def name(self) -> str:
+        return self.shm.name
+    
+    @staticmethod
+    def size_for(slots: int, shape: tuple) -> int:
+        """Bytes needed for a ring of ``slots`` frames of ``shape``."""
+        return slots * (SharedFrameRing.HEADER_FIELDS * 8 + int(np.prod(shape)))
+    
+    @classmethod
+    def create(cls, slots: int, shape: tuple) -> 'SharedFrameRing':
+        """Allocate a new ring (writer side)."""
+        with cls._tracker_lock:
+            shm = shared_memory.SharedMemory(create=True, size=cls.size_for(slots, shape))
+        ring = cls(shm, slots, shape, owner=True)
+        ring.header[:] = 0
+        return ring
+    
+    @classmethod
+    def attach(cls, name: str, slots: int, shape: tuple) -> 'SharedFrameRing':
+        """Map an existing ring (reader side)."""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            # Attaching registers the block with the resource_tracker, which unlinks
+            # it when the reader exits; only the worker that created it may do that.
+            # Unregistering afterwards would also drop the creator's registration
+            # (spawned workers share the bot's tracker), so skip registering instead.
+            with cls._tracker_lock:
+                register = resource_tracker.register
+                resource_tracker.register = lambda name, rtype: None
+                try:
+                    shm = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        return cls(shm, slots, shape, owner=False)
+    
+    def write(self, frame: np.ndarray, timestamp: float) -> int:
+        """Copy a frame into the next slot and return its sequence number."""
+        self.seq += 1
+        slot = self.seq % self.slots
+        
+        self.header[slot, 0] = -1
+        self.frames[slot] = frame
+        self.header[slot, 1] = timestamp
+        self.header[slot, 0] = self.seq
+        return self.seq
+    
+    def read(self, seq: int) -> Tuple[Optional[np.ndarray], float]:
+        """Copy out frame ``seq``; (None, 0.0) if it was already overwritten."""
+        slot = seq % self.slots
+        
+        if self.header[slot, 0] != seq:
+            return None, 0.0
+        
+        frame = self.frames[slot].copy()
+        timestamp = float(self.header[slot, 1])
+        
+        if self.header[slot, 0] != seq:
+            return None, 0.0
+        
+        return frame, timestamp
+    
+    def latest_time(self) -> float:
+        """Capture time of the newest frame written to the ring (0.0 if none)."""
+        return float(self.header[:, 1].max())
+    
+    def close(self):
+        """Unmap the ring; the owner also frees it."""
+        # Views must go before the buffer can be released
+        self.header = None
+        self.frames = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+
+class _RingPublisher:
+    """Worker side: frame listener that writes one stream into a ring."""
+    
+    def __init__(self, camera_id: int, stream: str, events, slots: int):
+        self.camera_id = camera_id
+        self.stream = stream
+        self.events = events
+        self.slots = slots
+        self.ring: Optional[SharedFrameRing] = None
+    
+    def publish(self, frame: np.ndarray, timestamp: float):
+        # (Re)allocate on the first frame and whenever the resolution changes
+        if self.ring is None or self.ring.shape != frame.shape:
+            old = self.ring
+            self.ring = SharedFrameRing.create(self.slots, frame.shape)
+            self.events.put(('ring', self.camera_id, self.stream, self.ring.name, self.slots, frame.shape))
+            if old is not None:
+                old.close()
+        
+        seq = self.ring.write(frame, timestamp)
+        self.events.put(('frame', self.camera_id, self.stream, seq, timestamp))
+    
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def _worker_main(index: int, cameras: List[dict], commands, events, stop, slots: int):
+    """Ingest worker process: connect, supervise and publish one shard of cameras."""
+    from concurrent.futures import ThreadPoolExecutor
+    from camera.stream_manager import StreamManager
+    
+    manager = StreamManager()
+    publishers: Dict[Tuple[int, str], _RingPublisher] = {}
+    substreams = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-substream')
+    pending_substreams = {}
+    substream_wanted: Dict[int, float] = {}  # camera -> last time the bot asked for its sub-stream
+    
+    def add(cam_data: dict):
+        camera = manager.add_camera_from_data(cam_data)
+        if camera is None:
+            return
+        if cam_data.get('rtsp_url'):
+            camera.rtsp_url = cam_data['rtsp_url']
+        camera.continuous = True
+        
+        publisher = _RingPublisher(camera.camera_id, 'main', events, slots)
+        publishers[(camera.camera_id, 'main')] = publisher
+        camera.add_frame_listener(publisher.publish)
+    
+    def remove(camera_id: int):
+        substream_wanted.pop(camera_id, None)
+        manager.remove_camera(camera_id)
+        for stream in ('main', 'sub'):
+            publisher = publishers.pop((camera_id, stream), None)
+            if publisher is not None:
+                publisher.close()
+        events.put(('removed', camera_id))
+    
+    def open_substream(camera):
+        substream = camera.open_substream(CONNECT_DEADLINE)
+        if substream is not None and (camera.camera_id, 'sub') not in publishers:
+            publisher = _RingPublisher(camera.camera_id, 'sub', events, slots)
+            publishers[(camera.camera_id, 'sub')] = publisher
+            substream.add_frame_listener(publisher.publish)
+    
+    def close_substream(camera):
+        publisher = publishers.pop((camera.camera_id, 'sub'), None)
+        if camera.substream is not None:
+            if publisher is not None:
+                camera.substream.remove_frame_listener(publisher.publish)
+            camera.substream.disconnect()
+        if publisher is not None:
+            publisher.close()
+    
+    def report_status():
+        for camera_id, camera in list(manager.cameras.items()):
+            info = camera.get_info()
+            status = manager.supervisor.get_status(camera_id)
+            if status is not None:
+                info.update(status)
+            info['worker'] = index
+            events.put(('status', camera_id, info))
+            
+            # Sub-streams are opened when the bot asks for one and closed once it stops asking
+            future = pending_substreams.get(camera_id)
+            if future is not None and not future.done():
+                continue
+            
+            wanted_at = substream_wanted.get(camera_id)
+            if wanted_at is None or (SUBSTREAM_IDLE_TIMEOUT and time.time() - wanted_at > SUBSTREAM_IDLE_TIMEOUT):
+                if (camera_id, 'sub') in publishers:
+                    logger.info(f"Sub-stream of '{camera.name}' no longer requested, closing it")
+                    close_substream(camera)
+                substream_wanted.pop(camera_id, None)
+            elif (SUBSTREAM_ENABLED and camera.is_connected and camera.substream_url
+                    and not (camera.substream and camera.substream.is_connected)):
+                pending_substreams[camera_id] = substreams.submit(open_substream, camera)
+    
+    try:
+        for cam_data in cameras:
+            add(cam_data)
+        
+        manager.supervisor.start()
+        logger.info(f"Ingest worker {index} started ({len(cameras)} cameras)")
+        
+        next_status = 0.0
+        while not stop.is_set():
+            try:
+                command, payload = commands.get(timeout=min(SUPERVISOR_INTERVAL, 0.5))
+                if command == 'add':
+                    add(payload)
+                elif command == 'remove':
+                    remove(payload)
+                elif command == 'connect':
+                    manager.supervisor.request_connect(payload)
+                elif command == 'report_failure':
+                    manager.report_frame_failure(payload)
+                elif command == 'open_substream':
+                    substream_wanted[payload] = time.time()
+            except queue.Empty:
+                pass
+            
+            if time.time() >= next_status:
+                report_status()
+                next_status = time.time() + SUPERVISOR_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        substreams.shutdown(wait=False, cancel_futures=True)
+        manager.cleanup()
+        for publisher in publishers.values():
+            publisher.close()
+        logger.info(f"Ingest worker {index} stopped")
+
+
+class SharedFrameCamera:
+    """
+    Bot-process stand-in for an RTSPCamera owned by an ingest worker.
+    
+    Exposes the read side of RTSPCamera (mailbox frames, frame listeners,
+    info) backed by the worker's shared-memory ring. Connection control is
+    forwarded to the worker's supervisor.
+    """
+    
+    def __init__(self, pool: 'IngestPool', cam_data: dict, stream: str = 'main'):
+        self.pool = pool
+        self.cam_data = cam_data  # handed to a respawned worker
+        self.camera_id = cam_data['id']
+        self.name = cam_data['name'] if stream == 'main' else f"{cam_data['name']} (sub)"
+        self.ip = cam_data.get('ip_address')
+        self.port = cam_data.get('port')
+        self.camera_type = cam_data.get('camera_type', 'generic')
+        self.role = 'recording' if cam_data.get('recording_enabled', 1) else 'snapshot'
+        self.backend = 'process'
+        self.stream = stream
+        self.continuous = True
+        
+        self.substream: Optional['SharedFrameCamera'] = None
+        self.substream_url = None
+        self._substream_requested_at = 0.0
+        if stream == 'main':
+            self.substream = SharedFrameCamera(pool, cam_data, stream='sub')
+            self.substream_url = get_substream_url(self.camera_type, self.ip, self.port,
+                                                   cam_data.get('username'), cam_data.get('password'))
+        
+        self.info: dict = {}
+        self._ring: Optional[SharedFrameRing] = None
+        self._ring_spec: Optional[tuple] = None
+        self._latest_seq = 0
+        self._latest_time = 0.0
+        self._lock = threading.Lock()
+        self._frame_listeners: List[Callable] = []
+    
+    @property
+    def is_connected(self) -> bool:
+        """Whether the worker wrote a frame to the ring recently (a dead worker's ring goes stale)."""
+        with self._lock:
+            latest = self._ring.latest_time() if self._ring is not None else 0.0
+        
+        max_age = FRAME_MAX_AGE if self.stream == 'sub' else CAMERA_STALE_AFTER
+        return time.time() - latest < max_age
+    
+    @property
+    def is_grabbing(self) -> bool:
+        return self.is_connected
+    
+    @property
+    def state(self) -> Optional[str]:
+        """Supervisor state reported by the worker."""
+        return self.info.get('state')
+    
+    def _on_ring(self, name: str, slots: int, shape: tuple):
+        """The worker allocated a new ring for this stream."""
+        with self._lock:
+            old = self._ring
+            self._ring = SharedFrameRing.attach(name, slots, shape)
+            self._ring_spec = (name, slots, tuple(shape))
+            self._latest_seq = 0
+        if old is not None:
+            old.close()
+    
+    def _on_frame(self, seq: int, timestamp: float):
+        """The worker wrote frame ``seq``; feed listeners if there are any."""
+        with self._lock:
+            self._latest_seq = seq
+            self._latest_time = timestamp
+        
+        if not self._frame_listeners:
+            return
+        
+        frame, timestamp = self._read(seq)
+        if frame is None:
+            return
+        
+        for listener in list(self._frame_listeners):
+            try:
+                listener(frame, timestamp)
+            except Exception as e:
+                logger.error(f"Frame listener error for '{self.name}': {e}")
+    
+    def _read(self, seq: int) -> Tuple[Optional[np.ndarray], float]:
+        with self._lock:
+            if self._ring is None or not seq:
+                return None, 0.0
+            return self._ring.read(seq)
+    
+    def get_latest_frame(self) -> Tuple[Optional[np.ndarray], float]:
+        """Copy of the newest frame in the ring and its capture time."""
+        frame, timestamp = self._read(self._latest_seq)
+        return (frame, timestamp) if frame is not None else (None, self._latest_time)
+    
+    def get_frame(self, max_age: Optional[float] = FRAME_MAX_AGE) -> Optional[np.ndarray]:
+        """Get the newest frame (None if older than ``max_age`` seconds)."""
+        frame, captured_at = self.get_latest_frame()
+        if frame is None:
+            return None
+        if max_age is not None and time.time() - captured_at > max_age:
+            return None
+        return frame
+    
+    def read_frame(self) -> Optional[Tuple[bool, np.ndarray]]:
+        frame = self.get_frame()
+        return (True, frame) if frame is not None else None
+    
+    def request_substream(self):
+        """Ask the worker to open this camera's sub-stream, or keep it open (rate-limited)."""
+        now = time.time()
+        if now - self._substream_requested_at >= SUBSTREAM_REQUEST_INTERVAL:
+            self._substream_requested_at = now
+            self.pool.send(self.camera_id, 'open_substream', self.camera_id)
+    
+    def open_substream(self, timeout: float = 0) -> Optional['SharedFrameCamera']:
+        """
+        Have the worker open the sub-stream; returns it once frames arrive.
+        
+        Waits up to ``timeout`` seconds for the first frames (0 = just ask).
+        """
+        if not SUBSTREAM_ENABLED or self.substream is None or not self.substream_url:
+            return None
+        
+        self.request_substream()
+        deadline = time.time() + timeout
+        while not self.substream.is_connected and time.time() < deadline:
+            time.sleep(0.2)
+        return self.substream if self.substream.is_connected else None
+    
+    def get_analytics_frame(self, max_age: Optional[float] = FRAME_MAX_AGE) -> Optional[np.ndarray]:
+        """Sub-stream frame when available, else the main stream."""
+        substream = self.open_substream()
+        if substream is not None:
+            frame = substream.get_frame(max_age)
+            if frame is not None:
+                return frame
+        return self.get_frame(max_age)
+    
+    def add_frame_listener(self, listener: Callable):
+        """Feed every published frame to ``listener(frame, timestamp)``."""
+        if listener not in self._frame_listeners:
+            self._frame_listeners.append(listener)
+    
+    def remove_frame_listener(self, listener: Callable):
+        if listener in self._frame_listeners:
+            self._frame_listeners.remove(listener)
+    
+    def connect(self, timeout: float = CONNECT_DEADLINE) -> bool:
+        """Ask the worker for an immediate attempt and wait up to ``timeout`` seconds."""
+        if self.is_connected:
+            return True
+        
+        self.pool.send(self.camera_id, 'connect', self.camera_id)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            time.sleep(0.2)
+            if self.is_connected:
+                return True
+        return False
+    
+    def disconnect(self):
+        """Unmap the ring (the worker keeps owning the connection)."""
+        with self._lock:
+            ring, self._ring = self._ring, None
+        if ring is not None:
+            ring.close()
+        if self.substream is not None:
+            self.substream.disconnect()
+    
+    def reconnect(self, timeout: float = CONNECT_DEADLINE) -> bool:
+        self.pool.send(self.camera_id, 'report_failure', self.camera_id)
+        return self.connect(timeout)
+    
+    def get_info(self) -> dict:
+        """Worker-reported camera info plus the local frame age."""
+        info = dict(self.info) or {
+            'id': self.camera_id,
+            'name': self.name,
+            'ip': self.ip,
+            'port': self.port,
+            'type': self.camera_type,
+            'status': 'disconnected'
+        }
+        info['backend'] = f"process:{info.get('backend', 'opencv')}"
+        info['status'] = 'connected' if self.is_connected else 'disconnected'
+        if self._latest_time:
+            info['frame_age'] = round(time.time() - self._latest_time, 3)
+        return info
+    
+    def get_metrics(self) -> dict:
+        """Worker-reported ingest metrics only (no name or address)."""
+        from camera.rtsp_client import METRICS_STREAM_KEYS
+        
+        info = self.get_info()
+        metrics = {key: info[key] for key in METRICS_STREAM_KEYS if key in info}
+        metrics['id'] = self.camera_id
+        
+        substream = info.get('substream')
+        if substream:
+            metrics['substream'] = {key: substream[key] for key in METRICS_STREAM_KEYS if key in substream}
+        return metrics
+    
+    def get_ring_info(self) -> Optional[tuple]:
+        """(shm name, slots, shape) of the current ring."""
+        return self._ring_spec
+    
+    def test_connection(self) -> Tuple[bool, str]:
+        from camera.rtsp_client import RTSPCamera
+        return RTSPCamera.test_connection(self)
+
+
+class IngestPool:
+    """
+    Worker processes that own camera ingest.
+    
+    Worker ``camera_id % workers`` owns a camera; a worker process is only
+    started once its shard gets a camera. A dispatcher thread in the bot
+    process applies the workers' metadata events to the SharedFrameCamera
+    proxies.
+    """
+    
+    def __init__(self, workers: int = INGEST_WORKERS, slots: int = INGEST_RING_SLOTS):
+        self.workers = max(1, workers)
+        self.slots = max(2, slots)
+        self.cameras: Dict[int, SharedFrameCamera] = {}
+        
+        # Spawned workers never inherit the bot's threads or open captures
+        self._context = mp.get_context('spawn')
+        self._events = None
+        self._stop = None
+        self._processes: Dict[int, mp.Process] = {}
+        self._commands: Dict[int, any] = {}
+        self._dispatcher: Optional[threading.Thread] = None
+        # Called with the camera after each status update (StreamManager.update_sub_bus)
+        self.on_status: Optional[Callable[['SharedFrameCamera'], bool]] = None
+    
+    @property
+    def is_running(self) -> bool:
+        return self._dispatcher is not None and self._dispatcher.is_alive()
+    
+    def shard_of(self, camera_id: int) -> int:
+        """Worker index owning a camera."""
+        return camera_id % self.workers
+    
+    def start(self, cameras: List[dict]) -> Dict[int, SharedFrameCamera]:
+        """Start workers for the cameras' shards and return the proxies."""
+        if self.is_running:
+            return self.cameras
+        
+        self._events = self._context.Queue()
+        self._stop = self._context.Event()
+        
+        shards: Dict[int, List[dict]] = {}
+        for cam_data in cameras:
+            shards.setdefault(self.shard_of(cam_data['id']), []).append(cam_data)
+            self.cameras[cam_data['id']] = SharedFrameCamera(self, cam_data)
+        
+        for index, shard in shards.items():
+            self._start_worker(index, shard)
+        
+        self._dispatcher = threading.Thread(target=self._dispatch, name='ingest-dispatch', daemon=True)
+        self._dispatcher.start()
+        logger.info(f"Ingest pool started: {len(cameras)} cameras on {len(shards)}/{self.workers} workers")
+        return self.cameras
+    
+    def _start_worker(self, index: int, cameras: List[dict]):
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, cameras, commands, self._events, self._stop, self.slots),
+            name=f'ingest-{index}',
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        self._commands[index] = commands
+    
+    def send(self, camera_id: int, command: str, payload):
+        """Send a command to the worker owning a camera."""
+        commands = self._commands.get(self.shard_of(camera_id))
+        if commands is not None:
+            commands.put((command, payload))
+    
+    def add_camera(self, cam_data: dict) -> SharedFrameCamera:
+        """Hand a camera to its shard's worker (starting the worker if needed)."""
+        camera = SharedFrameCamera(self, cam_data)
+        self.cameras[cam_data['id']] = camera
+        
+        index = self.shard_of(cam_data['id'])
+        if index in self._processes:
+            self.send(cam_data['id'], 'add', cam_data)
+        else:
+            self._start_worker(index, [cam_data])
+        return camera
+    
+    def remove_camera(self, camera_id: int):
+        """Stop ingest of a camera."""
+        self.send(camera_id, 'remove', camera_id)
+        camera = self.cameras.pop(camera_id, None)
+        if camera is not None:
+            camera.disconnect()
+    
+    def get_ring_info(self, camera_id: int, stream: str = 'main') -> Optional[tuple]:
+        """(shm name, slots, shape) for SharedFrameRing.attach() in another process."""
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            return None
+        if stream == 'sub':
+            camera = camera.substream
+        return camera.get_ring_info() if camera else None
+    
+    def _check_workers(self):
+        """Respawn dead worker processes; their cameras count as disconnected until the new one reports."""
+        for index, process in list(self._processes.items()):
+            if process.is_alive() or self._stop.is_set():
+                continue
+            
+            cameras = [camera for camera_id, camera in list(self.cameras.items()) if self.shard_of(camera_id) == index]
+            logger.warning(f"Ingest worker {index} died (exit code {process.exitcode}), "
+                           f"respawning it for {len(cameras)} cameras")
+            
+            process.join(timeout=0)  # reap it
+            for camera in cameras:
+                camera.info = dict(camera.info, status='disconnected', state=None)
+            
+            self._start_worker(index, [camera.cam_data for camera in cameras])
+    
+    def _dispatch(self):
+        """Apply worker events to the proxies and keep the workers alive."""
+        next_check = time.time() + SUPERVISOR_INTERVAL
+        while not self._stop.is_set():
+            if time.time() >= next_check:
+                next_check = time.time() + SUPERVISOR_INTERVAL
+                try:
+                    self._check_workers()
+                except Exception as e:
+                    logger.error(f"Ingest worker check failed: {e}")
+            
+            try:
+                event = self._events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            
+            try:
+                kind, camera_id = event[0], event[1]
+                camera = self.cameras.get(camera_id)
+                if camera is None:
+                    continue
+                
+                if kind == 'status':
+                    camera.info = event[2]
+                    wanted = self.on_status(camera) if self.on_status is not None else False
+                    # Subscribers of the sub-stream keep it open in the worker
+                    if camera.substream is not None and (wanted or camera.substream._frame_listeners):
+                        camera.request_substream()
+                    continue
+                if kind == 'removed':
+                    continue
+                
+                target = camera.substream if event[2] == 'sub' else camera
+                if kind == 'ring':
+                    target._on_ring(*event[3:])
+                elif kind == 'frame':
+                    target._on_frame(*event[3:])
+            except Exception as e:
+                logger.error(f"Ingest event error: {e}")
+    
+    def get_stats(self) -> dict:
+        """Worker processes and their cameras."""
+        return {
+            'workers': self.workers,
+            'running': {index: process.is_alive() for index, process in self._processes.items()},
+            'cameras': {camera_id: self.shard_of(camera_id) for camera_id in self.cameras},
+        }
+    
+    def stop(self):
+        """Stop all workers (they free their rings) and unmap the proxies."""
+        if self._stop is not None:
+            self._stop.set()
+        
+        for process in self._processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=2)
+            self._dispatcher = None
+        
+        for camera in self.cameras.values():
+            camera.disconnect()
+        
+        self._processes.clear()
+        self._commands.clear()
+        logger.info("Ingest pool stopped")
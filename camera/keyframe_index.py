@@ -0,0 +1,258 @@
+"""
+Keyframe index for recorded segments.
+
+``cap.set(CAP_PROP_POS_FRAMES, n)`` makes OpenCV seek back and decode whole
+GOPs (often a whole 10-second GOP *before* the target), so a single
+screenshot from a 10-minute segment costs hundreds of milliseconds. The
+index built here lists every video packet's presentation time and which of
+them are keyframes, so a seek can jump straight to a keyframe and decode
+forward only the frames it needs.
+
+Indexes are stored as a small ``<segment>.mp4.kfi`` sidecar next to the segment
+(built when the segment closes, or lazily on first seek).
+"""
+import os
+import re
+import subprocess
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Tuple
+from utils.logger import logger
+from utils.config import FFMPEG_BINARY, SEEK_KEYFRAME_TOLERANCE
+
+INDEX_SUFFIX = '.kfi'
+INDEX_CACHE_SIZE = 64  # indexes kept in memory
+
+# ffmpeg's framecrc marks non-key packets with F=0x0 (keyframes have no or odd flags)
+_FLAGS_RE = re.compile(r'F=0x([0-9a-fA-F]+)')
+# AV_NOPTS_VALUE as printed by framecrc
+_NOPTS = -9223372036854775808
+
+
+class KeyframeIndex:
+    """Presentation times of all frames of a segment and the keyframes among them."""
+    
+    def __init__(self, pts: np.ndarray, keyframes: np.ndarray, width: int, height: int,
+                 codec: str = ''):
+        """
+        Args:
+            pts: Frame presentation times in seconds from the segment start, sorted
+            keyframes: Indexes into ``pts`` of the keyframes, sorted
+            width, height: Frame size
+            codec: ffmpeg codec name of the video stream
+        """
+        self.pts = pts
+        self.keyframes = keyframes
+        self.width = width
+        self.height = height
+        self.codec = codec
+    
+    @property
+    def frame_count(self) -> int:
+        return len(self.pts)
+    
+    @property
+    def keyframe_times(self) -> np.ndarray:
+        return self.pts[self.keyframes]
+    
+    def frame_at(self, offset: float) -> int:
+        """Index of the frame on screen ``offset`` seconds into the segment."""
+        return max(0, int(np.searchsorted(self.pts, offset, side='right')) - 1)
+    
+    def keyframe_before(self, offset: float) -> Tuple[int, float]:
+        """(frame index, time) of the keyframe a decoder has to start from for ``offset``."""
+        position = max(0, int(np.searchsorted(self.keyframe_times, offset, side='right')) - 1)
+        frame = int(self.keyframes[position])
+        return frame, float(self.pts[frame])
+    
+    def nearest_keyframe(self, offset: float) -> Tuple[int, float]:
+        """(frame index, time) of the keyframe closest to ``offset``."""
+        times = self.keyframe_times
+        position = int(np.abs(times - offset).argmin())
+        frame = int(self.keyframes[position])
+        return frame, float(self.pts[frame])
+    
+    def save(self, path: str):
+        """Write the index atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, pts=self.pts.astype(np.float64), keyframes=self.keyframes.astype(np.int32),
+                     size=np.array([self.width, self.height], dtype=np.int32), codec=np.array(self.codec))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'KeyframeIndex':
+        with np.load(path) as data:
+            width, height = (int(v) for v in data['size'])
+            codec = str(data['codec']) if 'codec' in data.files else ''
+            return cls(data['pts'].astype(np.float64), data['keyframes'].astype(np.int64), width, height, codec)
+
+
+def index_path(segment_path: str) -> str:
+    """Sidecar path of a segment's index."""
+    return segment_path + INDEX_SUFFIX
+
+
+def _parse_framecrc(output: str) -> Optional[KeyframeIndex]:
+    """Build an index from ``ffmpeg -c copy -f framecrc`` packet lines."""
+    time_base = None
+    width = height = 0
+    codec = ''
+    pts = []
+    keys = []
+    
+    for line in output.splitlines():
+        if line.startswith('#tb 0:'):
+            numerator, denominator = line.split(':', 1)[1].strip().split('/')
+            time_base = int(numerator) / int(denominator)
+        elif line.startswith('#codec_id 0:'):
+            codec = line.split(':', 1)[1].strip()
+        elif line.startswith('#dimensions 0:'):
+            width, height = (int(v) for v in line.split(':', 1)[1].strip().split('x'))
+        elif line.startswith('0,'):
+            fields = line.split(',')
+            packet_pts = int(fields[2])
+            if packet_pts == _NOPTS:
+                continue
+            flags = _FLAGS_RE.search(line)
+            pts.append(packet_pts)
+            keys.append(flags is None or int(flags.group(1), 16) & 1)
+    
+    if time_base is None or not pts:
+        return None
+    
+    # Packets come in decode order; frames are looked up in presentation order
+    pts = np.array(pts, dtype=np.int64)
+    order = np.argsort(pts, kind='stable')
+    times = (pts[order] - pts[order[0]]) * time_base
+    keyframes = np.flatnonzero(np.array(keys, dtype=bool)[order])
+    
+    if not len(keyframes):
+        keyframes = np.array([0])
+    
+    return KeyframeIndex(times, keyframes, width, height, codec)
+
+
+def build_index(segment_path: str, save: bool = True) -> Optional[KeyframeIndex]:
+    """
+    Index a segment by demuxing it (no decoding, ~0.1 s for a 10-minute segment).
+    
+    Returns None if ffmpeg is unavailable or the file cannot be read.
+    """
+    command = [FFMPEG_BINARY, '-v', 'error', '-i', segment_path,
+               '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-']
+    
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not index segment {segment_path}: {e}")
+        return None
+    
+    index = _parse_framecrc(result.stdout.decode(errors='replace'))
+    if index is None:
+        logger.warning(f"Could not index segment {segment_path}: {result.stderr.decode(errors='replace')[-200:]}")
+        return None
+    
+    if save:
+        try:
+            index.save(index_path(segment_path))
+        except OSError as e:
+            logger.warning(f"Could not save keyframe index of {segment_path}: {e}")
+    
+    return index
+
+
+_cache: 'OrderedDict[Tuple[str, float], KeyframeIndex]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_index(segment_path: str, build: bool = True) -> Optional[KeyframeIndex]:
+    """
+    Get a segment's index: memory cache, then sidecar, then (``build``) a fresh build.
+    
+    The segment's mtime is part of the cache key, so the still-growing
+    segment gets re-indexed once it changes.
+    """
+    try:
+        mtime = os.path.getmtime(segment_path)
+    except OSError:
+        return None
+    
+    key = (segment_path, mtime)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None:
+            _cache.move_to_end(key)
+            return index
+    
+    index = None
+    sidecar = index_path(segment_path)
+    try:
+        if os.path.getmtime(sidecar) >= mtime:
+            index = KeyframeIndex.load(sidecar)
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    if index is None and build:
+        index = build_index(segment_path)
+    
+    if index is not None:
+        with _cache_lock:
+            _cache[key] = index
+            while len(_cache) > INDEX_CACHE_SIZE:
+                _cache.popitem(last=False)
+    
+    return index
+
+
+def _decode_one(segment_path: str, seek_to: float, accurate: bool,
+                width: int, height: int) -> Optional[np.ndarray]:
+    """Decode a single BGR frame with ffmpeg's input seeking."""
+    command = [FFMPEG_BINARY, '-v', 'error']
+    if not accurate:
+        command.append('-noaccurate_seek')
+    command += ['-ss', f"{seek_to:.6f}", '-i', segment_path,
+                '-map', '0:v:0', '-frames:v', '1', '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+    
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Seek in {segment_path} failed: {e}")
+        return None
+    
+    frame_size = width * height * 3
+    if not frame_size or len(result.stdout) < frame_size:
+        return None
+    
+    return np.frombuffer(result.stdout[:frame_size], dtype=np.uint8).reshape(height, width, 3)
+
+
+def seek_frame(segment_path: str, offset: float,
+               tolerance: float = SEEK_KEYFRAME_TOLERANCE) -> Tuple[Optional[np.ndarray], float]:
+    """
+    Get the frame ``offset`` seconds into a segment.
+    
+    If a keyframe lies within ``tolerance`` seconds it is returned as is
+    (one decoded frame, tens of milliseconds). Otherwise decoding starts at
+    the keyframe before ``offset`` and runs forward to the exact frame.
+    
+    Returns:
+        (frame, actual offset of the returned frame); frame is None if the
+        segment has no index (no ffmpeg) or could not be decoded.
+    """
+    index = load_index(segment_path)
+    if index is None:
+        return None, offset
+    
+    _, key_time = index.nearest_keyframe(offset)
+    
+    if abs(key_time - offset) <= tolerance:
+        # Just past the keyframe: the demuxer seeks to it and no frames get discarded
+        frame = _decode_one(segment_path, key_time + 0.0005, False, index.width, index.height)
+        return frame, key_time
+    
+    # Accurate seek returns the first frame at or after the given time
+    actual = float(index.pts[index.frame_at(offset)])
+    frame = _decode_one(segment_path, max(0.0, actual - 0.0005), True, index.width, index.height)
+    return frame, actual
@@ -0,0 +1,338 @@
+"""
+In-memory ring of a camera's most recent encoded video, for event clips.
+
+The ffmpeg recorder writes a second copy of the stream it is already
+copying into segments: the same packets, still not decoded, as fragmented
+MP4 on a pipe. Every fragment (``moof`` + ``mdat``) starts at a keyframe,
+so keeping the init segment (``ftyp`` + ``moov``) and the last few seconds
+of fragments is enough to write a playable clip of any recent moment,
+without waiting for the 10-minute segment to close.
+"""
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Deque, Iterator, List, Optional, Tuple
+from utils.logger import logger
+from utils.config import PACKET_RING_SECONDS
+
+# ISO BMFF sample flag: the sample is not a sync sample (keyframe)
+_NON_SYNC_SAMPLE = 0x10000
+
+
+@dataclass
+class Fragment:
+    """One moof + mdat pair of the fragmented stream."""
+    start: float  # epoch seconds of the first frame
+    duration: float  # seconds
+    keyframe: bool  # starts with a keyframe
+    data: bytes
+    decode_time: int = 0  # tfdt, in track ticks
+    sequence: int = 0  # position in the ring's stream
+    
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+def read_box(stream: BinaryIO) -> Optional[Tuple[bytes, bytes]]:
+    """Next top-level box of a stream as (type, whole box), None at the end."""
+    header = stream.read(8)
+    if len(header) < 8:
+        return None
+    
+    size, box_type = struct.unpack('>I4s', header)
+    if size == 1:
+        extended = stream.read(8)
+        if len(extended) < 8:
+            return None
+        header += extended
+        size = struct.unpack('>Q', extended)[0]
+    elif size == 0:
+        # Box runs to the end of the stream
+        return box_type, header + stream.read()
+    
+    body = stream.read(size - len(header))
+    if len(body) < size - len(header):
+        return None
+    return box_type, header + body
+
+
+def _children(data: bytes, start: int = 8, end: int = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Child boxes of a container box as (type, payload offset, box end)."""
+    offset = start
+    end = len(data) if end is None else end
+    
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find(data: bytes, path: List[bytes], start: int = 8, end: int = None) -> Optional[Tuple[int, int]]:
+    """(payload offset, end) of the first box along a path of box types."""
+    for box_type, payload, box_end in _children(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            found = _find(data, path[1:], payload, box_end)
+            if found is not None:
+                return found
+    return None
+
+
+def rebase_fragment(data: bytes, offset: int) -> bytes:
+    """Fragment with ``offset`` ticks subtracted from its decode time (tfdt)."""
+    tfdt = _find(data, [b'moof', b'traf', b'tfdt'], start=0)
+    if tfdt is None:
+        return data
+    
+    position = tfdt[0]
+    version = data[position]
+    value_format = '>Q' if version == 1 else '>I'
+    decode_time = struct.unpack_from(value_format, data, position + 4)[0]
+    
+    rebased = bytearray(data)
+    struct.pack_into(value_format, rebased, position + 4, max(0, decode_time - offset))
+    return bytes(rebased)
+
+
+def parse_init(init_segment: bytes) -> Tuple[int, int, int]:
+    """(timescale, default sample duration, default sample flags) of the video track."""
+    timescale = 1
+    mdhd = _find(init_segment, [b'moov', b'trak', b'mdia', b'mdhd'], start=0)
+    if mdhd is not None:
+        offset = mdhd[0]
+        version = init_segment[offset]
+        timescale = struct.unpack_from('>I', init_segment, offset + (20 if version == 1 else 12))[0] or 1
+    
+    duration, flags = 0, 0
+    trex = _find(init_segment, [b'moov', b'mvex', b'trex'], start=0)
+    if trex is not None:
+        # version/flags, track_ID, sample_description_index, duration, size, flags
+        duration, _, flags = struct.unpack_from('>III', init_segment, trex[0] + 12)
+    
+    return timescale, duration, flags
+
+
+def parse_fragment(moof: bytes, default_duration: int = 0,
+                   default_flags: int = 0) -> Tuple[int, int, bool]:
+    """(base decode time, duration, starts with a keyframe) of a moof box, in track ticks."""
+    decode_time, total, keyframe = 0, 0, True
+    
+    traf = _find(moof, [b'traf'])
+    if traf is None:
+        return decode_time, total, keyframe
+    
+    for box_type, offset, _ in _children(moof, *traf):
+        version_flags = struct.unpack_from('>I', moof, offset)[0]
+        version, flags = version_flags >> 24, version_flags & 0xFFFFFF
+        offset += 4
+        
+        if box_type == b'tfhd':
+            offset += 4  # track_ID
+            if flags & 0x01:
+                offset += 8  # base_data_offset
+            if flags & 0x02:
+                offset += 4  # sample_description_index
+            if flags & 0x08:
+                default_duration = struct.unpack_from('>I', moof, offset)[0]
+                offset += 4
+            if flags & 0x10:
+                offset += 4  # default_sample_size
+            if flags & 0x20:
+                default_flags = struct.unpack_from('>I', moof, offset)[0]
+        
+        elif box_type == b'tfdt':
+            decode_time = struct.unpack_from('>Q' if version == 1 else '>I', moof, offset)[0]
+        
+        elif box_type == b'trun':
+            count = struct.unpack_from('>I', moof, offset)[0]
+            offset += 4
+            if flags & 0x01:
+                offset += 4  # data_offset
+            first_flags = None
+            if flags & 0x04:
+                first_flags = struct.unpack_from('>I', moof, offset)[0]
+                offset += 4
+            
+            for index in range(count):
+                duration, sample_flags = default_duration, default_flags
+                if flags & 0x100:
+                    duration = struct.unpack_from('>I', moof, offset)[0]
+                    offset += 4
+                if flags & 0x200:
+                    offset += 4  # sample_size
+                if flags & 0x400:
+                    sample_flags = struct.unpack_from('>I', moof, offset)[0]
+                    offset += 4
+                if flags & 0x800:
+                    offset += 4  # composition_time_offset
+                
+                if index == 0:
+                    if first_flags is not None:
+                        sample_flags = first_flags
+                    keyframe = not sample_flags & _NON_SYNC_SAMPLE
+                total += duration
+    
+    return decode_time, total, keyframe
+
+
+class PacketRing:
+    """
+    The last ``seconds`` of one camera's stream as fragmented MP4 pieces.
+    
+    Fed by read_from() on the recorder's pipe. A fragment is only written
+    once the next keyframe arrives, so its arrival time marks its end and
+    its start is the arrival time minus its own duration. Listeners are
+    called from the reader thread with each new fragment, and with None
+    when the stream restarts or ends.
+    """
+    
+    def __init__(self, camera_id: int, seconds: float = PACKET_RING_SECONDS):
+        self.camera_id = camera_id
+        self.seconds = seconds
+        
+        self.init_segment: Optional[bytes] = None
+        self._fragments: Deque[Fragment] = deque()
+        self._cond = threading.Condition()
+        self._timescale = 1
+        self._default_duration = 0
+        self._default_flags = 0
+        self._sequence = 0
+        self.closed = False
+        self.listeners: List[Callable[[Optional[Fragment]], None]] = []
+    
+    def _notify(self, fragment: Optional[Fragment]):
+        for listener in list(self.listeners):
+            try:
+                listener(fragment)
+            except Exception as e:
+                logger.error(f"Packet ring listener of camera {self.camera_id}: {e}")
+    
+    def read_from(self, stream: BinaryIO):
+        """Consume a fragmented MP4 stream until it ends (runs in the reader thread)."""
+        ftyp = b''
+        moof = None
+        
+        try:
+            while True:
+                box = read_box(stream)
+                if box is None:
+                    break
+                box_type, data = box
+                
+                if box_type == b'ftyp':
+                    ftyp = data
+                elif box_type == b'moov':
+                    self.set_init(ftyp + data)
+                elif box_type == b'moof':
+                    moof = data
+                elif box_type == b'mdat' and moof is not None:
+                    self.add_fragment(moof, data, time.time())
+                    moof = None
+        except Exception as e:
+            logger.error(f"Packet ring of camera {self.camera_id}: {e}")
+            # Keep draining, a full pipe would stall the recorder
+            while stream.read(65536):
+                pass
+        finally:
+            stream.close()
+            with self._cond:
+                self.closed = True
+                self._cond.notify_all()
+            self._notify(None)
+    
+    def set_init(self, init_segment: bytes):
+        """New stream header (recorder (re)started): earlier fragments no longer match it."""
+        timescale, duration, flags = parse_init(init_segment)
+        
+        with self._cond:
+            self.init_segment = init_segment
+            self._fragments.clear()
+            self._timescale = timescale
+            self._default_duration = duration
+            self._default_flags = flags
+            self.closed = False
+        self._notify(None)
+    
+    def add_fragment(self, moof: bytes, mdat: bytes, arrived: float):
+        """Append a fragment that arrived at ``arrived`` (epoch seconds) and drop old ones."""
+        decode_time, ticks, keyframe = parse_fragment(moof, self._default_duration, self._default_flags)
+        duration = ticks / self._timescale
+        
+        with self._cond:
+            self._sequence += 1
+            fragment = Fragment(start=arrived - duration, duration=duration, keyframe=keyframe,
+                                data=moof + mdat, decode_time=decode_time, sequence=self._sequence)
+            self._fragments.append(fragment)
+            while self._fragments and self._fragments[0].end < arrived - self.seconds:
+                self._fragments.popleft()
+            self._cond.notify_all()
+        
+        self._notify(fragment)
+    
+    @property
+    def newest_end(self) -> float:
+        """Epoch seconds up to which the ring has video (0 when empty)."""
+        with self._cond:
+            return self._fragments[-1].end if self._fragments else 0.0
+    
+    def wait_until(self, until: float, timeout: float) -> bool:
+        """Block until the ring has video up to ``until``; False on timeout or end of stream."""
+        deadline = time.time() + timeout
+        
+        with self._cond:
+            while not self._fragments or self._fragments[-1].end < until:
+                remaining = deadline - time.time()
+                if self.closed or remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+    
+    def fragments(self, start: float, end: float) -> List[Fragment]:
+        """Fragments covering [start, end], beginning at the last keyframe at or before ``start``."""
+        with self._cond:
+            fragments = list(self._fragments)
+        
+        first = next((i for i, f in enumerate(fragments) if f.keyframe), None)
+        if first is None:
+            return []
+        for i in range(first, len(fragments)):
+            if fragments[i].keyframe and fragments[i].start <= start:
+                first = i
+        
+        return [f for f in fragments[first:] if f.start < end]
+    
+    def write(self, path: str, start: float, end: float) -> bool:
+        """Write the video between two epoch times to ``path`` as fragmented MP4."""
+        init_segment = self.init_segment
+        fragments = self.fragments(start, end)
+        if init_segment is None or not fragments:
+            return False
+        
+        with open(path, 'wb') as f:
+            f.write(init_segment)
+            for fragment in fragments:
+                f.write(fragment.data)
+        return True
+    
+    def get_stats(self) -> dict:
+        """Ring statistics."""
+        with self._cond:
+            fragments = list(self._fragments)
+        
+        return {
+            'fragments': len(fragments),
+            'seconds': round(fragments[-1].end - fragments[0].start, 2) if fragments else 0.0,
+            'size_mb': round(sum(len(f.data) for f in fragments) / (1024 * 1024), 2),
+        }
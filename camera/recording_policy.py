@@ -0,0 +1,351 @@
+"""
+Per-camera recording policies.
+
+``continuous`` records around the clock. ``motion`` records only while the
+camera sees activity, plus a pre-roll before and a post-roll after it.
+``scheduled`` records inside daily time windows. Spans left out by a
+policy are cataloged as ``status='skipped'`` rows, so archive timelines can
+tell "nothing happened" apart from "recorder was down".
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, time as dtime
+from typing import Callable, Dict, List, Optional, Tuple
+from camera.packet_ring import Fragment, PacketRing, rebase_fragment
+from utils.logger import logger
+from utils.config import RECORDING_PRE_ROLL, RECORDING_POST_ROLL, RECORDING_MOTION_FPS
+
+CONTINUOUS = 'continuous'
+MOTION = 'motion'
+SCHEDULED = 'scheduled'
+POLICY_MODES = (CONTINUOUS, MOTION, SCHEDULED)
+
+# Gaps shorter than this between two segments are not cataloged as skipped
+MIN_SKIPPED_SPAN = 1.0  # seconds
+
+# Motion gate scores (or fed frames) at most this old make the monitor's own sub-stream subscription unnecessary
+MOTION_SOURCE_MAX_AGE = 5.0  # seconds
+
+
+def parse_schedule(text: str) -> List[Tuple[dtime, dtime]]:
+    """Daily windows from ``'HH:MM-HH:MM'`` items separated by commas (may cross midnight)."""
+    windows = []
+    
+    for item in (text or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        start, sep, end = item.partition('-')
+        if not sep:
+            raise ValueError(f"Bad schedule window: {item!r}")
+        windows.append((datetime.strptime(start.strip(), '%H:%M').time(),
+                        datetime.strptime(end.strip(), '%H:%M').time()))
+    
+    return windows
+
+
+@dataclass
+class RecordingPolicy:
+    """When a camera's video is written to the archive."""
+    mode: str = CONTINUOUS
+    pre_roll: float = RECORDING_PRE_ROLL  # seconds kept before activity (motion mode)
+    post_roll: float = RECORDING_POST_ROLL  # seconds kept after activity (motion mode)
+    windows: List[Tuple[dtime, dtime]] = field(default_factory=list)  # scheduled mode
+    
+    @classmethod
+    def from_camera(cls, camera: Optional[dict]) -> 'RecordingPolicy':
+        """Policy stored on a camera row (continuous when unset or invalid)."""
+        mode = (camera or {}).get('recording_policy') or CONTINUOUS
+        if mode not in POLICY_MODES:
+            logger.warning(f"Unknown recording policy {mode!r}, recording continuously")
+            return cls()
+        
+        try:
+            windows = parse_schedule((camera or {}).get('recording_schedule'))
+        except ValueError as e:
+            logger.warning(f"{e}, recording continuously")
+            return cls()
+        
+        return cls(mode=mode, windows=windows)
+    
+    @property
+    def continuous(self) -> bool:
+        return self.mode == CONTINUOUS
+    
+    def in_schedule(self, when: datetime) -> bool:
+        """Whether ``when`` falls inside one of the daily windows."""
+        clock = when.time()
+        for start, end in self.windows:
+            if start <= end:
+                if start <= clock < end:
+                    return True
+            elif clock >= start or clock < end:
+                return True
+        return False
+    
+    def should_record(self, when: float, last_motion: Optional[float] = None) -> bool:
+        """Whether video at ``when`` (epoch seconds) belongs in the archive."""
+        if self.mode == SCHEDULED:
+            return self.in_schedule(datetime.fromtimestamp(when))
+        if self.mode == MOTION:
+            return last_motion is not None and when - last_motion <= self.post_roll
+        return True
+
+
+class MotionMonitor:
+    """
+    Cheap motion score for motion-only recording.
+    
+    Scores already computed elsewhere are reused: the motion gate's scores
+    from live analysis, and frames the OpenCV recorder feeds in (feed()).
+    Only while a watched camera has neither does the monitor subscribe to
+    its low-resolution stream itself, sampled at ``fps``. Own samples are
+    compared with the previous one (downscaled frame difference, the motion
+    gate's 'diff' method with the camera's threshold). Only the time of the
+    last motion is kept.
+    """
+    
+    def __init__(self, fps: float = RECORDING_MOTION_FPS):
+        self.fps = fps
+        self._gate = None  # own MotionGate, so the detector's frame history is not disturbed
+        self._last_motion: Dict[int, float] = {}
+        self._last_fed: Dict[int, float] = {}
+        self._threads: Dict[int, threading.Thread] = {}
+        self._stop: Dict[int, threading.Event] = {}
+    
+    def watch(self, camera_id: int):
+        """Start scoring a camera's frames."""
+        if camera_id in self._threads:
+            return
+        
+        stop = threading.Event()
+        thread = threading.Thread(target=self._run, args=(camera_id, stop),
+                                  name=f'recorder-{camera_id}-motion', daemon=True)
+        self._stop[camera_id] = stop
+        self._threads[camera_id] = thread
+        thread.start()
+    
+    def unwatch(self, camera_id: int):
+        """Stop scoring a camera."""
+        stop = self._stop.pop(camera_id, None)
+        if stop is not None:
+            stop.set()
+        self._threads.pop(camera_id, None)
+        self._last_motion.pop(camera_id, None)
+        self._last_fed.pop(camera_id, None)
+        if self._gate is not None:
+            self._gate.reset(camera_id)
+    
+    def observe(self, camera_id: int, frame, timestamp: float = None) -> bool:
+        """Score one frame; True (and remembered) when it shows motion."""
+        from ai.motion_detector import MotionGate, motion_gate
+        
+        if self._gate is None:
+            self._gate = MotionGate(method='diff')
+        moving = self._gate.measure(camera_id, frame) >= motion_gate.get_threshold(camera_id)
+        if moving:
+            self._last_motion[camera_id] = timestamp or time.time()
+        return moving
+    
+    def feed(self, camera_id: int, frame, timestamp: float = None) -> bool:
+        """Score a frame another reader already has (e.g. the recorder's), at most ``fps`` times a second."""
+        now = timestamp or time.time()
+        if self.fps and now - self._last_fed.get(camera_id, 0.0) < 1.0 / self.fps:
+            return False
+        
+        self._last_fed[camera_id] = now
+        return self.observe(camera_id, frame, now)
+    
+    @staticmethod
+    def _motion_gate():
+        """The analysis motion gate, None without the AI dependencies."""
+        try:
+            from ai.motion_detector import motion_gate
+        except ImportError:
+            return None
+        return motion_gate
+    
+    def _gate_motion(self, camera_id: int) -> Optional[float]:
+        """Newest motion the analysis motion gate saw on the camera (epoch seconds)."""
+        gate = self._motion_gate()
+        if gate is None:
+            return None
+        
+        threshold = gate.get_threshold(camera_id)
+        moving = [timestamp for timestamp, score in gate.get_history(camera_id, MOTION_SOURCE_MAX_AGE)
+                  if score >= threshold]
+        return moving[-1] if moving else None
+    
+    def _has_source(self, camera_id: int) -> bool:
+        """Whether fresh scores arrive without the monitor's own subscription."""
+        if time.time() - self._last_fed.get(camera_id, 0.0) <= MOTION_SOURCE_MAX_AGE:
+            return True
+        
+        gate = self._motion_gate()
+        return gate is not None and gate.get_score(camera_id, max_age=MOTION_SOURCE_MAX_AGE) is not None
+    
+    def last_motion(self, camera_id: int) -> Optional[float]:
+        """Epoch seconds of the camera's last motion (None if none seen)."""
+        gate_motion = self._gate_motion(camera_id)
+        if gate_motion is not None and gate_motion > self._last_motion.get(camera_id, 0.0):
+            self._last_motion[camera_id] = gate_motion
+        return self._last_motion.get(camera_id)
+    
+    def _run(self, camera_id: int, stop: threading.Event):
+        from camera.stream_manager import stream_manager
+        
+        subscription = None
+        try:
+            while not stop.is_set():
+                if self._has_source(camera_id):
+                    if subscription is not None:
+                        stream_manager.unsubscribe(subscription)
+                        subscription = None
+                    stop.wait(1.0)
+                    continue
+                
+                if subscription is None or not subscription.active:
+                    subscription = stream_manager.subscribe(camera_id, 'recorder-motion', fps=self.fps,
+                                                            queue_size=1, stream='sub')
+                    if subscription is None:
+                        stop.wait(5)
+                        continue
+                
+                item = subscription.get(timeout=1.0)
+                if item is not None:
+                    frame, timestamp = item
+                    self.observe(camera_id, frame, timestamp)
+        finally:
+            if subscription is not None:
+                stream_manager.unsubscribe(subscription)
+
+
+class RingSegmentWriter:
+    """
+    Archive segments cut from a camera's packet ring by its recording policy.
+    
+    Registered as a ring listener, it decides per fragment whether the
+    video belongs in the archive. When recording (re)starts, the pre-roll
+    is still in the ring and written first, from its last keyframe. Open
+    segments are rotated at the first keyframe after ``segment_duration``.
+    Segment timestamps are rebased so every file starts at zero, like the
+    ffmpeg segment muxer's.
+    """
+    
+    def __init__(self, camera_id: int, ring: PacketRing, policy: RecordingPolicy,
+                 last_motion: Callable[[], Optional[float]],
+                 segment_path: Callable[[datetime], str],
+                 on_segment: Callable[[datetime, str, float], None],
+                 on_skipped: Callable[[datetime, datetime], None],
+                 segment_duration: float):
+        self.camera_id = camera_id
+        self.ring = ring
+        self.policy = policy
+        self.last_motion = last_motion
+        self.segment_path = segment_path
+        self.on_segment = on_segment
+        self.on_skipped = on_skipped
+        self.segment_duration = segment_duration
+        
+        self._lock = threading.Lock()
+        self._file = None
+        self._path: Optional[str] = None
+        self._start = 0.0
+        self._duration = 0.0
+        self._base_ticks = 0
+        self._last_sequence = 0
+        self._last_end: Optional[float] = None  # end of the last written video
+    
+    def __call__(self, fragment: Optional[Fragment]):
+        """Ring listener: a new fragment, or None when the stream restarted or ended."""
+        with self._lock:
+            if fragment is None:
+                self._finish(time.time())
+                self._last_sequence = 0
+                return
+            
+            if self._last_end is None:
+                # Recording (re)started: skipping is counted from here
+                self._last_end = fragment.start
+            
+            if not self.policy.should_record(fragment.end, self.last_motion()):
+                self._close()
+                return
+            
+            if self._file is not None and fragment.keyframe and self._duration >= self.segment_duration:
+                self._close()
+            
+            if self._file is None:
+                self._open(fragment)
+            elif fragment.sequence > self._last_sequence:
+                self._write(fragment)
+    
+    def _open(self, fragment: Fragment):
+        """Start a segment with the pre-roll still in the ring, from a keyframe."""
+        fragments = [f for f in self.ring.fragments(fragment.start - self.policy.pre_roll, fragment.end)
+                     if f.sequence > self._last_sequence]
+        while fragments and not fragments[0].keyframe:
+            fragments.pop(0)
+        if not fragments or self.ring.init_segment is None:
+            return  # no keyframe yet
+        
+        first = fragments[0]
+        if self._last_end is not None and first.start - self._last_end >= MIN_SKIPPED_SPAN:
+            self.on_skipped(datetime.fromtimestamp(self._last_end), datetime.fromtimestamp(first.start))
+        
+        start_time = datetime.fromtimestamp(int(first.start))
+        path = self.segment_path(start_time)
+        while os.path.exists(path):
+            # Segment names are their start second; never overwrite an earlier one
+            start_time = datetime.fromtimestamp(start_time.timestamp() + 1)
+            path = self.segment_path(start_time)
+        
+        self._file = open(path, 'wb')
+        self._file.write(self.ring.init_segment)
+        self._path = path
+        self._start = max(first.start, start_time.timestamp())
+        self._duration = 0.0
+        self._base_ticks = first.decode_time
+        
+        for f in fragments:
+            self._write(f)
+    
+    def _write(self, fragment: Fragment):
+        self._file.write(rebase_fragment(fragment.data, self._base_ticks))
+        self._file.flush()
+        self._duration += fragment.duration
+        self._last_sequence = fragment.sequence
+        self._last_end = fragment.end
+    
+    def _close(self):
+        """Finish the open segment and hand it to ``on_segment``."""
+        if self._file is None:
+            return
+        
+        self._file.close()
+        self._file = None
+        try:
+            self.on_segment(datetime.fromtimestamp(self._start), self._path, self._duration)
+        except Exception as e:
+            logger.error(f"Error registering segment of camera {self.camera_id}: {e}")
+    
+    def _finish(self, now: float):
+        """Finish the segment, or catalog the span skipped since the last one."""
+        writing = self._file is not None
+        self._close()
+        
+        if not writing and self._last_end is not None and now - self._last_end >= MIN_SKIPPED_SPAN:
+            self.on_skipped(datetime.fromtimestamp(self._last_end), datetime.fromtimestamp(now))
+        self._last_end = None
+    
+    def close(self, now: float = None):
+        """Recording stopped (or the stream restarted)."""
+        with self._lock:
+            self._finish(now or time.time())
+    
+    @property
+    def recording(self) -> bool:
+        """Whether a segment is being written."""
+        return self._file is not None
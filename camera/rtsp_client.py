@@ -1,16 +1,341 @@
 """Universal RTSP camera client."""
+import re
 import cv2
 import time
-from typing import Optional, Tuple
+import hashlib
+import subprocess
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, List, Optional, Tuple
 from utils.logger import logger
-from utils.config import DEFAULT_TIMEOUT, get_rtsp_url
+from utils.config import (
+    DEFAULT_TIMEOUT, CONTINUOUS_GRAB, FRAME_MAX_AGE, CAMERA_RTSP_FORMATS, SUBSTREAM_ENABLED,
+    FFMPEG_BINARY, CAPTURE_BACKENDS, ANALYTICS_FRAME_WIDTH, ANALYTICS_FPS, ANALYTICS_KEYFRAMES_ONLY,
+    get_rtsp_url, get_substream_url
+)
+
+# Consecutive failed reads before the grabber thread gives up on the stream
+GRAB_MAX_FAILURES = 50
+
+# Seconds before a sub-stream that failed to open is tried again
+SUBSTREAM_RETRY_INTERVAL = 60
+
+# Per-stream fields of get_metrics()/get_info() the metrics endpoint may expose
+METRICS_STREAM_KEYS = ('status', 'backend', 'metrics', 'frame_age')
+
+# Camera type auto-detection
+DETECT_TIMEOUT = 3.0  # seconds per probe (open + first read each)
+DETECT_PORTS = (554, 8554, 10554)  # common RTSP ports probed besides the given one
+DETECT_CACHE_TTL = 3600  # seconds
+
+
+def reader_options(role: str) -> dict:
+    """
+    ffmpeg backend decode options for a camera role.
+    
+    RTSPCamera hands every frame to its mailbox, frame listeners and the
+    snapshot cache, which keep it past the next read, so no role reuses
+    frame buffers.
+    """
+    options = {'buffers': 0}
+    
+    if role == 'analytics':
+        options.update({
+            'width': ANALYTICS_FRAME_WIDTH,
+            'fps': ANALYTICS_FPS,
+            'keyframes_only': ANALYTICS_KEYFRAMES_ONLY,
+        })
+    
+    return options
+
+
+def open_capture(url: str, timeout: float = DEFAULT_TIMEOUT, backend: str = 'opencv',
+                 **options):
+    """
+    Open a video capture whose open and read calls give up after ``timeout`` seconds.
+    
+    ``backend='ffmpeg'`` returns an FFmpegFrameReader built with ``options``;
+    the options are ignored by the OpenCV backend.
+    """
+    if backend == 'ffmpeg':
+        return FFmpegFrameReader(url, timeout=timeout, **options)
+    
+    timeout_ms = int(timeout * 1000)
+    return cv2.VideoCapture(url, cv2.CAP_ANY, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms
+    ])
+
+
+class FFmpegFrameReader:
+    """
+    Frame reader that decodes in an ffmpeg subprocess.
+    
+    Raw BGR frames are read from a pipe straight into preallocated numpy
+    buffers. Unlike cv2.VideoCapture it can scale at decode time, sample a
+    target fps and decode keyframes only (``-skip_frame nokey``), so P-frames
+    are never decoded. Implements the VideoCapture subset used by
+    RTSPCamera: ``isOpened()``, ``read()``, ``get()`` and ``release()``.
+    
+    With ``buffers=N`` a returned frame is overwritten after N more reads;
+    consumers that keep frames longer must copy them or use ``buffers=0``
+    (a new array per frame).
+    """
+    
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT, width: int = 0,
+                 height: int = 0, fps: float = 0, keyframes_only: bool = False,
+                 threads: int = 1, buffers: int = 8):
+        """
+        Args:
+            url: RTSP URL or file path
+            timeout: Seconds to wait for the stream to start (and RTSP socket timeout)
+            width, height: Output size, 0 keeps the source size / aspect ratio
+            fps: Output frame rate, 0 keeps the source rate
+            keyframes_only: Decode keyframes only
+            threads: Decoder threads
+            buffers: Size of the reused frame buffer ring, 0 to allocate per frame
+        """
+        self.url = url
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.bitrate = 0.0  # input kbit/s when ffmpeg reports it
+        
+        self._buffers: List[np.ndarray] = []
+        self._buffer_count = buffers
+        self._next_buffer = 0
+        self._frame_size = 0
+        self._stderr_tail = deque(maxlen=20)
+        self._info_ready = threading.Event()
+        self._opened = False
+        
+        command = [FFMPEG_BINARY, '-hide_banner', '-nostdin', '-nostats', '-loglevel', 'info']
+        if url.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp', '-timeout', str(int(timeout * 1_000_000))]
+        if keyframes_only:
+            command += ['-skip_frame', 'nokey']
+        command += ['-threads', str(threads), '-i', url, '-an', '-sn', '-dn']
+        
+        filters = []
+        if fps:
+            filters.append(f"fps={fps}")
+        if width and height:
+            filters.append(f"scale={width}:{height}")
+        elif width:
+            filters.append(f"scale='min({width},iw)':-2")  # downscale only
+        elif height:
+            filters.append(f"scale=-2:'min({height},ih)'")
+        if filters:
+            command += ['-vf', ','.join(filters)]
+        if keyframes_only:
+            command += ['-vsync', 'passthrough']  # do not duplicate frames back to the source rate
+        command += ['-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except OSError as e:
+            logger.error(f"Could not start ffmpeg reader: {e}")
+            self.process = None
+            return
+        
+        # ffmpeg reports the output size on stderr; keep draining it afterwards
+        self._stderr_thread = threading.Thread(target=self._read_stderr, name='ffmpeg-reader-log',
+                                               daemon=True)
+        self._stderr_thread.start()
+        
+        if self._info_ready.wait(timeout) and self.width and self.height:
+            self._frame_size = self.width * self.height * 3
+            self._opened = True
+        else:
+            logger.error(f"ffmpeg reader could not open stream: {' | '.join(self._stderr_tail)}")
+            self.release()
+    
+    def _read_stderr(self):
+        """Parse the output stream description, then keep the log tail."""
+        in_output = False
+        
+        for raw_line in iter(self.process.stderr.readline, b''):
+            line = raw_line.decode(errors='replace').strip()
+            self._stderr_tail.append(line)
+            
+            if self._info_ready.is_set():
+                continue
+            
+            bitrate = re.search(r'bitrate: (\d+) kb/s', line)
+            if bitrate and not in_output:
+                self.bitrate = float(bitrate.group(1))
+            
+            if line.startswith('Output #0'):
+                in_output = True
+            elif in_output and 'Video:' in line:
+                size = re.search(r', (\d+)x(\d+)', line)
+                rate = re.search(r'([\d.]+) fps', line)
+                if size:
+                    self.width, self.height = int(size.group(1)), int(size.group(2))
+                if rate:
+                    self.fps = float(rate.group(1))
+                self._info_ready.set()
+        
+        self._info_ready.set()
+    
+    def isOpened(self) -> bool:
+        """Whether the decoder is running."""
+        return self._opened and self.process is not None and self.process.poll() is None
+    
+    def _take_buffer(self) -> np.ndarray:
+        """Next buffer of the ring (or a new one without a ring)."""
+        shape = (self.height, self.width, 3)
+        
+        if not self._buffer_count:
+            return np.empty(shape, dtype=np.uint8)
+        
+        if len(self._buffers) < self._buffer_count:
+            self._buffers.append(np.empty(shape, dtype=np.uint8))
+            return self._buffers[-1]
+        
+        buffer = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % self._buffer_count
+        return buffer
+    
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Read the next decoded frame."""
+        if not self._opened or self.process is None:
+            return False, None
+        
+        frame = self._take_buffer()
+        view = memoryview(frame).cast('B')
+        filled = 0
+        
+        try:
+            while filled < self._frame_size:
+                count = self.process.stdout.readinto(view[filled:])
+                if not count:
+                    return False, None
+                filled += count
+        except (OSError, ValueError):
+            return False, None
+        
+        return True, frame
+    
+    def get(self, prop_id: int) -> float:
+        """Subset of cv2.VideoCapture.get()."""
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_BITRATE:
+            return self.bitrate
+        return 0.0
+    
+    def release(self):
+        """Stop the decoder."""
+        self._opened = False
+        
+        if self.process is None:
+            return
+        
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        
+        self.process.stdout.close()
+        self.process = None
+
+
+class StreamMetrics:
+    """
+    Rolling ingest metrics of one capture.
+    
+    Decode time is the time spent in the capture's ``read()`` (demux +
+    decode; on live streams it includes waiting for the next frame).
+    """
+    
+    FPS_WINDOW = 10.0  # seconds
+    DECODE_SAMPLES = 300
+    
+    def __init__(self):
+        self.frame_times = deque(maxlen=2000)
+        self.decode_times = deque(maxlen=self.DECODE_SAMPLES)
+        self.frames = 0
+        self.read_failures = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.reconnects = 0
+        self.last_frame_time = 0.0
+    
+    def record_frame(self, decode_time: float, timestamp: float = None):
+        """Count one delivered frame."""
+        timestamp = time.time() if timestamp is None else timestamp
+        self.frames += 1
+        self.last_frame_time = timestamp
+        self.frame_times.append(timestamp)
+        self.decode_times.append(decode_time)
+    
+    def record_failure(self):
+        """Count one failed read."""
+        self.read_failures += 1
+    
+    def record_connect(self, success: bool):
+        """Count a connection attempt; successful ones after the first are reconnects."""
+        if not success:
+            self.connect_failures += 1
+            return
+        
+        if self.connects:
+            self.reconnects += 1
+        self.connects += 1
+    
+    def snapshot(self, now: float = None) -> dict:
+        """Current metric values."""
+        now = time.time() if now is None else now
+        
+        recent = [t for t in list(self.frame_times) if now - t <= self.FPS_WINDOW]
+        span = min(self.FPS_WINDOW, now - recent[0]) if recent else 0.0
+        fps = len(recent) / span if span > 0 else 0.0
+        
+        metrics = {
+            'delivered_fps': round(fps, 2),
+            'frames': self.frames,
+            'read_failures': self.read_failures,
+            'reconnects': self.reconnects,
+            'connect_failures': self.connect_failures,
+            'last_frame_age': round(now - self.last_frame_time, 3) if self.last_frame_time else None,
+        }
+        
+        samples = list(self.decode_times)
+        if samples:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+            metrics['decode_ms'] = {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+        
+        return metrics
+
 
 class RTSPCamera:
     """Universal RTSP camera handler."""
     
     def __init__(self, camera_id: int, name: str, ip: str, port: int,
-                 username: str, password: str, camera_type: str = 'generic'):
-        """Initialize RTSP camera."""
+                 username: str, password: str, camera_type: str = 'generic',
+                 continuous: bool = CONTINUOUS_GRAB, role: str = 'snapshot'):
+        """
+        Initialize RTSP camera.
+        
+        ``role`` ('analytics', 'snapshot' or 'recording') selects the frame
+        reader backend from CAPTURE_BACKENDS and its decode options.
+        """
         self.camera_id = camera_id
         self.name = name
         self.ip = ip
@@ -22,70 +347,323 @@ class RTSPCamera:
         # Generate RTSP URL
         self.rtsp_url = get_rtsp_url(camera_type, ip, port, username, password)
         
+        # Low-resolution sub-stream for analytics, opened on demand
+        self.substream_url = get_substream_url(camera_type, ip, port, username, password)
+        self.substream: Optional['RTSPCamera'] = None
+        self._substream_failed_at = 0.0
+        self._substream_used_at = 0.0
+        
+        # Frame reader backend for this camera's role
+        self.role = role
+        self.backend = CAPTURE_BACKENDS.get(role, 'opencv')
+        
         self.cap: Optional[cv2.VideoCapture] = None
         self.is_connected = False
+        # Direct readers (snapshots, handlers) may share the capture when no grabber runs
+        self._capture_lock = threading.Lock()
+        
+        # Continuous grab mode: reader thread + single-slot latest-frame mailbox
+        self.continuous = continuous
+        self._grab_thread: Optional[threading.Thread] = None
+        self._grab_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._latest_frame = None
+        self._latest_frame_time = 0.0
+        
+        # Callbacks fed every grabbed frame (used by the stream manager's frame bus)
+        self._frame_listeners: List[Callable] = []
+        
+        self.metrics = StreamMetrics()
         
         logger.info(f"RTSP Camera initialized: {name} ({ip}:{port})")
     
-    def connect(self) -> bool:
-        """Connect to camera stream."""
+    def connect(self, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """Connect to camera stream (open and first read bounded by ``timeout`` seconds)."""
         try:
             logger.info(f"Connecting to camera '{self.name}' at {self.ip}...")
             
-            # Try to open video capture
-            self.cap = cv2.VideoCapture(self.rtsp_url)
+            # Never let an old grabber read from a capture we are replacing
+            self.stop_grabber()
+            if self._release_capture():
+                self.is_connected = False
             
-            # Set timeout
-            self.cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, DEFAULT_TIMEOUT * 1000)
+            # Try to open video capture (timeouts only apply when passed at open time)
+            cap = open_capture(self.rtsp_url, timeout, self.backend, **reader_options(self.role))
+            with self._capture_lock:
+                self.cap = cap
             
             # Check if opened successfully
             if self.cap.isOpened():
                 # Try to read a frame to verify
-                ret, frame = self.cap.read()
+                ret, frame = self._read_capture()
                 if ret and frame is not None:
                     self.is_connected = True
+                    self.metrics.record_connect(True)
+                    self._publish_frame(frame, time.time())
                     logger.info(f"✅ Successfully connected to camera '{self.name}'")
+                    
+                    # An undrained ffmpeg pipe stalls the decoder, so it always gets a grabber
+                    if self.continuous or self._frame_listeners or self.backend == 'ffmpeg':
+                        self.start_grabber()
                     return True
             
             logger.error(f"❌ Failed to connect to camera '{self.name}'")
+            self.metrics.record_connect(False)
             return False
             
         except Exception as e:
             logger.error(f"Error connecting to camera '{self.name}': {e}")
+            self.metrics.record_connect(False)
+            return False
+    
+    def _read_capture(self) -> Tuple[bool, any]:
+        """Read from the capture (one reader at a time), recording decode time and failures."""
+        with self._capture_lock:
+            if self.cap is None:
+                return False, None
+            
+            started = time.perf_counter()
+            ret, frame = self.cap.read()
+        
+        if ret and frame is not None:
+            self.metrics.record_frame(time.perf_counter() - started)
+        else:
+            self.metrics.record_failure()
+        
+        return ret, frame
+    
+    @property
+    def is_grabbing(self) -> bool:
+        """Whether the background reader thread is draining the stream."""
+        return self._grab_thread is not None and self._grab_thread.is_alive()
+    
+    def start_grabber(self) -> bool:
+        """Start the background reader thread (continuous grab mode)."""
+        if self.is_grabbing:
+            return True
+        
+        if not self.is_connected or self.cap is None:
             return False
+        
+        self._grab_stop.clear()
+        self._grab_thread = threading.Thread(
+            target=self._grab_loop,
+            name=f"grab-{self.camera_id}",
+            daemon=True
+        )
+        self._grab_thread.start()
+        logger.info(f"Frame grabber started for camera '{self.name}'")
+        return True
+    
+    def stop_grabber(self):
+        """Stop the background reader thread if it is running."""
+        self._grab_stop.set()
+        
+        thread = self._grab_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=DEFAULT_TIMEOUT)
+        self._grab_thread = None
+    
+    def _grab_loop(self):
+        """Keep draining the stream, publishing only the newest frame."""
+        failures = 0
+        
+        while not self._grab_stop.is_set():
+            try:
+                ret, frame = self._read_capture()
+            except Exception as e:
+                logger.error(f"Error grabbing frame from '{self.name}': {e}")
+                ret, frame = False, None
+            
+            if ret and frame is not None:
+                failures = 0
+                self._publish_frame(frame, time.time())
+                continue
+            
+            failures += 1
+            if failures >= GRAB_MAX_FAILURES:
+                logger.warning(f"Frame grabber lost the stream of camera '{self.name}'")
+                self.is_connected = False
+                break
+            
+            time.sleep(0.05)
+    
+    def _publish_frame(self, frame, timestamp: float):
+        """Replace the mailbox contents with a newer frame."""
+        with self._frame_lock:
+            self._latest_frame = frame
+            self._latest_frame_time = timestamp
+        
+        for listener in list(self._frame_listeners):
+            try:
+                listener(frame, timestamp)
+            except Exception as e:
+                logger.error(f"Frame listener error for '{self.name}': {e}")
+    
+    def add_frame_listener(self, listener: Callable):
+        """Feed every grabbed frame to ``listener(frame, timestamp)``."""
+        if listener not in self._frame_listeners:
+            self._frame_listeners.append(listener)
+        
+        # Listeners need a reader thread to be fed
+        if self.is_connected:
+            self.start_grabber()
+    
+    def remove_frame_listener(self, listener: Callable):
+        """Stop feeding frames to ``listener``."""
+        if listener in self._frame_listeners:
+            self._frame_listeners.remove(listener)
+        
+        if not self._frame_listeners and not self.continuous and self.backend != 'ffmpeg':
+            self.stop_grabber()
+    
+    def get_latest_frame(self) -> Tuple[Optional[any], float]:
+        """Get the newest grabbed frame and its capture time (epoch seconds)."""
+        with self._frame_lock:
+            return self._latest_frame, self._latest_frame_time
     
     def read_frame(self) -> Optional[Tuple[bool, any]]:
         """Read a frame from camera."""
         if not self.is_connected or self.cap is None:
             return None
         
+        # The grabber thread owns the capture - never compete with it
+        if self.is_grabbing:
+            frame, _ = self.get_latest_frame()
+            return (True, frame) if frame is not None else None
+        
         try:
-            ret, frame = self.cap.read()
+            ret, frame = self._read_capture()
             return (ret, frame) if ret else None
         except Exception as e:
             logger.error(f"Error reading frame from '{self.name}': {e}")
             return None
     
-    def get_frame(self) -> Optional[any]:
-        """Get current frame from camera."""
+    def get_frame(self, max_age: Optional[float] = FRAME_MAX_AGE) -> Optional[any]:
+        """
+        Get current frame from camera.
+        
+        In continuous grab mode the frame comes from the mailbox without
+        touching the decoder; frames older than ``max_age`` seconds are
+        treated as missing. Without a grabber a fresh frame is read.
+        """
+        if self.is_grabbing:
+            frame, captured_at = self.get_latest_frame()
+            if frame is None:
+                return None
+            if max_age is not None and time.time() - captured_at > max_age:
+                return None
+            return frame
+        
         result = self.read_frame()
         if result:
             ret, frame = result
             return frame if ret else None
         return None
     
+    def open_substream(self, timeout: float = DEFAULT_TIMEOUT) -> Optional['RTSPCamera']:
+        """
+        Connect the low-resolution sub-stream used by analytics.
+        
+        The sub-stream is a second capture with its own grabber, so
+        analytics never decode the main stream. Returns None when the
+        camera type has no known sub-stream or it failed to open recently.
+        """
+        if not SUBSTREAM_ENABLED or not self.substream_url:
+            return None
+        
+        if self.substream is None:
+            self.substream = RTSPCamera(
+                camera_id=self.camera_id,
+                name=f"{self.name} (sub)",
+                ip=self.ip,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                camera_type=self.camera_type,
+                continuous=True,
+                role='analytics'
+            )
+            self.substream.rtsp_url = self.substream_url
+            self.substream.substream_url = None
+        
+        if self.substream.is_connected:
+            return self.substream
+        
+        if time.time() - self._substream_failed_at < SUBSTREAM_RETRY_INTERVAL:
+            return None
+        
+        if not self.substream.connect(timeout):
+            self._substream_failed_at = time.time()
+            logger.warning(f"Sub-stream of '{self.name}' unavailable, analytics use the main stream")
+            return None
+        
+        return self.substream
+    
+    def get_analytics_frame(self, max_age: Optional[float] = FRAME_MAX_AGE) -> Optional[any]:
+        """
+        Get a frame for analytics: from the sub-stream when available, else the main stream.
+        
+        Boxes found on it can be mapped back to main-stream coordinates with
+        ``utils.geometry.scale_bbox(bbox, frame.shape, main_frame.shape)``.
+        """
+        self._substream_used_at = time.time()
+        substream = self.open_substream()
+        if substream is not None:
+            frame = substream.get_frame(max_age)
+            if frame is not None:
+                return frame
+        
+        return self.get_frame(max_age)
+    
+    def close_idle_substream(self, idle_timeout: float, now: float = None) -> bool:
+        """
+        Close the sub-stream if nothing subscribes to it and no analytics
+        frame was asked for in ``idle_timeout`` seconds (e.g. after a one-off
+        /test). The next get_analytics_frame() opens it again.
+        """
+        substream = self.substream
+        if substream is None or not substream.is_connected or substream._frame_listeners:
+            return False
+        
+        now = time.time() if now is None else now
+        if now - self._substream_used_at <= idle_timeout:
+            return False
+        
+        logger.info(f"Sub-stream of '{self.name}' unused, closing it")
+        substream.disconnect()
+        return True
+    
     def disconnect(self):
         """Disconnect from camera."""
-        if self.cap is not None:
-            self.cap.release()
+        self.stop_grabber()
+        
+        if self.substream is not None:
+            self.substream.disconnect()
+        
+        if self._release_capture():
             self.is_connected = False
             logger.info(f"Disconnected from camera '{self.name}'")
     
-    def reconnect(self) -> bool:
-        """Reconnect to camera."""
+    def _release_capture(self) -> bool:
+        """Release the capture once no reader is using it; whether there was one."""
+        with self._capture_lock:
+            cap, self.cap = self.cap, None
+        
+        if cap is None:
+            return False
+        cap.release()
+        return True
+    
+    def reconnect(self, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        Reconnect to camera (blocking).
+        
+        Async handlers should leave this to the StreamManager supervisor,
+        which retries in the background with backoff.
+        """
         self.disconnect()
-        time.sleep(1)
-        return self.connect()
+        return self.connect(timeout)
     
     def get_info(self) -> dict:
         """Get camera information."""
@@ -95,6 +673,7 @@ class RTSPCamera:
             'ip': self.ip,
             'port': self.port,
             'type': self.camera_type,
+            'backend': self.backend,
             'status': 'connected' if self.is_connected else 'disconnected'
         }
         
@@ -103,9 +682,51 @@ class RTSPCamera:
                 info['width'] = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
                 info['height'] = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
                 info['fps'] = int(self.cap.get(cv2.CAP_PROP_FPS))
+                
+                # Container bitrate in kbit/s, 0 when the backend does not know it
+                bitrate = self.cap.get(cv2.CAP_PROP_BITRATE)
+                if bitrate > 0:
+                    info['bytes_per_sec'] = int(bitrate * 1000 / 8)
             except:
                 pass
         
+        info['metrics'] = self.metrics.snapshot()
+        
+        if self.is_grabbing:
+            _, captured_at = self.get_latest_frame()
+            info['frame_age'] = round(time.time() - captured_at, 3) if captured_at else None
+        
+        if self.substream is not None:
+            sub_info = self.substream.get_info()
+            info['substream'] = {
+                key: sub_info[key]
+                for key in ('status', 'width', 'height', 'fps', 'bytes_per_sec', 'metrics') if key in sub_info
+            }
+        
+        return info
+    
+    def get_metrics(self) -> dict:
+        """
+        Ingest metrics only: no name or address, and no capture reads.
+        
+        Safe to call from other threads (e.g. the health server) while the
+        grabber owns the capture, since it reads the StreamMetrics counters.
+        """
+        info = {
+            'id': self.camera_id,
+            'status': 'connected' if self.is_connected else 'disconnected',
+            'backend': self.backend,
+            'metrics': self.metrics.snapshot(),
+        }
+        
+        if self.is_grabbing:
+            _, captured_at = self.get_latest_frame()
+            info['frame_age'] = round(time.time() - captured_at, 3) if captured_at else None
+        
+        if self.substream is not None:
+            sub_info = self.substream.get_metrics()
+            info['substream'] = {key: sub_info[key] for key in METRICS_STREAM_KEYS if key in sub_info}
+        
         return info
     
     def test_connection(self) -> Tuple[bool, str]:
@@ -138,29 +759,107 @@ class RTSPCamera:
         self.disconnect()
 
 
-def detect_camera_type(ip: str, username: str, password: str) -> str:
+# Detection results per probe fingerprint: {fingerprint: (detected_at, (type, port))}
+_detect_cache: Dict[str, Tuple[float, Tuple[str, int]]] = {}
+_detect_cache_lock = threading.Lock()
+
+
+def _detect_fingerprint(ip: str, username: str, password: str, port: Optional[int],
+                        formats: Dict[str, str]) -> str:
+    """Cache key for a probe: address, credentials, port and URL formats (never stores the password)."""
+    probe = f"{ip}\0{username}\0{password}\0{port}\0{sorted(formats.items())}"
+    return hashlib.sha256(probe.encode()).hexdigest()
+
+
+def _probe_url(url: str, timeout: float, cancelled: threading.Event) -> bool:
+    """Check whether a stream URL opens and yields a frame."""
+    if cancelled.is_set():
+        return False
+    
+    cap = open_capture(url, timeout)
+    try:
+        if cancelled.is_set() or not cap.isOpened():
+            return False
+        ret, _ = cap.read()
+        return bool(ret)
+    finally:
+        cap.release()
+
+
+def detect_camera(ip: str, username: str, password: str, port: int = None,
+                  timeout: float = DETECT_TIMEOUT, formats: Dict[str, str] = None,
+                  use_cache: bool = True) -> Optional[Tuple[str, int]]:
+    """
+    Detect camera type and RTSP port by probing all URL formats concurrently.
+    
+    Every entry of ``formats`` (CAMERA_RTSP_FORMATS by default) is tried on
+    the given port and the common alternate ports at the same time. The
+    first probe that yields a frame wins and the remaining ones are
+    cancelled. Successful results are cached per IP, credentials, port and
+    formats.
+    
+    Returns:
+        (camera_type, port) or None if nothing answered
+    """
+    formats = formats or CAMERA_RTSP_FORMATS
+    fingerprint = _detect_fingerprint(ip, username, password, port, formats)
+    
+    if use_cache:
+        with _detect_cache_lock:
+            cached = _detect_cache.get(fingerprint)
+        if cached and time.time() - cached[0] < DETECT_CACHE_TTL:
+            return cached[1]
+    
+    ports = [port] if port else []
+    ports += [p for p in DETECT_PORTS if p not in ports]
+    
+    # Brands sharing a URL format (tp-link/xiaomi) are probed once
+    candidates = {}
+    for probe_port in ports:
+        for cam_type, url_format in formats.items():
+            url = url_format.format(username=username, password=password, ip=ip, port=probe_port)
+            candidates.setdefault(url, (cam_type, probe_port))
+    
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='cam-detect')
+    futures = {
+        executor.submit(_probe_url, url, timeout, cancelled): candidate
+        for url, candidate in candidates.items()
+    }
+    
+    result = None
+    try:
+        for future in as_completed(futures, timeout=timeout * 2 + 1):
+            try:
+                if future.result():
+                    result = futures[future]
+                    break
+            except Exception:
+                continue
+    except FuturesTimeoutError:
+        pass
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    if result is None:
+        return None
+    
+    logger.info(f"Detected camera type: {result[0]} (port {result[1]})")
+    with _detect_cache_lock:
+        _detect_cache[fingerprint] = (time.time(), result)
+    return result
+
+
+def detect_camera_type(ip: str, username: str, password: str, port: int = None) -> str:
     """
     Try to detect camera type by testing different RTSP URL formats.
     Returns detected camera type or 'generic'.
     """
-    from utils.config import CAMERA_RTSP_FORMATS
+    result = detect_camera(ip, username, password, port)
     
-    test_types = ['hikvision', 'dahua', 'tp-link', 'xiaomi', 'generic']
+    if result is None:
+        logger.warning("Could not detect camera type, using generic")
+        return 'generic'
     
-    for cam_type in test_types:
-        try:
-            rtsp_url = get_rtsp_url(cam_type, ip, 554, username, password)
-            cap = cv2.VideoCapture(rtsp_url)
-            cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 3000)  # 3 second timeout
-            
-            if cap.isOpened():
-                ret, _ = cap.read()
-                cap.release()
-                if ret:
-                    logger.info(f"Detected camera type: {cam_type}")
-                    return cam_type
-        except:
-            continue
-    
-    logger.warning("Could not detect camera type, using generic")
-    return 'generic'
+    return result[0]
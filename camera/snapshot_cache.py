@@ -0,0 +1,211 @@
+"""Per-camera cache of pre-encoded JPEG snapshots shared by all handlers."""
+import asyncio
+import threading
+import time
+import cv2
+from dataclasses import dataclass
+from typing import Dict, Optional
+from camera.stream_manager import stream_manager
+from utils.logger import logger
+from utils.config import (
+    FRAME_MAX_AGE, SNAPSHOT_MAX_AGE, SNAPSHOT_JPEG_QUALITY, SNAPSHOT_PREVIEW_WIDTH,
+    SNAPSHOT_REFRESH_INTERVAL
+)
+
+
+@dataclass
+class Snapshot:
+    """Encoded snapshot of one camera."""
+    camera_id: int
+    jpeg: bytes
+    captured_at: float  # epoch seconds of the source frame
+    width: int
+    height: int
+    frame: any = None  # decoded source frame, shared - treat as read-only
+    preview: Optional[bytes] = None  # smaller rendition, encoded on first request
+    
+    @property
+    def age(self) -> float:
+        """Seconds since the source frame was captured."""
+        return time.time() - self.captured_at
+
+
+class SnapshotCache:
+    """
+    Latest encoded JPEG per camera.
+    
+    Handlers share one snapshot per camera as long as it is younger than
+    ``max_age`` seconds, so several users pressing the same button within a
+    second cost one decode and one encode. Refreshes are single-flight per
+    camera. With ``SNAPSHOT_REFRESH_INTERVAL`` set, recently viewed cameras
+    are also re-encoded on a timer so the next press is served instantly.
+    """
+    
+    # Cameras requested within this many seconds are kept warm by the timer
+    HOT_SECONDS = 120
+    
+    def __init__(self, max_age: float = SNAPSHOT_MAX_AGE, quality: int = SNAPSHOT_JPEG_QUALITY,
+                 preview_width: int = SNAPSHOT_PREVIEW_WIDTH):
+        self.max_age = max_age
+        self.quality = quality
+        self.preview_width = preview_width
+        
+        self._snapshots: Dict[int, Snapshot] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._requested_at: Dict[int, float] = {}
+        
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_stop = threading.Event()
+        
+        self.hits = 0
+        self.misses = 0
+        self.encodes = 0
+    
+    def _lock_for(self, camera_id: int) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(camera_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[camera_id] = lock
+            return lock
+    
+    def _encode(self, frame, quality: int) -> Optional[bytes]:
+        success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if success else None
+    
+    def _with_preview(self, snapshot: Snapshot) -> Snapshot:
+        """Encode the preview rendition once per snapshot."""
+        if snapshot.preview is not None or snapshot.frame is None or not self.preview_width:
+            return snapshot
+        
+        frame = snapshot.frame
+        if snapshot.width > self.preview_width:
+            height = max(1, snapshot.height * self.preview_width // snapshot.width)
+            frame = cv2.resize(frame, (self.preview_width, height), interpolation=cv2.INTER_AREA)
+        
+        snapshot.preview = self._encode(frame, self.quality)
+        return snapshot
+    
+    def _read_frame(self, camera_id: int):
+        """Newest frame of a connected camera and its capture time."""
+        camera = stream_manager.cameras.get(camera_id)
+        
+        if camera is None or not camera.is_connected:
+            return None, 0.0
+        
+        if camera.is_grabbing:
+            frame, captured_at = camera.get_latest_frame()
+            if frame is None or time.time() - captured_at > FRAME_MAX_AGE:
+                return None, 0.0
+            return frame, captured_at
+        
+        return camera.get_frame(), time.time()
+    
+    def refresh(self, camera_id: int) -> Optional[Snapshot]:
+        """Encode the camera's newest frame (skipped if it has not changed)."""
+        frame, captured_at = self._read_frame(camera_id)
+        
+        if frame is None:
+            return None
+        
+        current = self._snapshots.get(camera_id)
+        if current is not None and current.captured_at == captured_at:
+            return current
+        
+        jpeg = self._encode(frame, self.quality)
+        if jpeg is None:
+            logger.error(f"Snapshot encode failed for camera {camera_id}")
+            return None
+        
+        height, width = frame.shape[:2]
+        snapshot = Snapshot(
+            camera_id=camera_id,
+            jpeg=jpeg,
+            captured_at=captured_at,
+            width=width,
+            height=height,
+            frame=frame
+        )
+        
+        self._snapshots[camera_id] = snapshot
+        self.encodes += 1
+        return snapshot
+    
+    def get(self, camera_id: int, max_age: float = None,
+            preview: bool = False) -> Optional[Snapshot]:
+        """
+        Get a snapshot no older than ``max_age`` seconds (default: cache setting).
+        
+        Returns None if the camera is not connected or delivered no frame.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        self._requested_at[camera_id] = time.time()
+        
+        snapshot = self._snapshots.get(camera_id)
+        if snapshot is None or snapshot.age > max_age:
+            # Single flight: concurrent callers wait for one refresh
+            with self._lock_for(camera_id):
+                snapshot = self._snapshots.get(camera_id)
+                if snapshot is None or snapshot.age > max_age:
+                    self.misses += 1
+                    snapshot = self.refresh(camera_id)
+                else:
+                    self.hits += 1
+        else:
+            self.hits += 1
+        
+        if snapshot is not None and preview:
+            snapshot = self._with_preview(snapshot)
+        
+        return snapshot
+    
+    async def get_async(self, camera_id: int, max_age: float = None,
+                        preview: bool = False) -> Optional[Snapshot]:
+        """get() for async handlers; decode and encode run off the event loop."""
+        return await asyncio.to_thread(self.get, camera_id, max_age, preview)
+    
+    def invalidate(self, camera_id: int):
+        """Drop the cached snapshot of a camera."""
+        self._snapshots.pop(camera_id, None)
+    
+    def start_refresh(self, interval: float = SNAPSHOT_REFRESH_INTERVAL):
+        """Keep recently viewed cameras' snapshots warm on a timer."""
+        if interval <= 0 or (self._refresh_thread is not None and self._refresh_thread.is_alive()):
+            return
+        
+        def refresh_loop():
+            while not self._refresh_stop.wait(interval):
+                cutoff = time.time() - self.HOT_SECONDS
+                for camera_id, requested_at in list(self._requested_at.items()):
+                    if requested_at < cutoff:
+                        continue
+                    try:
+                        with self._lock_for(camera_id):
+                            self.refresh(camera_id)
+                    except Exception as e:
+                        logger.error(f"Snapshot refresh error for camera {camera_id}: {e}")
+        
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=refresh_loop, name='snapshot-refresh', daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"Snapshot refresh started (every {interval}s)")
+    
+    def stop_refresh(self):
+        """Stop the refresh timer."""
+        self._refresh_stop.set()
+        self._refresh_thread = None
+    
+    def get_stats(self) -> dict:
+        """Cache statistics."""
+        return {
+            'cameras': len(self._snapshots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'encodes': self.encodes,
+            'ages': {camera_id: round(s.age, 2) for camera_id, s in list(self._snapshots.items())},
+        }
+
+
+# Global instance
+snapshot_cache = SnapshotCache()
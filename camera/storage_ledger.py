@@ -0,0 +1,245 @@
+"""
+Running archive storage totals per camera and per organization.
+
+Storage stats used to walk the archive and stat every segment file. The
+ledger is filled once from the segment catalog (one grouped query) and then
+kept current as segments are cataloged and deleted, so reads and quota
+checks are dictionary lookups. Event clips are not cataloged; their bytes
+are taken from one scan of the events directory and then kept current as
+clips are written and deleted.
+"""
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from database.models import db
+from utils.logger import logger
+from utils.config import ARCHIVE_MAX_GB, ARCHIVE_CAMERA_MAX_GB
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class StorageLedger:
+    """
+    Bytes, segment count and time range of the archive of each camera.
+    
+    Organization totals are kept alongside; a camera's organization (and its
+    storage_limit_gb) is looked up once. Only closed, cataloged segments are
+    counted, the one being written joins when it closes.
+    """
+    
+    def __init__(self, max_bytes: int = int(ARCHIVE_MAX_GB * GB),
+                 camera_max_bytes: int = int(ARCHIVE_CAMERA_MAX_GB * GB)):
+        self.max_bytes = max_bytes  # whole archive, 0 = no quota
+        self.camera_max_bytes = camera_max_bytes  # per camera, 0 = no quota
+        
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._cameras: Dict[int, dict] = {}  # camera -> {'bytes', 'segments', 'oldest', 'newest'}
+        self._organizations: Dict[Optional[int], int] = {}  # organization -> bytes
+        self._camera_orgs: Dict[int, Optional[int]] = {}
+        self._org_limits: Dict[int, int] = {}  # organization -> quota bytes (0 = none)
+        self._total = 0
+        self._event_clips: Dict[int, int] = {}  # camera -> event clip bytes
+        self._event_clips_loaded = False
+    
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.reload()
+    
+    def reload(self):
+        """Rebuild the totals from the catalog (startup, or after bulk catalog changes)."""
+        from database.v2_models import v2db
+        
+        usage = v2db.get_archive_usage()
+        
+        with self._lock:
+            self._cameras.clear()
+            self._organizations.clear()
+            self._total = 0
+            
+            for row in usage:
+                size = int(round((row['size_mb'] or 0) * MB))
+                self._cameras[row['camera_id']] = {
+                    'bytes': size,
+                    'segments': row['segments'],
+                    'oldest': _parse_time(row['oldest']),
+                    'newest': _parse_time(row['newest']),
+                }
+                self._add_org_bytes(row['camera_id'], size)
+                self._total += size
+            
+            self._loaded = True
+        
+        logger.debug(f"Storage ledger loaded: {len(usage)} cameras, {self._total / GB:.2f} GB")
+    
+    def organization_of(self, camera_id: int) -> Optional[int]:
+        """Organization a camera belongs to (cached)."""
+        with self._lock:
+            if camera_id in self._camera_orgs:
+                return self._camera_orgs[camera_id]
+        
+        camera = db.get_camera(camera_id)
+        org_id = camera.get('organization_id') if camera else None
+        
+        with self._lock:
+            self._camera_orgs[camera_id] = org_id
+        return org_id
+    
+    def organization_limit(self, org_id: Optional[int]) -> int:
+        """Quota of an organization in bytes (its storage_limit_gb, 0 = none)."""
+        if org_id is None:
+            return 0
+        
+        with self._lock:
+            if org_id in self._org_limits:
+                return self._org_limits[org_id]
+        
+        organization = db.get_organization(org_id)
+        limit = int((organization.get('storage_limit_gb') or 0) * GB) if organization else 0
+        
+        with self._lock:
+            self._org_limits[org_id] = limit
+        return limit
+    
+    def _add_org_bytes(self, camera_id: int, size: int):
+        org_id = self.organization_of(camera_id)
+        self._organizations[org_id] = self._organizations.get(org_id, 0) + size
+    
+    def add(self, camera_id: int, start_time: datetime, size: int, previous_size: int = None):
+        """Account a cataloged segment (``previous_size``: it was cataloged before with this size)."""
+        with self._lock:
+            if not self._loaded:
+                self.reload()  # the catalog already has it
+                return
+            
+            usage = self._cameras.setdefault(camera_id, {'bytes': 0, 'segments': 0,
+                                                         'oldest': None, 'newest': None})
+            delta = size - (previous_size or 0)
+            usage['bytes'] += delta
+            if previous_size is None:
+                usage['segments'] += 1
+            if usage['oldest'] is None or start_time < usage['oldest']:
+                usage['oldest'] = start_time
+            if usage['newest'] is None or start_time > usage['newest']:
+                usage['newest'] = start_time
+            
+            self._add_org_bytes(camera_id, delta)
+            self._total += delta
+    
+    def remove(self, camera_id: int, start_time: datetime, size: int):
+        """Account a deleted segment."""
+        from database.v2_models import v2db
+        
+        with self._lock:
+            if not self._loaded:
+                self.reload()  # the catalog already lost it
+                return
+            
+            usage = self._cameras.get(camera_id)
+            if usage is None:
+                return
+            
+            usage['bytes'] = max(0, usage['bytes'] - size)
+            usage['segments'] = max(0, usage['segments'] - 1)
+            self._add_org_bytes(camera_id, -size)
+            self._total = max(0, self._total - size)
+            
+            if not usage['segments']:
+                del self._cameras[camera_id]
+            elif usage['oldest'] is not None and start_time <= usage['oldest']:
+                # Retention deletes oldest first, the next one is an index lookup away
+                usage['oldest'] = _parse_time(v2db.get_oldest_start(camera_id))
+    
+    def camera_usage(self, camera_id: int) -> dict:
+        """{'bytes', 'segments', 'oldest', 'newest'} of a camera's archive."""
+        with self._lock:
+            self._ensure_loaded()
+            usage = self._cameras.get(camera_id)
+            return dict(usage) if usage else {'bytes': 0, 'segments': 0, 'oldest': None, 'newest': None}
+    
+    def organization_bytes(self, org_id: Optional[int]) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return self._organizations.get(org_id, 0)
+    
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return self._total
+    
+    def cameras(self, org_id: Optional[int] = None) -> List[int]:
+        """Cameras with archived video (of one organization, if given)."""
+        with self._lock:
+            self._ensure_loaded()
+            camera_ids = list(self._cameras)
+        
+        if org_id is None:
+            return camera_ids
+        return [camera_id for camera_id in camera_ids if self.organization_of(camera_id) == org_id]
+    
+    def over_quota(self, camera_id: int) -> bool:
+        """Whether the camera, its organization or the whole archive is above its quota."""
+        org_id = self.organization_of(camera_id)
+        org_limit = self.organization_limit(org_id)
+        
+        with self._lock:
+            self._ensure_loaded()
+            camera_bytes = self._cameras.get(camera_id, {}).get('bytes', 0)
+            return bool(
+                (self.camera_max_bytes and camera_bytes > self.camera_max_bytes)
+                or (org_limit and self._organizations.get(org_id, 0) > org_limit)
+                or (self.max_bytes and self._total > self.max_bytes)
+            )
+    
+    def ensure_event_clips(self, scan: Callable[[], List[Tuple[int, int]]]):
+        """Fill the event clip totals once from ``scan()``: [(camera_id, bytes)] of the clips on disk."""
+        with self._lock:
+            if self._event_clips_loaded:
+                return
+            
+            for camera_id, size in scan():
+                self._event_clips[camera_id] = self._event_clips.get(camera_id, 0) + size
+            self._event_clips_loaded = True
+    
+    def add_event_clip(self, camera_id: int, size: int):
+        """Account a written event clip (a negative ``size`` for a deleted one)."""
+        with self._lock:
+            if not self._event_clips_loaded:
+                return  # the first scan sees the disk as it is
+            self._event_clips[camera_id] = max(0, self._event_clips.get(camera_id, 0) + size)
+    
+    def event_clip_bytes(self, org_id: Optional[int] = None) -> int:
+        """Event clip bytes of all cameras, or of one organization's cameras."""
+        with self._lock:
+            clips = list(self._event_clips.items())
+        
+        if org_id is None:
+            return sum(size for _, size in clips)
+        return sum(size for camera_id, size in clips if self.organization_of(camera_id) == org_id)
+    
+    def get_stats(self, org_id: Optional[int] = None) -> dict:
+        """Totals of the whole archive, or of one organization's cameras."""
+        camera_ids = self.cameras(org_id)
+        usages = [self.camera_usage(camera_id) for camera_id in camera_ids]
+        oldest = [usage['oldest'] for usage in usages if usage['oldest']]
+        newest = [usage['newest'] for usage in usages if usage['newest']]
+        
+        total = self.total_bytes if org_id is None else self.organization_bytes(org_id)
+        quota = self.max_bytes if org_id is None else self.organization_limit(org_id)
+        
+        return {
+            'total_size_mb': round(total / MB, 2),
+            'segment_count': sum(usage['segments'] for usage in usages),
+            'cameras': len(camera_ids),
+            'oldest': min(oldest) if oldest else None,
+            'newest': max(newest) if newest else None,
+            'quota_gb': round(quota / GB, 2) if quota else None,
+        }
@@ -1,8 +1,402 @@
 """Camera stream manager for handling multiple cameras - Production Ready."""
-from typing import Dict, Optional
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
 from camera.rtsp_client import RTSPCamera
 from database.models import db
 from utils.logger import logger
+from utils.config import (
+    CONNECT_CONCURRENCY, CONNECT_DEADLINE, SUPERVISOR_INTERVAL, RECONNECT_BACKOFF_BASE,
+    RECONNECT_BACKOFF_MAX, CAMERA_OFFLINE_AFTER, CAMERA_STALE_AFTER, INGEST_MODE, INGEST_WORKERS,
+    STREAM_IDLE_TIMEOUT, SUBSTREAM_IDLE_TIMEOUT
+)
+
+
+class FrameSubscription:
+    """
+    One consumer's view of a camera's frame bus.
+    
+    Frames are shared between subscribers and must be treated as read-only.
+    When the consumer falls behind, the oldest queued frame is dropped.
+    """
+    
+    def __init__(self, camera_id: int, name: str, fps: Optional[float] = None,
+                 queue_size: int = 2, stream: str = 'main'):
+        """
+        Args:
+            camera_id: Camera ID
+            name: Consumer name (for logs and stats)
+            fps: Max delivery rate, None for every decoded frame
+            queue_size: Frames kept for a slow consumer before dropping
+            stream: 'main' or 'sub' (low-resolution analytics stream)
+        """
+        self.camera_id = camera_id
+        self.name = name
+        self.stream = stream
+        self.fps = fps
+        self.dropped = 0
+        self.delivered = 0
+        self.active = True
+        
+        self._frames = deque(maxlen=max(1, queue_size))
+        self._cond = threading.Condition()
+        self._last_offer_time = 0.0
+    
+    def offer(self, frame, timestamp: float):
+        """Queue a frame if the subscriber's rate allows it (called by the bus)."""
+        if self.fps and timestamp - self._last_offer_time < 1.0 / self.fps:
+            return
+        self._last_offer_time = timestamp
+        
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append((frame, timestamp))
+            self._cond.notify()
+    
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[any, float]]:
+        """Wait for the next (frame, timestamp), or None on timeout/close."""
+        with self._cond:
+            if not self._frames and self.active:
+                self._cond.wait(timeout)
+            if not self._frames:
+                return None
+            self.delivered += 1
+            return self._frames.popleft()
+    
+    def close(self):
+        """Stop receiving frames and wake up a waiting consumer."""
+        with self._cond:
+            self.active = False
+            self._frames.clear()
+            self._cond.notify_all()
+    
+    def get_stats(self) -> dict:
+        """Get subscription statistics."""
+        return {
+            'name': self.name,
+            'stream': self.stream,
+            'fps': self.fps,
+            'queued': len(self._frames),
+            'delivered': self.delivered,
+            'dropped': self.dropped
+        }
+
+
+class FrameBus:
+    """Fan out each decoded frame of one camera to all its subscribers."""
+    
+    def __init__(self, camera: RTSPCamera):
+        self.camera = camera
+        self.subscriptions: List[FrameSubscription] = []
+        self._lock = threading.Lock()
+    
+    def publish(self, frame, timestamp: float):
+        """Deliver a frame to every subscriber (called from the grabber thread)."""
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        
+        for subscription in subscriptions:
+            subscription.offer(frame, timestamp)
+    
+    def add(self, subscription: FrameSubscription):
+        """Attach a subscriber; the first one starts feeding the bus."""
+        with self._lock:
+            self.subscriptions.append(subscription)
+            first = len(self.subscriptions) == 1
+        
+        if first:
+            self.camera.add_frame_listener(self.publish)
+    
+    def remove(self, subscription: FrameSubscription):
+        """Detach a subscriber; the last one stops feeding the bus."""
+        subscription.close()
+        
+        with self._lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+            empty = not self.subscriptions
+        
+        if empty:
+            self.camera.remove_frame_listener(self.publish)
+    
+    def set_source(self, camera: RTSPCamera):
+        """Feed the bus from another capture (sub-stream up or down), keeping its subscribers."""
+        with self._lock:
+            if camera is self.camera:
+                return
+            previous, self.camera = self.camera, camera
+            feeding = bool(self.subscriptions)
+        
+        if feeding:
+            camera.add_frame_listener(self.publish)
+            previous.remove_frame_listener(self.publish)
+    
+    def close(self):
+        """Detach all subscribers."""
+        for subscription in list(self.subscriptions):
+            self.remove(subscription)
+
+
+class CameraState:
+    """Connection states owned by the CameraSupervisor."""
+    CONNECTING = 'connecting'  # first connection attempts in progress
+    LIVE = 'live'              # connected and delivering frames
+    DEGRADED = 'degraded'      # was live, stream lost or stale, reconnecting
+    OFFLINE = 'offline'        # repeated failures, retrying with long backoff
+    IDLE = 'idle'              # closed because nobody used it, reopened on demand
+
+
+# Value written to cameras.status when a camera enters a state
+STATE_DB_STATUS = {
+    CameraState.LIVE: 'active',
+    CameraState.OFFLINE: 'inactive',
+}
+
+
+class _SupervisedCamera:
+    """Supervisor bookkeeping for one camera."""
+    
+    def __init__(self):
+        self.state = CameraState.CONNECTING
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.changed_at = time.time()
+        self.attempt = None  # Future of the running connection attempt
+        self.sub_attempt = None  # Future of the running sub-stream attempt
+        self.reported_failure = False
+        self.db_status = None
+
+
+class CameraSupervisor:
+    """
+    Background owner of every camera's connection state.
+    
+    A single thread checks all cameras every ``SUPERVISOR_INTERVAL`` seconds
+    and runs (re)connection attempts in a bounded pool, spacing retries with
+    jittered exponential backoff. Handlers only read the state and never
+    block the event loop on a reconnect. State transitions are mirrored into
+    the ``cameras.status`` column.
+    
+    Cameras without recording/analytics subscribers that nobody accessed
+    for ``STREAM_IDLE_TIMEOUT`` seconds are closed and left idle until the
+    next access (see StreamManager.touch / prefetch).
+    """
+    
+    def __init__(self, manager: 'StreamManager', max_workers: int = CONNECT_CONCURRENCY,
+                 deadline: float = CONNECT_DEADLINE):
+        self.manager = manager
+        self.max_workers = max_workers
+        self.deadline = deadline
+        
+        self._records: Dict[int, _SupervisedCamera] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+    
+    @property
+    def is_running(self) -> bool:
+        """Whether the supervisor thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Start supervising in a daemon thread."""
+        if self.is_running:
+            return
+        
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.max_workers),
+                                            thread_name_prefix='cam-supervisor')
+        self._thread = threading.Thread(target=self._run, name='cam-supervisor', daemon=True)
+        self._thread.start()
+        logger.info("Camera supervisor started")
+    
+    def stop(self):
+        """Stop the supervisor thread (running attempts are abandoned)."""
+        self._stop.set()
+        self._wakeup.set()
+        
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+        
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def get_state(self, camera_id: int) -> Optional[str]:
+        """Current state of a camera, None if it is not supervised."""
+        with self._lock:
+            record = self._records.get(camera_id)
+            return record.state if record else None
+    
+    def get_status(self, camera_id: int) -> Optional[dict]:
+        """State details of a camera for info views."""
+        with self._lock:
+            record = self._records.get(camera_id)
+            if record is None:
+                return None
+            
+            return {
+                'state': record.state,
+                'failures': record.failures,
+                'state_age': round(time.time() - record.changed_at, 1),
+                'next_attempt_in': round(max(0.0, record.next_attempt - time.time()), 1),
+            }
+    
+    def request_connect(self, camera_id: int):
+        """Ask for a connection attempt as soon as possible (ignores backoff)."""
+        with self._lock:
+            record = self._records.setdefault(camera_id, _SupervisedCamera())
+            record.next_attempt = 0.0
+        self._wakeup.set()
+    
+    def report_failure(self, camera_id: int):
+        """A consumer got no frame from a connected camera; reconnect it."""
+        with self._lock:
+            record = self._records.get(camera_id)
+            if record is not None:
+                record.reported_failure = True
+        self._wakeup.set()
+    
+    def forget(self, camera_id: int):
+        """Stop supervising a camera."""
+        with self._lock:
+            self._records.pop(camera_id, None)
+    
+    def backoff(self, failures: int) -> float:
+        """Jittered exponential delay before the next attempt."""
+        delay = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * (2 ** max(0, failures - 1)))
+        return delay * random.uniform(0.5, 1.0)
+    
+    def _run(self):
+        """Supervisor loop."""
+        while not self._stop.is_set():
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.error(f"Camera supervisor error: {e}")
+            
+            self._wakeup.wait(SUPERVISOR_INTERVAL)
+            self._wakeup.clear()
+    
+    def check_all(self):
+        """Run one supervision pass over all cameras."""
+        cameras = dict(self.manager.cameras)
+        
+        with self._lock:
+            for camera_id in list(self._records):
+                if camera_id not in cameras:
+                    del self._records[camera_id]
+        
+        for camera_id, camera in cameras.items():
+            with self._lock:
+                record = self._records.setdefault(camera_id, _SupervisedCamera())
+            self._check(camera, record)
+    
+    def _check(self, camera: RTSPCamera, record: _SupervisedCamera):
+        """Advance one camera's state machine."""
+        now = time.time()
+        
+        if record.attempt is not None:
+            if not record.attempt.done():
+                return
+            
+            try:
+                ok = record.attempt.result()
+            except Exception as e:
+                logger.error(f"Error connecting camera {camera.camera_id}: {e}")
+                ok = False
+            record.attempt = None
+            
+            if ok:
+                record.failures = 0
+                self._set_state(camera, record, CameraState.LIVE)
+                return
+            
+            record.failures += 1
+            record.next_attempt = now + self.backoff(record.failures)
+            if record.failures >= CAMERA_OFFLINE_AFTER:
+                self._set_state(camera, record, CameraState.OFFLINE)
+            return
+        
+        if self.manager.is_idle(camera.camera_id, now):
+            if camera.is_connected:
+                logger.info(f"Camera '{camera.name}' unused, closing stream")
+                camera.disconnect()
+            record.failures = 0
+            record.reported_failure = False
+            self._set_state(camera, record, CameraState.IDLE)
+            return
+        
+        if record.state == CameraState.IDLE:
+            self._set_state(camera, record, CameraState.CONNECTING)
+        
+        if camera.is_connected:
+            _, frame_time = camera.get_latest_frame()
+            stale = camera.is_grabbing and now - frame_time > CAMERA_STALE_AFTER
+            
+            if not (stale or record.reported_failure):
+                self._set_state(camera, record, CameraState.LIVE)
+                self._check_substream(camera, record)
+                return
+            
+            logger.warning(f"Camera '{camera.name}' stopped delivering frames, reconnecting")
+            record.next_attempt = 0.0
+        
+        record.reported_failure = False
+        if record.state == CameraState.LIVE:
+            self._set_state(camera, record, CameraState.DEGRADED)
+        
+        if now >= record.next_attempt and self._executor is not None:
+            record.attempt = self._executor.submit(self._attempt, camera)
+    
+    def _check_substream(self, camera: RTSPCamera, record: _SupervisedCamera):
+        """Reopen a dropped sub-stream that analytics are subscribed to, close an unused one."""
+        wanted = self.manager.update_sub_bus(camera)
+        substream = camera.substream
+        
+        if SUBSTREAM_IDLE_TIMEOUT and camera.close_idle_substream(SUBSTREAM_IDLE_TIMEOUT):
+            return
+        
+        if not wanted or not camera.substream_url or (substream is not None and substream.is_connected):
+            return
+        
+        if record.sub_attempt is not None and not record.sub_attempt.done():
+            return
+        
+        if self._executor is not None:
+            record.sub_attempt = self._executor.submit(camera.open_substream, self.deadline)
+    
+    def _attempt(self, camera: RTSPCamera) -> bool:
+        """Blocking (re)connection attempt, runs in the pool."""
+        camera.disconnect()
+        return camera.connect(self.deadline)
+    
+    def _set_state(self, camera: RTSPCamera, record: _SupervisedCamera, state: str):
+        """Record a state transition and mirror it into the database."""
+        if record.state == state:
+            return
+        
+        logger.info(f"Camera '{camera.name}' state: {record.state} -> {state}")
+        record.state = state
+        record.changed_at = time.time()
+        
+        db_status = STATE_DB_STATUS.get(state)
+        if db_status is None or db_status == record.db_status:
+            return
+        
+        try:
+            db.update_camera_status(camera.camera_id, db_status)
+            record.db_status = db_status
+        except Exception as e:
+            logger.error(f"Error updating status of camera {camera.camera_id}: {e}")
 
 
 class StreamManager:
@@ -11,9 +405,13 @@ class StreamManager:
     def __init__(self):
         """Initialize stream manager."""
         self.cameras: Dict[int, RTSPCamera] = {}
+        self.buses: Dict[Tuple[int, str], FrameBus] = {}
+        self.supervisor = CameraSupervisor(self)
+        self.ingest_pool = None  # IngestPool in process ingest mode
+        self.last_access: Dict[int, float] = {}
         logger.info("Stream Manager initialized")
     
-    def load_cameras_from_db(self):
+    def load_cameras_from_db(self, connect: bool = False):
         """Load all cameras from database and initialize them."""
         cameras_data = db.get_all_cameras()
         
@@ -21,9 +419,17 @@ class StreamManager:
             self.add_camera_from_data(cam_data)
         
         logger.info(f"Loaded {len(self.cameras)} cameras from database")
+        
+        if connect:
+            self.connect_all()
     
     def add_camera_from_data(self, cam_data: dict) -> Optional[RTSPCamera]:
         """Add camera from database record."""
+        if self.ingest_pool is not None:
+            camera = self.ingest_pool.add_camera(cam_data)
+            self.cameras[cam_data['id']] = camera
+            return camera
+        
         try:
             camera = RTSPCamera(
                 camera_id=cam_data['id'],
@@ -32,10 +438,12 @@ class StreamManager:
                 port=cam_data['port'],
                 username=cam_data['username'],
                 password=cam_data['password'],
-                camera_type=cam_data.get('camera_type', 'generic')
+                camera_type=cam_data.get('camera_type', 'generic'),
+                role='recording' if cam_data.get('recording_enabled', 1) else 'snapshot'
             )
             
             self.cameras[cam_data['id']] = camera
+            self.touch(cam_data['id'])
             logger.info(f"Added camera to manager: {cam_data['name']} (ID: {cam_data['id']})")
             return camera
         except Exception as e:
@@ -44,7 +452,8 @@ class StreamManager:
     
     def add_camera(self, camera_id: int, name: str = None, ip: str = None, 
                    port: int = 554, username: str = 'admin', password: str = '',
-                   camera_type: str = 'generic', rtsp_url: str = None) -> Optional[RTSPCamera]:
+                   camera_type: str = 'generic', rtsp_url: str = None,
+                   role: str = 'recording') -> Optional[RTSPCamera]:
         """Add a camera to the manager."""
         
         # If only camera_id provided, load from database
@@ -56,6 +465,13 @@ class StreamManager:
                 logger.error(f"Camera {camera_id} not found in database")
                 return None
         
+        if self.ingest_pool is not None:
+            return self.add_camera_from_data({
+                'id': camera_id, 'name': name, 'ip_address': ip, 'port': port,
+                'username': username, 'password': password, 'camera_type': camera_type,
+                'rtsp_url': rtsp_url, 'recording_enabled': role == 'recording'
+            })
+        
         camera = RTSPCamera(
             camera_id=camera_id,
             name=name,
@@ -63,7 +479,8 @@ class StreamManager:
             port=port,
             username=username,
             password=password,
-            camera_type=camera_type
+            camera_type=camera_type,
+            role=role
         )
         
         # Override RTSP URL if provided
@@ -71,11 +488,14 @@ class StreamManager:
             camera.rtsp_url = rtsp_url
         
         self.cameras[camera_id] = camera
+        self.touch(camera_id)
         logger.info(f"Added camera to manager: {name} (ID: {camera_id})")
         return camera
     
     def get_camera(self, camera_id: int) -> Optional[RTSPCamera]:
         """Get camera by ID. Loads from DB if not in memory."""
+        self.touch(camera_id)
+        
         if camera_id not in self.cameras:
             # Try to load from database
             cam_data = db.get_camera(camera_id)
@@ -96,26 +516,304 @@ class StreamManager:
         
         return camera
     
+    def touch(self, camera_id: int):
+        """Record a use of the camera (keeps it from being closed as idle)."""
+        self.last_access[camera_id] = time.time()
+    
+    def is_idle(self, camera_id: int, now: float = None) -> bool:
+        """Whether a camera is unused: no frame subscribers and no recent access."""
+        if not STREAM_IDLE_TIMEOUT:
+            return False
+        
+        camera = self.cameras.get(camera_id)
+        if camera is None or camera._frame_listeners:
+            return False
+        if camera.substream is not None and camera.substream._frame_listeners:
+            return False
+        
+        now = time.time() if now is None else now
+        return now - self.last_access.get(camera_id, 0.0) > STREAM_IDLE_TIMEOUT
+    
+    def prefetch(self, camera_ids: List[int]):
+        """
+        Warm up cameras the user is about to open (e.g. when a camera menu is shown).
+        
+        Idle cameras get an immediate connection attempt from the supervisor,
+        so by the time a camera is picked its stream is usually open.
+        """
+        for camera_id in camera_ids:
+            camera = self.get_camera(camera_id)
+            if camera is not None and not camera.is_connected and self.supervisor.is_running:
+                self.supervisor.request_connect(camera_id)
+    
+    def get_camera_state(self, camera_id: int) -> Optional[str]:
+        """Supervisor state of a camera (see CameraState), answered instantly."""
+        if self.ingest_pool is not None:
+            camera = self.cameras.get(camera_id)
+            return camera.state if camera else None
+        return self.supervisor.get_state(camera_id)
+    
+    def report_frame_failure(self, camera_id: int):
+        """Tell the supervisor a connected camera returned no frame."""
+        if self.ingest_pool is not None:
+            self.ingest_pool.send(camera_id, 'report_failure', camera_id)
+            return
+        self.supervisor.report_failure(camera_id)
+    
+    async def wait_for_camera(self, camera_id: int,
+                              timeout: float = CONNECT_DEADLINE) -> Optional[RTSPCamera]:
+        """
+        Get a connected camera from async code without blocking the event loop.
+        
+        A disconnected camera gets an immediate attempt from the supervisor
+        (skipping its backoff), which is awaited for up to ``timeout`` seconds.
+        
+        Returns:
+            Connected camera or None
+        """
+        camera = self.get_camera(camera_id)
+        
+        if camera is None:
+            return None
+        
+        if camera.is_connected:
+            return camera
+        
+        if not self.supervisor.is_running:
+            connected = await asyncio.to_thread(camera.connect, timeout)
+            return camera if connected else None
+        
+        self.supervisor.request_connect(camera_id)
+        status = self.supervisor.get_status(camera_id)
+        failures = status['failures'] if status else 0
+        deadline = time.time() + timeout
+        
+        while time.time() < deadline:
+            await asyncio.sleep(0.2)
+            
+            if camera.is_connected:
+                return camera
+            
+            status = self.supervisor.get_status(camera_id)
+            if status and status['failures'] > failures:
+                break
+        
+        return None
+    
+    def subscribe(self, camera_id: int, name: str, fps: Optional[float] = None,
+                  queue_size: int = 2, stream: str = 'main') -> Optional[FrameSubscription]:
+        """
+        Subscribe to a camera's frames.
+        
+        Each camera is decoded once by its grabber thread and fanned out to
+        all subscribers, each at its own rate (``fps=None`` for every frame).
+        On-demand readers (snapshots) should use ``get_frame()`` instead,
+        which reads the same shared mailbox.
+        
+        Analytics should pass ``stream='sub'`` to get the low-resolution
+        sub-stream; they are fed from the main stream while the camera has
+        none or it is (re)connecting, and move to the sub-stream once the
+        supervisor has it up. Recording stays on the main stream.
+        
+        Blocks while the camera connects: call it from a worker thread
+        (``asyncio.to_thread`` on the event loop).
+        """
+        camera = self.get_or_connect_camera(camera_id)
+        
+        if camera is None:
+            return None
+        
+        bus = self.buses.get((camera_id, stream))
+        if bus is None:
+            bus = FrameBus(camera)
+            self.buses[(camera_id, stream)] = bus
+        
+        subscription = FrameSubscription(camera_id, name, fps=fps, queue_size=queue_size, stream=stream)
+        bus.add(subscription)
+        if stream == 'sub':
+            self.update_sub_bus(camera)
+        
+        logger.info(f"'{name}' subscribed to camera {camera_id} {stream} stream (fps: {fps or 'full'})")
+        return subscription
+    
+    def update_sub_bus(self, camera: RTSPCamera) -> bool:
+        """
+        Feed a camera's sub-stream subscribers from the sub-stream while it
+        is connected and from the main stream otherwise.
+        
+        Returns whether anything is subscribed to the sub-stream, i.e. whether
+        it should be (re)opened.
+        """
+        bus = self.buses.get((camera.camera_id, 'sub'))
+        if bus is None or not bus.subscriptions:
+            return False
+        
+        substream = camera.substream
+        bus.set_source(substream if substream is not None and substream.is_connected else camera)
+        return True
+    
+    def unsubscribe(self, subscription: FrameSubscription):
+        """Cancel a frame subscription."""
+        bus = self.buses.get((subscription.camera_id, subscription.stream))
+        
+        if bus is None:
+            subscription.close()
+            return
+        
+        bus.remove(subscription)
+        logger.info(f"'{subscription.name}' unsubscribed from camera {subscription.camera_id}")
+    
     def remove_camera(self, camera_id: int):
         """Remove camera from manager."""
+        for stream in ('main', 'sub'):
+            bus = self.buses.pop((camera_id, stream), None)
+            if bus is not None:
+                bus.close()
+        
+        self.supervisor.forget(camera_id)
+        self.last_access.pop(camera_id, None)
+        
+        if self.ingest_pool is not None:
+            self.ingest_pool.remove_camera(camera_id)
+            self.cameras.pop(camera_id, None)
+            return
+        
         if camera_id in self.cameras:
             self.cameras[camera_id].disconnect()
             del self.cameras[camera_id]
             logger.info(f"Removed camera ID: {camera_id}")
     
-    def connect_all(self):
-        """Connect to all cameras."""
-        for camera in self.cameras.values():
-            camera.connect()
+    def connect_all(self, max_workers: int = CONNECT_CONCURRENCY,
+                    deadline: float = CONNECT_DEADLINE) -> dict:
+        """
+        Connect to all disconnected cameras in parallel.
+        
+        At most ``max_workers`` cameras connect at once and each attempt is
+        bounded by ``deadline`` seconds, so a few dead IPs cannot stall the
+        rest of the install.
+        
+        Returns:
+            {'connected': [ids], 'failed': [ids], 'timed_out': [ids], 'elapsed': seconds}
+        """
+        started = time.time()
+        summary = {'connected': [], 'failed': [], 'timed_out': [], 'elapsed': 0.0}
+        
+        pending = [camera for camera in self.cameras.values() if not camera.is_connected]
+        if not pending:
+            return summary
+        
+        workers = max(1, min(max_workers, len(pending)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cam-connect')
+        futures = {executor.submit(camera.connect, deadline): camera for camera in pending}
+        
+        # Every camera gets its own deadline once a worker picks it up
+        rounds = -(-len(pending) // workers)
+        done, not_done = wait(futures, timeout=deadline * rounds + 1)
+        
+        for future in done:
+            camera_id = futures[future].camera_id
+            try:
+                ok = future.result()
+            except Exception as e:
+                logger.error(f"Error connecting camera {camera_id}: {e}")
+                ok = False
+            summary['connected' if ok else 'failed'].append(camera_id)
+        
+        for future in not_done:
+            summary['timed_out'].append(futures[future].camera_id)
+        
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+        summary['elapsed'] = round(time.time() - started, 2)
+        logger.info(
+            f"Connected {len(summary['connected'])}/{len(pending)} cameras in {summary['elapsed']}s "
+            f"(failed: {len(summary['failed'])}, timed out: {len(summary['timed_out'])})"
+        )
+        return summary
+    
+    def start_supervisor(self):
+        """Connect and keep reconnecting all cameras in the background."""
+        if INGEST_MODE == 'process':
+            self.start_ingest_workers()
+            return
+        self.supervisor.start()
+    
+    def start_ingest_workers(self, workers: int = INGEST_WORKERS):
+        """
+        Move ingest of all cameras into worker processes.
+        
+        Each worker supervises its shard of cameras; ``self.cameras`` is
+        replaced by SharedFrameCamera proxies that read frames from the
+        workers' shared-memory rings, so callers keep the same API.
+        """
+        from camera.ingest_workers import IngestPool
+        
+        if self.ingest_pool is not None:
+            return
+        
+        cameras_data = [cam_data for cam_data in db.get_all_cameras() if cam_data['id'] in self.cameras]
+        self.disconnect_all()
+        
+        self.ingest_pool = IngestPool(workers)
+        self.ingest_pool.on_status = self.update_sub_bus
+        self.cameras = dict(self.ingest_pool.start(cameras_data))
     
     def disconnect_all(self):
         """Disconnect from all cameras."""
         for camera in self.cameras.values():
             camera.disconnect()
     
+    def get_camera_metrics(self) -> list:
+        """
+        Ingest metrics of all cameras for the metrics endpoint.
+        
+        Like get_all_camera_info() but without names, addresses or types,
+        and built from cached counters only (nothing reads a capture).
+        """
+        metrics_list = []
+        
+        for camera_id, camera in list(self.cameras.items()):
+            metrics = camera.get_metrics()
+            status = self.supervisor.get_status(camera_id)
+            if status is not None:
+                metrics.update(status)
+            subscribers = []
+            for stream in ('main', 'sub'):
+                bus = self.buses.get((camera_id, stream))
+                if bus is not None:
+                    subscribers += [sub.get_stats() for sub in bus.subscriptions]
+            if subscribers:
+                metrics['frames_dropped'] = sum(sub['dropped'] for sub in subscribers)
+            metrics_list.append(metrics)
+        
+        return metrics_list
+    
     def get_all_camera_info(self) -> list:
-        """Get info for all cameras."""
-        return [camera.get_info() for camera in self.cameras.values()]
+        """
+        Get info for all cameras.
+        
+        Each entry carries the supervisor state, rolling ingest metrics
+        (``metrics``: delivered fps, decode time percentiles, read failures,
+        reconnects, last-frame age) and frames dropped by slow subscribers.
+        """
+        info_list = []
+        
+        for camera_id, camera in self.cameras.items():
+            info = camera.get_info()
+            status = self.supervisor.get_status(camera_id)
+            if status is not None:
+                info.update(status)
+            subscribers = []
+            for stream in ('main', 'sub'):
+                bus = self.buses.get((camera_id, stream))
+                if bus is not None:
+                    subscribers += [sub.get_stats() for sub in bus.subscriptions]
+            if subscribers:
+                info['subscribers'] = subscribers
+                info['frames_dropped'] = sum(sub['dropped'] for sub in subscribers)
+            info_list.append(info)
+        
+        return info_list
     
     def test_camera_connection(self, camera_id: int) -> tuple:
         """Test camera connection and return (success, message)."""
@@ -128,6 +826,16 @@ class StreamManager:
     
     def cleanup(self):
         """Cleanup all cameras."""
+        self.supervisor.stop()
+        
+        if self.ingest_pool is not None:
+            self.ingest_pool.stop()
+            self.ingest_pool = None
+        
+        for bus in self.buses.values():
+            bus.close()
+        self.buses.clear()
+        
         self.disconnect_all()
         self.cameras.clear()
 
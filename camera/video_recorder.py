@@ -2,21 +2,66 @@
 Video recording and archive management system.
 Handles 24/7 recording, segmentation, and clip extraction.
 """
+import asyncio
 import os
+import shutil
+import subprocess
 import threading
 import time
+import uuid
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Callable, Any
 from database.models import db
+from camera.keyframe_index import build_index, index_path, load_index
+from camera.clip_cache import ClipCache, quantize_range
+from camera.packet_ring import PacketRing
+from camera.storage_ledger import StorageLedger
+from camera.archive_compactor import TMP_MARKER as COMPACTION_TMP_MARKER, ArchiveCompactor
+from camera.recording_policy import (
+    POLICY_MODES, MotionMonitor, RecordingPolicy, RingSegmentWriter, parse_schedule
+)
 from utils.logger import logger
-from utils.config import DATA_DIR
+from utils.config import (
+    DATA_DIR, FFMPEG_BINARY, RECORDING_BACKEND, CLIP_CONCURRENCY, EVENT_CLIPS_ENABLED,
+    EVENT_CLIP_PRE_ROLL, EVENT_CLIP_POST_ROLL, EVENT_CLIPS_MAX_MB, ARCHIVE_RETENTION_DAYS, RETENTION_INTERVAL,
+    get_rtsp_url
+)
 
 # Recording configuration
 SEGMENT_DURATION = 600  # 10 minutes per segment
-ARCHIVE_RETENTION_DAYS = 30
 VIDEO_DIR = os.path.join(DATA_DIR, 'videos')
 
+# ffmpeg only creates files, so date directories are created ahead of midnight
+DATE_DIR_CHECK_INTERVAL = 60  # seconds
+FFMPEG_STOP_TIMEOUT = 5  # seconds to finalize the open segment on stop
+CLIP_PROGRESS_INTERVAL = 1.0  # seconds between clip progress callbacks
+
+# Event clips: fragments of the in-memory ring are cut at most this long (keyframes
+# also start one), and a clip waits at most this much past its post-roll for video
+EVENT_FRAGMENT_DURATION = 1.0  # seconds
+EVENT_CLIP_MAX_DELAY = 15.0  # seconds
+# A later event only extends a pending clip while the clip still fits in the ring with this margin
+EVENT_CLIP_RING_MARGIN = 2.0  # seconds
+
+# Frame-accurate clip starts: encoder for the re-encoded head, and the bitstream
+# filter / sample entry that carry parameter sets in-band across the junction
+ACCURATE_CUT_CODECS = {
+    'h264': ('libx264', 'h264_mp4toannexb', 'avc3'),
+    'hevc': ('libx265', 'hevc_mp4toannexb', 'hev1'),
+}
+
+
+class _PendingEventClip:
+    """Window of an event clip waiting for its post-roll (its end may still move)."""
+    
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+        self.future = Future()
+        self.writing = False
+
 
 class VideoRecorder:
     """Handle video recording and archive management."""
@@ -24,6 +69,28 @@ class VideoRecorder:
     def __init__(self):
         self.is_recording: Dict[int, bool] = {}
         self.recording_threads: Dict[int, threading.Thread] = {}
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.last_closed: Dict[int, str] = {}  # newest cataloged segment per camera
+        self.clip_cache = ClipCache(os.path.join(VIDEO_DIR, 'clips'))
+        self.packet_rings: Dict[int, PacketRing] = {}  # recent encoded video per camera (ffmpeg backend)
+        self._event_clips: Dict[int, _PendingEventClip] = {}  # camera -> clip waiting for its post-roll
+        self._event_lock = threading.Lock()
+        self.event_clips_max_bytes = int(EVENT_CLIPS_MAX_MB * 1024 * 1024)  # 0 = no budget
+        self.policies: Dict[int, RecordingPolicy] = {}
+        self.motion_monitor = MotionMonitor()
+        self.storage = StorageLedger()  # archive size per camera / organization, kept up to date
+        self._retention_lock = threading.Lock()
+        self._last_retention = time.time()  # first sweep runs after the startup reconcile
+        self.compactor = ArchiveCompactor(self.storage, self._retention_lock, self._probe_segment)
+        
+        # ffmpeg is looked up once; clips and recording fall back without it
+        self.ffmpeg_available = shutil.which(FFMPEG_BINARY) is not None
+        self._clip_slots: Optional[asyncio.Semaphore] = None  # created on the bot's event loop
+        
+        self.backend = RECORDING_BACKEND
+        if self.backend == 'ffmpeg' and not self.ffmpeg_available:
+            logger.warning("ffmpeg not found, recording falls back to OpenCV re-encoding")
+            self.backend = 'opencv'
         
         # Ensure video directory exists
         os.makedirs(VIDEO_DIR, exist_ok=True)
@@ -36,9 +103,14 @@ class VideoRecorder:
         
         self.is_recording[camera_id] = True
         
+        policy = RecordingPolicy.from_camera(db.get_camera(camera_id))
+        self.policies[camera_id] = policy
+        if policy.mode == 'motion':
+            self.motion_monitor.watch(camera_id)
+        
         # Start recording thread
         thread = threading.Thread(
-            target=self._recording_loop,
+            target=self._ffmpeg_recording_loop if self.backend == 'ffmpeg' else self._recording_loop,
             args=(camera_id,),
             daemon=True
         )
@@ -54,18 +126,55 @@ class VideoRecorder:
             return True
         
         self.is_recording[camera_id] = False
+        self.packet_rings.pop(camera_id, None)
+        
+        process = self.processes.get(camera_id)
+        if process is not None:
+            self._stop_process(process)
         
         # Wait for thread to finish
         if camera_id in self.recording_threads:
             self.recording_threads[camera_id].join(timeout=5)
             del self.recording_threads[camera_id]
         
+        self.motion_monitor.unwatch(camera_id)
+        
         logger.info(f"Stopped recording for camera {camera_id}")
         return True
     
+    def set_recording_policy(self, camera_id: int, mode: str, schedule: str = None) -> bool:
+        """
+        Change a camera's recording policy ('continuous', 'motion' or 'scheduled').
+        
+        ``schedule`` lists the daily windows of the scheduled mode, e.g.
+        ``'08:00-18:00, 22:00-06:00'``. The policy is stored on the camera and
+        a running recording is restarted with it.
+        """
+        if mode not in POLICY_MODES:
+            raise ValueError(f"Unknown recording policy: {mode}")
+        parse_schedule(schedule)  # raises ValueError on a malformed schedule
+        
+        db.update_recording_policy(camera_id, mode, schedule)
+        
+        if self.is_recording.get(camera_id, False):
+            self.stop_recording(camera_id)
+            self.start_recording(camera_id)
+        return True
+    
+    def _save_skipped_span(self, camera_id: int, start_time: datetime, end_time: datetime):
+        """Catalog a span the recording policy left out."""
+        from database.v2_models import v2db
+        
+        try:
+            v2db.save_skipped_span(camera_id, start_time, end_time)
+            logger.debug(f"Camera {camera_id}: skipped {start_time} - {end_time}")
+        except Exception as e:
+            logger.error(f"Error saving skipped span: {e}")
+    
     def _recording_loop(self, camera_id: int):
         """Main recording loop for a camera."""
         from camera.stream_manager import stream_manager
+        from ai.motion_detector import motion_gate
         import cv2
         
         camera = db.get_camera(camera_id)
@@ -73,43 +182,68 @@ class VideoRecorder:
             logger.error(f"Camera {camera_id} not found")
             return
         
-        cam_client = stream_manager.get_camera(camera_id)
-        if not cam_client:
-            # Try to connect
-            rtsp_url = camera.get('rtsp_url') or f"rtsp://{camera['username']}:{camera['password']}@{camera['ip_address']}:{camera['port']}/stream1"
-            stream_manager.add_camera(camera_id, rtsp_url)
-            cam_client = stream_manager.get_camera(camera_id)
+        # Frames come from the camera's shared frame bus, so recording never
+        # competes with snapshot or analytics readers for the same capture
+        subscription = stream_manager.subscribe(camera_id, 'recorder', fps=None, queue_size=30)
         
-        if not cam_client:
+        if not subscription:
             logger.error(f"Could not connect to camera {camera_id}")
             self.is_recording[camera_id] = False
             return
         
+        policy = self.policies.get(camera_id) or RecordingPolicy()
         segment_start = datetime.now()
-        segment_path = self._get_segment_path(camera_id, segment_start)
+        segment_path = None
+        last_end = segment_start  # end of the last written video, for skipped spans
         
         # Video writer setup
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        fps = 15
+        fps = stream_manager.get_camera(camera_id).get_info().get('fps') or 15
         frame_size = (640, 480)  # Default, will be updated from first frame
         writer = None
+        motion_peak = None  # Highest motion gate score seen during the segment
         
         while self.is_recording.get(camera_id, False):
             try:
-                frame = cam_client.get_frame()
+                item = subscription.get(timeout=1.0)
                 
-                if frame is None:
-                    time.sleep(0.1)
+                if item is None:
+                    if not subscription.active:
+                        # Camera was removed from the stream manager
+                        self.is_recording[camera_id] = False
+                    continue
+                
+                frame, timestamp = item
+                
+                # Recording policy: close the segment while the camera is not to be recorded
+                if policy.mode == 'motion':
+                    self.motion_monitor.feed(camera_id, frame, timestamp)
+                if not policy.should_record(time.time(), self.motion_monitor.last_motion(camera_id)):
+                    if writer is not None:
+                        writer.release()
+                        writer = None
+                        last_end = datetime.now()
+                        self._save_segment_info(camera_id, segment_start, segment_path, motion_peak,
+                                                (last_end - segment_start).total_seconds())
+                        motion_peak = None
                     continue
                 
                 # Initialize writer with actual frame size
                 if writer is None:
+                    segment_start = datetime.now()
+                    if (segment_start - last_end).total_seconds() >= 1.0:
+                        self._save_skipped_span(camera_id, last_end, segment_start)
+                    segment_path = self._get_segment_path(camera_id, segment_start)
                     h, w = frame.shape[:2]
                     frame_size = (w, h)
                     writer = cv2.VideoWriter(segment_path, fourcc, fps, frame_size)
                 
                 writer.write(frame)
                 
+                motion = motion_gate.get_score(camera_id, max_age=5.0)
+                if motion is not None:
+                    motion_peak = max(motion_peak or 0.0, motion.score)
+                
                 # Check if segment duration exceeded
                 if (datetime.now() - segment_start).total_seconds() >= SEGMENT_DURATION:
                     # Close current segment
@@ -117,25 +251,263 @@ class VideoRecorder:
                         writer.release()
                     
                     # Save segment info to database
-                    self._save_segment_info(camera_id, segment_start, segment_path)
+                    self._save_segment_info(camera_id, segment_start, segment_path, motion_peak,
+                                            (datetime.now() - segment_start).total_seconds())
+                    motion_peak = None
                     
                     # Start new segment
-                    segment_start = datetime.now()
+                    segment_start = last_end = datetime.now()
                     segment_path = self._get_segment_path(camera_id, segment_start)
                     writer = cv2.VideoWriter(segment_path, fourcc, fps, frame_size)
                 
-                time.sleep(1.0 / fps)
-                
             except Exception as e:
                 logger.error(f"Recording error for camera {camera_id}: {e}")
                 time.sleep(1)
         
         # Cleanup
+        stream_manager.unsubscribe(subscription)
+        
         if writer:
             writer.release()
         
-        # Save final segment
-        self._save_segment_info(camera_id, segment_start, segment_path)
+            # Save final segment
+            self._save_segment_info(camera_id, segment_start, segment_path, motion_peak,
+                                    (datetime.now() - segment_start).total_seconds())
+        elif (datetime.now() - last_end).total_seconds() >= 1.0:
+            self._save_skipped_span(camera_id, last_end, datetime.now())
+    
+    def _ffmpeg_recording_loop(self, camera_id: int):
+        """
+        Record with ffmpeg's segment muxer, copying the RTSP stream as is.
+        
+        Nothing is decoded or re-encoded, so recording costs almost no CPU
+        and keeps the camera's own quality and timestamps. Segments use the
+        same ``<camera>/<date>/<HH-MM-SS>.mp4`` layout as the OpenCV loop.
+        ffmpeg reports each finished segment on stdout, which is where
+        segments get registered. The process is restarted with backoff
+        whenever it exits.
+        
+        Cameras with a motion or scheduled policy get no segment muxer: ffmpeg
+        only feeds the packet ring, and a RingSegmentWriter copies the spans
+        the policy keeps (with pre-roll) from the ring into segments.
+        """
+        camera = db.get_camera(camera_id)
+        if not camera:
+            logger.error(f"Camera {camera_id} not found")
+            self.is_recording[camera_id] = False
+            return
+        
+        url = camera.get('rtsp_url') or get_rtsp_url(
+            camera.get('camera_type') or 'generic', camera['ip_address'], camera['port'],
+            camera['username'], camera['password']
+        )
+        
+        policy = self.policies.get(camera_id) or RecordingPolicy()
+        ring = writer = None
+        if not policy.continuous:
+            ring = self.packet_rings.setdefault(camera_id, PacketRing(camera_id))
+            writer = RingSegmentWriter(
+                camera_id, ring, policy,
+                last_motion=lambda: self.motion_monitor.last_motion(camera_id),
+                segment_path=lambda start_time: self._get_segment_path(camera_id, start_time),
+                on_segment=lambda start_time, file_path, duration: self._save_segment_info(
+                    camera_id, start_time, file_path, self._motion_peak(camera_id, start_time, duration), duration),
+                on_skipped=lambda start_time, end_time: self._save_skipped_span(camera_id, start_time, end_time),
+                segment_duration=SEGMENT_DURATION
+            )
+            ring.listeners.append(writer)
+        
+        try:
+            self._run_ffmpeg_recorder(camera_id, url, policy.continuous)
+        finally:
+            if writer is not None:
+                ring.listeners.remove(writer)
+                writer.close()
+    
+    def _run_ffmpeg_recorder(self, camera_id: int, url: str, segments: bool):
+        """Keep ffmpeg running for a camera while it is recording, restarting it with backoff."""
+        from camera.stream_manager import stream_manager
+        
+        failures = 0
+        
+        while self.is_recording.get(camera_id, False):
+            self._ensure_date_dirs(camera_id)
+            started = time.time()
+            
+            process = self._start_segment_process(camera_id, url, segments)
+            if process is not None:
+                self.processes[camera_id] = process
+                reader = threading.Thread(
+                    target=self._read_segment_list,
+                    args=(camera_id, process),
+                    name=f'recorder-{camera_id}-segments',
+                    daemon=True
+                )
+                reader.start()
+                
+                next_dir_check = time.time() + DATE_DIR_CHECK_INTERVAL
+                while process.poll() is None and self.is_recording.get(camera_id, False):
+                    try:
+                        process.wait(timeout=1)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    if time.time() >= next_dir_check:
+                        self._ensure_date_dirs(camera_id)
+                        next_dir_check = time.time() + DATE_DIR_CHECK_INTERVAL
+                
+                self._stop_process(process)
+                reader.join(timeout=FFMPEG_STOP_TIMEOUT)
+                self.processes.pop(camera_id, None)
+            
+            if not self.is_recording.get(camera_id, False):
+                break
+            
+            # A run that lasted a whole segment was healthy, so start the backoff over
+            failures = 1 if time.time() - started >= SEGMENT_DURATION else failures + 1
+            delay = stream_manager.supervisor.backoff(failures)
+            exit_code = process.returncode if process is not None else None
+            logger.warning(f"ffmpeg recorder for camera {camera_id} exited ({exit_code}), "
+                           f"restarting in {delay:.1f}s")
+            
+            deadline = time.time() + delay
+            while time.time() < deadline and self.is_recording.get(camera_id, False):
+                time.sleep(0.5)
+    
+    def _start_segment_process(self, camera_id: int, url: str,
+                               segments: bool = True) -> Optional[subprocess.Popen]:
+        """
+        Start ffmpeg writing 10-minute stream-copied segments of a camera.
+        
+        With EVENT_CLIPS_ENABLED (or ``segments=False``, when segments are
+        cut from the ring instead) the same packets also go, as fragmented
+        MP4, to a pipe that feeds the camera's packet ring.
+        """
+        pattern = os.path.join(VIDEO_DIR, str(camera_id), '%Y-%m-%d', '%H-%M-%S.mp4')
+        
+        command = [FFMPEG_BINARY, '-hide_banner', '-nostats', '-loglevel', 'error']
+        if url.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp', '-timeout', str(10_000_000)]
+        command += ['-i', url]
+        if segments:
+            command += [
+                '-map', '0:v:0', '-an', '-c', 'copy',
+                '-f', 'segment', '-segment_time', str(SEGMENT_DURATION),
+                '-reset_timestamps', '1', '-strftime', '1',
+                # Fragmented MP4 keeps the open segment playable if ffmpeg dies
+                '-segment_format_options', 'movflags=+frag_keyframe+empty_moov+default_base_moof',
+                '-segment_list', 'pipe:1', '-segment_list_type', 'csv',
+                pattern
+            ]
+        
+        ring_read = ring_write = None
+        if EVENT_CLIPS_ENABLED or not segments:
+            ring_read, ring_write = os.pipe()
+            command += [
+                '-map', '0:v:0', '-an', '-c', 'copy', '-f', 'mp4',
+                '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                '-frag_duration', str(int(EVENT_FRAGMENT_DURATION * 1_000_000)),
+                '-flush_packets', '1',
+                f'pipe:{ring_write}'
+            ]
+        
+        try:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                pass_fds=(ring_write,) if ring_write is not None else ()
+            )
+        except OSError as e:
+            logger.error(f"Could not start ffmpeg recorder for camera {camera_id}: {e}")
+            if ring_read is not None:
+                os.close(ring_read)
+            return None
+        finally:
+            if ring_write is not None:
+                os.close(ring_write)
+        
+        if ring_read is not None:
+            ring = self.packet_rings.setdefault(camera_id, PacketRing(camera_id))
+            threading.Thread(
+                target=ring.read_from,
+                args=(os.fdopen(ring_read, 'rb'),),
+                name=f'recorder-{camera_id}-ring',
+                daemon=True
+            ).start()
+        
+        return process
+    
+    def _stop_process(self, process: subprocess.Popen):
+        """Ask ffmpeg to finish the open segment ('q'), kill it if it hangs."""
+        if process.poll() is not None:
+            return
+        
+        try:
+            process.stdin.write(b'q')
+            process.stdin.flush()
+            process.wait(timeout=FFMPEG_STOP_TIMEOUT)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+    
+    def _read_segment_list(self, camera_id: int, process: subprocess.Popen):
+        """Register segments as ffmpeg reports them ('name,start,end' CSV lines)."""
+        for raw_line in iter(process.stdout.readline, b''):
+            line = raw_line.decode(errors='replace').strip()
+            segment = self._parse_segment_line(camera_id, line)
+            
+            if segment is None:
+                if line:
+                    logger.warning(f"ffmpeg recorder {camera_id}: {line}")
+                continue
+            
+            # Keep draining the pipe whatever happens, a full pipe would stall ffmpeg
+            try:
+                start_time, file_path, duration = segment
+                self._save_segment_info(camera_id, start_time, file_path,
+                                        self._motion_peak(camera_id, start_time, duration), duration)
+            except Exception as e:
+                logger.error(f"Error registering segment of camera {camera_id}: {e}")
+    
+    def _parse_segment_line(self, camera_id: int, line: str, now: datetime = None) -> Optional[tuple]:
+        """(start_time, file_path, duration) of a segment list line, None for other output."""
+        parts = line.rsplit(',', 2)
+        if len(parts) != 3 or not parts[0].endswith('.mp4'):
+            return None
+        
+        try:
+            filename = os.path.basename(parts[0].strip('"'))
+            duration = float(parts[2]) - float(parts[1])
+            clock = datetime.strptime(filename[:-4], '%H-%M-%S').time()
+        except ValueError:
+            return None
+        
+        # The list only has the file name; the segment started today or, across midnight, yesterday
+        now = now or datetime.now()
+        for day in (now.date(), (now - timedelta(seconds=duration + 60)).date()):
+            file_path = os.path.join(VIDEO_DIR, str(camera_id), day.strftime('%Y-%m-%d'), filename)
+            if os.path.exists(file_path):
+                return datetime.combine(day, clock), file_path, duration
+        
+        return None
+    
+    def _motion_peak(self, camera_id: int, start_time: datetime, duration: float) -> Optional[float]:
+        """Highest motion gate score seen during a segment."""
+        from ai.motion_detector import motion_gate
+        
+        start = start_time.timestamp()
+        scores = [
+            score for timestamp, score in motion_gate.get_history(camera_id, seconds=duration + 60)
+            if start <= timestamp <= start + duration
+        ]
+        return max(scores) if scores else None
+    
+    def _ensure_date_dirs(self, camera_id: int):
+        """Create today's and tomorrow's directories for ffmpeg's strftime paths."""
+        now = datetime.now()
+        for day in (now, now + timedelta(days=1)):
+            os.makedirs(os.path.join(VIDEO_DIR, str(camera_id), day.strftime('%Y-%m-%d')), exist_ok=True)
     
     def _get_segment_path(self, camera_id: int, timestamp: datetime) -> str:
         """Generate path for video segment."""
@@ -145,35 +517,156 @@ class VideoRecorder:
         filename = f"{timestamp.strftime('%H-%M-%S')}.mp4"
         return os.path.join(date_dir, filename)
     
-    def _save_segment_info(self, camera_id: int, start_time: datetime, file_path: str):
-        """Save segment information to database."""
+    def _probe_segment(self, file_path: str) -> Dict:
+        """Frame count, codec, size and duration from a segment's container header."""
+        import cv2
+        
+        cap = cv2.VideoCapture(file_path)
+        try:
+            if not cap.isOpened():
+                return {}
+            
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+            
+            return {
+                'frame_count': frame_count or None,
+                'codec': fourcc.to_bytes(4, 'little').decode(errors='replace').strip('\x00 ') or None,
+                'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None,
+                'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None,
+                'duration': frame_count / fps if frame_count and fps else None,
+            }
+        finally:
+            cap.release()
+    
+    def _save_segment_info(self, camera_id: int, start_time: datetime, file_path: str,
+                           motion_peak: float = None, duration: float = None):
+        """
+        Register a closed segment in the catalog (``video_archives``).
+        
+        ``duration`` is the segment's real length in seconds; without it the
+        container's frame count / fps is used. ``motion_peak`` is the highest
+        motion gate score seen during the segment.
+        """
         try:
-            if os.path.exists(file_path):
-                size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                duration = SEGMENT_DURATION
+            if not os.path.exists(file_path):
+                return
                 
-                # Save to database (using v2db if available)
-                try:
-                    from database.v2_models import v2db
-                    v2db.save_video_archive(
-                        camera_id=camera_id,
-                        start_time=start_time,
-                        duration=duration,
-                        file_path=file_path,
-                        size_mb=size_mb
-                    )
-                except:
-                    pass
+            from database.v2_models import v2db
                 
-                logger.debug(f"Saved segment: {file_path} ({size_mb:.2f} MB)")
+            size = os.path.getsize(file_path)
+            size_mb = size / (1024 * 1024)
+            probe = self._probe_segment(file_path)
+            duration = duration or probe.get('duration') or SEGMENT_DURATION
+            previous_mb = v2db.get_archive_size(file_path)
+            
+            v2db.save_video_archive(
+                camera_id=camera_id,
+                start_time=start_time,
+                duration=duration,
+                file_path=file_path,
+                size_mb=size_mb,
+                frame_count=probe.get('frame_count'),
+                codec=probe.get('codec'),
+                width=probe.get('width'),
+                height=probe.get('height'),
+                motion_peak=motion_peak
+            )
+            
+            self.last_closed[camera_id] = file_path
+            self.storage.add(camera_id, start_time, size,
+                             None if previous_mb is None else int(round(previous_mb * 1024 * 1024)))
+            self._maybe_enforce_retention(camera_id)
+            
+            # Sidecar keyframe index so archive seeks need not decode whole GOPs
+            build_index(file_path)
+            
+            logger.debug(f"Saved segment: {file_path} ({size_mb:.2f} MB, {duration:.1f}s, "
+                         f"motion peak: {motion_peak})")
         except Exception as e:
             logger.error(f"Error saving segment info: {e}")
     
-    def extract_clip(self, camera_id: int, start_time: datetime, end_time: datetime) -> Optional[str]:
-        """Extract video clip from archive for given time range using ffmpeg."""
+    def _segment_start(self, file_path: str) -> Optional[datetime]:
+        """Start time encoded in a segment path (<date>/<HH-MM-SS>.mp4)."""
         try:
-            import subprocess
-            import shutil
+            date_str = os.path.basename(os.path.dirname(file_path))
+            time_str = os.path.basename(file_path)[:-4]
+            return datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H-%M-%S')
+        except ValueError:
+            return None
+    
+    def reconcile_catalog(self) -> Dict[str, int]:
+        """
+        Bring the segment catalog in line with the files on disk.
+        
+        Segment files without a record (written before the catalog existed or
+        while the bot was down) are probed and registered; records whose file
+        is gone are dropped. Meant to run once at startup.
+        
+        Returns:
+            {'added': n, 'removed': n}
+        """
+        from database.v2_models import v2db
+        
+        cataloged = v2db.get_archive_paths()
+        open_segments = {self._open_segment(camera_id) for camera_id in list(self.is_recording)}
+        added = 0
+        
+        for camera_dir in os.listdir(VIDEO_DIR):
+            camera_path = os.path.join(VIDEO_DIR, camera_dir)
+            if not camera_dir.isdigit() or not os.path.isdir(camera_path):
+                continue
+            
+            for date_dir in sorted(os.listdir(camera_path)):
+                date_path = os.path.join(camera_path, date_dir)
+                if not os.path.isdir(date_path):
+                    continue
+                
+                for filename in sorted(os.listdir(date_path)):
+                    file_path = os.path.join(date_path, filename)
+                    if COMPACTION_TMP_MARKER in filename:
+                        os.remove(file_path)  # compaction interrupted by a shutdown
+                        continue
+                    if not filename.endswith('.mp4') or file_path in cataloged or file_path in open_segments:
+                        continue
+                    
+                    start_time = self._segment_start(file_path)
+                    if start_time is not None:
+                        self._save_segment_info(int(camera_dir), start_time, file_path)
+                        added += 1
+        
+        missing = [archive_id for path, archive_id in cataloged.items() if not os.path.exists(path)]
+        if missing:
+            v2db.delete_video_archives(missing)
+            self.storage.reload()
+        
+        logger.info(f"Segment catalog reconciled: {added} added, {len(missing)} removed")
+        return {'added': added, 'removed': len(missing)}
+    
+    def reconcile_catalog_in_background(self) -> threading.Thread:
+        """Run reconcile_catalog() and then retention in a daemon thread so startup is not delayed."""
+        def run():
+            self.reconcile_catalog()
+            self.cleanup_old_archives()
+        
+        thread = threading.Thread(target=run, name='segment-catalog', daemon=True)
+        thread.start()
+        return thread
+    
+    def extract_clip(self, camera_id: int, start_time: datetime, end_time: datetime,
+                     accurate: bool = False) -> Optional[str]:
+        """
+        Extract video clip from archive for given time range using ffmpeg.
+        
+        The range is widened to whole CLIP_CACHE_QUANTUM steps and the clip is
+        served from the clip cache when the same range was extracted before.
+        Segments are stream-copied and trimmed at keyframes; with ``accurate``
+        the partial GOP at the start is re-encoded so the clip starts on the
+        exact frame. Blocking - async handlers use extract_clip_async().
+        """
+        try:
+            start_time, end_time = quantize_range(start_time, end_time)
             
             # Find relevant segment files
             segments = self._find_segments(camera_id, start_time, end_time)
@@ -182,201 +675,653 @@ class VideoRecorder:
                 logger.warning(f"No segments found for camera {camera_id} in time range")
                 return None
             
-            # Output path
-            clip_dir = os.path.join(VIDEO_DIR, 'clips')
-            os.makedirs(clip_dir, exist_ok=True)
+            return self.clip_cache.get_or_create(
+                camera_id, start_time, end_time, segments,
+                lambda clip_path: self._render_clip(segments, start_time, end_time, clip_path, accurate),
+                variant='accurate' if accurate else ''
+            )
             
-            clip_filename = f"clip_{camera_id}_{start_time.strftime('%Y%m%d_%H%M%S')}.mp4"
-            clip_path = os.path.join(clip_dir, clip_filename)
+        except Exception as e:
+            logger.error(f"Error extracting clip: {e}")
+            return None
+    
+    async def extract_clip_async(self, camera_id: int, start_time: datetime, end_time: datetime,
+                                 progress: Callable[[float], Any] = None,
+                                 accurate: bool = False) -> Optional[str]:
+        """
+        extract_clip() for async handlers.
+        
+        ffmpeg runs as an asyncio subprocess, at most CLIP_CONCURRENCY at a
+        time. ``progress(fraction)`` (plain or async) is called about once a
+        second while ffmpeg works. Cancelling the awaiting task stops ffmpeg
+        unless another request is waiting for the same clip.
+        """
+        start_time, end_time = quantize_range(start_time, end_time)
+        
+        segments = await asyncio.to_thread(self._find_segments, camera_id, start_time, end_time)
+        
+        if not segments:
+            logger.warning(f"No segments found for camera {camera_id} in time range")
+            return None
+        
+        async def build(clip_path: str) -> bool:
+            if self._clip_slots is None:
+                self._clip_slots = asyncio.Semaphore(CLIP_CONCURRENCY)
+            async with self._clip_slots:
+                return await self._render_clip_async(segments, start_time, end_time, clip_path,
+                                                     accurate, progress)
+        
+        try:
+            return await self.clip_cache.get_or_create_async(camera_id, start_time, end_time, segments, build,
+                                                             variant='accurate' if accurate else '')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error extracting clip: {e}")
+            return None
+    
+    def _clip_commands(self, segments: List[str], start_time: datetime, end_time: datetime,
+                       clip_path: str, accurate: bool = False) -> Optional[List[List[str]]]:
+        """
+        ffmpeg commands writing the clip, run in order (None if a segment has no start time).
+        
+        Segments are joined by the concat demuxer from a list at
+        ``<clip_path>.txt`` (written here) whose inpoint/outpoint directives
+        cut the head of the first and the tail of the last segment, so the
+        clip is as long as the requested range however many segments it
+        spans. The inpoint is moved back to the keyframe before it, where a
+        stream copy can start cleanly. With ``accurate`` the frames between
+        the requested start and the next keyframe are re-encoded into
+        ``<clip_path>.head.mp4`` instead and the copy starts at that keyframe.
+        """
+        entries = []
+        for i, segment_path in enumerate(segments):
+            seg_start = self._segment_start(segment_path)
+            if seg_start is None:
+                return None
             
-            # Check if ffmpeg is available
-            ffmpeg_available = False
-            try:
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-                ffmpeg_available = True
-            except:
-                logger.warning("ffmpeg not found, using simple copy")
-            
-            if len(segments) == 1:
-                # Single segment - trim if ffmpeg available
-                segment_path = segments[0]
-                
-                if ffmpeg_available:
-                    # Parse segment start time from filename
-                    try:
-                        seg_filename = os.path.basename(segment_path)
-                        time_str = seg_filename.replace('.mp4', '')
-                        date_str = os.path.basename(os.path.dirname(segment_path))
-                        seg_start = datetime.strptime(f"{date_str} {time_str}", '%Y-%m-%d %H-%M-%S')
-                        
-                        # Calculate offset
-                        offset_seconds = max(0, (start_time - seg_start).total_seconds())
-                        duration_seconds = (end_time - start_time).total_seconds()
-                        
-                        # Trim with ffmpeg
-                        cmd = [
-                            'ffmpeg', '-y',
-                            '-ss', str(offset_seconds),
-                            '-i', segment_path,
-                            '-t', str(duration_seconds),
-                            '-c', 'copy',
-                            clip_path
-                        ]
-                        subprocess.run(cmd, capture_output=True, check=True)
-                        logger.info(f"Extracted clip with ffmpeg: {clip_path}")
-                        return clip_path
-                    except Exception as e:
-                        logger.warning(f"ffmpeg trim failed: {e}, falling back to copy")
-                
-                # Fallback: just copy
-                shutil.copy(segment_path, clip_path)
-                return clip_path
+            inpoint = (start_time - seg_start).total_seconds() if i == 0 else 0.0
+            outpoint = (end_time - seg_start).total_seconds() if i == len(segments) - 1 else None
+            entries.append([segment_path, max(0.0, inpoint), outpoint])
+
+        commands = []
+        head_codec = None
+        lead = 0.0  # seconds the clip starts before start_time
+        first_path, inpoint, outpoint = entries[0]
+        index = load_index(first_path) if inpoint > 0 else None
+
+        if index is not None:
+            _, key_time = index.keyframe_before(inpoint)
+            later = index.keyframe_times[index.keyframe_times > inpoint]
+            next_key = float(later[0]) if len(later) else None
             
+            if accurate and inpoint - key_time > 0.001 and index.codec in ACCURATE_CUT_CODECS:
+                head_codec = index.codec
+                head_end = next_key if outpoint is None or next_key is None else min(next_key, outpoint)
+                head_command = [FFMPEG_BINARY, '-y', '-ss', str(inpoint), '-i', first_path]
+                if head_end is not None:
+                    head_command += ['-t', str(head_end - inpoint)]
+                head_command += ['-map', '0:v:0', '-an', '-c:v', ACCURATE_CUT_CODECS[head_codec][0],
+                                 '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p', f"{clip_path}.head.mp4"]
+                commands.append(head_command)
+
+                # The copied part starts at the next keyframe (or is not needed at all)
+                if head_end is None or head_end == outpoint:
+                    entries.pop(0)
+                else:
+                    entries[0][1] = next_key
+                entries.insert(0, [f"{clip_path}.head.mp4", 0.0, None])
             else:
-                # Multiple segments - concatenate with ffmpeg
-                if ffmpeg_available:
-                    try:
-                        # Create concat file list
-                        concat_list_path = os.path.join(clip_dir, f"concat_{camera_id}.txt")
-                        with open(concat_list_path, 'w') as f:
-                            for seg in segments:
-                                f.write(f"file '{seg}'\n")
-                        
-                        # Concatenate with ffmpeg
-                        cmd = [
-                            'ffmpeg', '-y',
-                            '-f', 'concat',
-                            '-safe', '0',
-                            '-i', concat_list_path,
-                            '-c', 'copy',
-                            clip_path
-                        ]
-                        subprocess.run(cmd, capture_output=True, check=True)
-                        
-                        # Clean up concat list
-                        os.remove(concat_list_path)
-                        
-                        logger.info(f"Concatenated {len(segments)} segments to: {clip_path}")
-                        return clip_path
-                    except Exception as e:
-                        logger.warning(f"ffmpeg concat failed: {e}, falling back to first segment")
+                entries[0][1] = key_time
+                lead = inpoint - key_time
+        
+        with open(f"{clip_path}.txt", 'w') as f:
+            for path, entry_inpoint, entry_outpoint in entries:
+                f.write(f"file '{path}'\n")
+                if entry_inpoint > 0:
+                    f.write(f"inpoint {entry_inpoint:.6f}\n")
+                if entry_outpoint is not None:
+                    f.write(f"outpoint {entry_outpoint:.6f}\n")
+        
+        # outpoint is compared with decode timestamps; -t also cuts the B-frames reordered past it
+        duration = (end_time - start_time).total_seconds() + lead
+        concat_command = [FFMPEG_BINARY, '-y', '-f', 'concat', '-safe', '0', '-i', f"{clip_path}.txt",
+                          '-t', f"{duration:.3f}"]
+        if head_codec is not None:
+            # Re-encoded head and copied body have different parameter sets: keep them in-band
+            _, bitstream_filter, tag = ACCURATE_CUT_CODECS[head_codec]
+            concat_command += ['-map', '0:v:0', '-c', 'copy', '-bsf:v', bitstream_filter, '-tag:v', tag]
+        else:
+            concat_command += ['-c', 'copy']
+        commands.append(concat_command + [clip_path])
+        
+        return commands
+    
+    def _remove_clip_temp(self, clip_path: str):
+        for suffix in ('.txt', '.head.mp4'):
+            if os.path.exists(clip_path + suffix):
+                os.remove(clip_path + suffix)
+
+    def _copy_fallback(self, segments: List[str], clip_path: str) -> bool:
+        """Without ffmpeg: the first segment as is."""
+        if segments and os.path.exists(segments[0]):
+            shutil.copy(segments[0], clip_path)
+            return True
+        return False
+
+    def _render_clip(self, segments: List[str], start_time: datetime,
+                     end_time: datetime, clip_path: str, accurate: bool = False) -> bool:
+        """
+        Write the clip for ``segments`` to ``clip_path``.
+        
+        A failed ffmpeg run fails the clip: copying whole segments instead
+        would hand the user up to SEGMENT_DURATION of the wrong video.
+        """
+        if not self.ffmpeg_available:
+            return self._copy_fallback(segments, clip_path)
+        
+        try:
+            commands = self._clip_commands(segments, start_time, end_time, clip_path, accurate)
+            if commands is None:
+                logger.warning(f"Clip not cut: a segment has no start time ({segments})")
+                return False
+            
+            for command in commands:
+                subprocess.run(command, capture_output=True, check=True)
+            logger.info(f"Extracted clip from {len(segments)} segment(s): {clip_path}")
+            return True
+        except Exception as e:
+            logger.warning(f"ffmpeg clip failed: {e}")
+            return False
+        finally:
+            self._remove_clip_temp(clip_path)
+    
+    async def _render_clip_async(self, segments: List[str], start_time: datetime, end_time: datetime,
+                                 clip_path: str, accurate: bool = False,
+                                 progress: Callable[[float], Any] = None) -> bool:
+        """_render_clip() with ffmpeg as an asyncio subprocess."""
+        if not self.ffmpeg_available:
+            return await asyncio.to_thread(self._copy_fallback, segments, clip_path)
+        
+        try:
+            commands = await asyncio.to_thread(self._clip_commands, segments, start_time, end_time,
+                                               clip_path, accurate)
+            if commands is None:
+                logger.warning(f"Clip not cut: a segment has no start time ({segments})")
+                return False
+            
+            duration = (end_time - start_time).total_seconds()
+            for i, command in enumerate(commands):
+                last = i == len(commands) - 1
+                if not await self._run_ffmpeg(command, duration, progress if last else None):
+                    return False
+            
+            logger.info(f"Extracted clip from {len(segments)} segment(s): {clip_path}")
+            return True
+        except OSError as e:
+            logger.warning(f"ffmpeg clip failed: {e}")
+            return False
+        finally:
+            self._remove_clip_temp(clip_path)
+    
+    async def _run_ffmpeg(self, command: List[str], duration: float,
+                          progress: Callable[[float], Any] = None) -> bool:
+        """Run ffmpeg, reporting ``-progress`` output as a fraction of ``duration``."""
+        command = command[:1] + ['-v', 'error', '-nostats', '-progress', 'pipe:1'] + command[1:]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        try:
+            reported_at = 0.0
+            async for line in process.stdout:
+                key, _, value = line.decode(errors='replace').strip().partition('=')
+                
+                if progress is None or key != 'out_time_us' or not value.isdigit() or duration <= 0:
+                    continue
+                if time.monotonic() - reported_at < CLIP_PROGRESS_INTERVAL:
+                    continue
                 
-                # Fallback: just copy first segment
-                if segments and os.path.exists(segments[0]):
-                    shutil.copy(segments[0], clip_path)
-                    return clip_path
+                reported_at = time.monotonic()
+                try:
+                    result = progress(min(1.0, int(value) / 1e6 / duration))
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.debug(f"Clip progress callback failed: {e}")
             
+            errors = await process.stderr.read()
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            # Request abandoned - don't leave ffmpeg running
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        
+        if returncode != 0:
+            logger.warning(f"ffmpeg clip failed ({returncode}): {errors.decode(errors='replace')[-300:]}")
+            return False
+        return True
+    
+    def capture_event_clip(self, camera_id: int, timestamp: datetime = None,
+                           pre_roll: float = EVENT_CLIP_PRE_ROLL,
+                           post_roll: float = EVENT_CLIP_POST_ROLL) -> Optional[Future]:
+        """
+        Write a clip around an event from the camera's packet ring, in the background.
+        
+        Returns at once. The Future resolves to the clip path (None on failure)
+        as soon as the post-roll has been recorded, seconds after the event
+        rather than after the segment closes. An event inside the window of a
+        clip still waiting for its post-roll shares that clip and extends its
+        post-roll, as long as the whole clip still fits in the ring; otherwise
+        it gets a clip of its own. None if the camera has no ring (not
+        recording, OpenCV backend or EVENT_CLIPS_ENABLED off).
+        """
+        ring = self.packet_rings.get(camera_id)
+        if ring is None:
             return None
+        
+        event_time = (timestamp or datetime.now()).timestamp()
+        
+        with self._event_lock:
+            pending = self._event_clips.get(camera_id)
+            if (pending is not None and not pending.writing and event_time <= pending.end
+                    and event_time + post_roll - pending.start <= ring.seconds - EVENT_CLIP_RING_MARGIN):
+                pending.end = max(pending.end, event_time + post_roll)
+                return pending.future
             
+            clip = _PendingEventClip(event_time - pre_roll, event_time + post_roll)
+            self._event_clips[camera_id] = clip
+        
+        threading.Thread(
+            target=self._write_event_clip,
+            args=(camera_id, ring, clip),
+            name=f'event-clip-{camera_id}',
+            daemon=True
+        ).start()
+        return clip.future
+    
+    def _write_event_clip(self, camera_id: int, ring: PacketRing, clip: _PendingEventClip):
+        """Wait for the post-roll (extended by later events), then write the ring's video of the window."""
+        clip_path = None
+        
+        try:
+            while True:
+                end = clip.end
+                ring.wait_until(end, timeout=end - time.time() + EVENT_CLIP_MAX_DELAY)
+                with self._event_lock:
+                    if clip.end == end:
+                        clip.writing = True
+                        break
+            
+            start = clip.start
+            started = datetime.fromtimestamp(start)
+            # Clips already on disk are counted before this one joins the ledger
+            self.storage.ensure_event_clips(self._scan_event_clips)
+            date_dir = os.path.join(VIDEO_DIR, 'events', started.strftime('%Y-%m-%d'))
+            os.makedirs(date_dir, exist_ok=True)
+            # Clips of one camera can start within the same second
+            path = os.path.join(date_dir, f"{camera_id}_{started.strftime('%H-%M-%S')}_{uuid.uuid4().hex[:6]}.mp4")
+            
+            fragmented_path = path + '.frag'
+            if ring.write(fragmented_path, start, end):
+                # Regular MP4 (duration in the header, timestamps from zero) for players and Telegram
+                remuxed = self.ffmpeg_available and subprocess.run(
+                    [FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'mp4', '-i', fragmented_path,
+                     '-c', 'copy', '-movflags', '+faststart', path],
+                    capture_output=True
+                ).returncode == 0
+                if remuxed:
+                    os.remove(fragmented_path)
+                else:
+                    os.replace(fragmented_path, path)
+                
+                clip_path = path
+                self.storage.add_event_clip(camera_id, os.path.getsize(path))
+                logger.info(f"Event clip of camera {camera_id}: {clip_path}")
+            else:
+                logger.warning(f"No buffered video for event clip of camera {camera_id}")
         except Exception as e:
-            logger.error(f"Error extracting clip: {e}")
+            logger.error(f"Error writing event clip of camera {camera_id}: {e}")
+        finally:
+            with self._event_lock:
+                clip.writing = True
+                if self._event_clips.get(camera_id) is clip:
+                    del self._event_clips[camera_id]
+            clip.future.set_result(clip_path)
+    
+    def _open_segment(self, camera_id: int) -> Optional[str]:
+        """Segment file currently being written (not in the catalog until it closes)."""
+        if not self.is_recording.get(camera_id, False):
             return None
+        
+        now = datetime.now()
+        for day in (now, now - timedelta(days=1)):
+            date_dir = os.path.join(VIDEO_DIR, str(camera_id), day.strftime('%Y-%m-%d'))
+            if not os.path.isdir(date_dir):
+                continue
+            
+            filenames = sorted(name for name in os.listdir(date_dir) if name.endswith('.mp4'))
+            if filenames:
+                file_path = os.path.join(date_dir, filenames[-1])
+                return None if file_path == self.last_closed.get(camera_id) else file_path
+        
+        return None
+    
+    def find_segment_records(self, camera_id: int, start_time: datetime,
+                             end_time: datetime) -> List[Dict]:
+        """
+        Segments overlapping a time range, oldest first.
+        
+        Closed segments come from the catalog in one indexed query. When the
+        range reaches into the last segment interval, the segment still being
+        written (not cataloged until it closes) is added from disk.
+        
+        Returns:
+            List of {'file_path', 'start_time', 'end_time', ...} with datetime times
+        """
+        from database.v2_models import v2db
+        
+        records = []
+        for row in v2db.find_video_segments(camera_id, start_time, end_time):
+            row['start_time'] = datetime.fromisoformat(row['start_time'])
+            row['end_time'] = datetime.fromisoformat(row['end_time'])
+            records.append(row)
+        
+        now = datetime.now()
+        if end_time >= now - timedelta(seconds=SEGMENT_DURATION * 2):
+            file_path = self._open_segment(camera_id)
+            file_start = self._segment_start(file_path) if file_path else None
+            
+            if (file_start is not None and file_start <= end_time
+                    and all(record['file_path'] != file_path for record in records)):
+                records.append({'file_path': file_path, 'start_time': file_start, 'end_time': now,
+                                'status': 'recording'})
+        
+        return records
+    
+    def get_timeline(self, camera_id: int, start_time: datetime, end_time: datetime) -> List[Dict]:
+        """
+        Recorded and skipped spans of a camera overlapping a time range, oldest first.
+        
+        Returns:
+            List of {'start_time', 'end_time', 'status'} ('active' or 'skipped') with datetime times;
+            time not covered by any span was not recorded (recorder off or down)
+        """
+        from database.v2_models import v2db
+        
+        spans = [
+            {'start_time': datetime.fromisoformat(row['start_time']),
+             'end_time': datetime.fromisoformat(row['end_time']),
+             'status': row['status']}
+            for row in v2db.get_video_archives(camera_id, start_time, end_time)
+            if row['status'] in ('active', 'skipped')
+        ]
+        return sorted(spans, key=lambda span: span['start_time'])
     
     def _find_segments(self, camera_id: int, start_time: datetime, end_time: datetime) -> List[str]:
-        """Find video segments for given time range."""
-        segments = []
-        
-        camera_dir = os.path.join(VIDEO_DIR, str(camera_id))
-        if not os.path.exists(camera_dir):
-            return segments
-        
-        # Iterate through date directories
-        current_date = start_time.date()
-        end_date = end_time.date()
-        
-        while current_date <= end_date:
-            date_dir = os.path.join(camera_dir, current_date.strftime('%Y-%m-%d'))
-            
-            if os.path.exists(date_dir):
-                for filename in sorted(os.listdir(date_dir)):
-                    if filename.endswith('.mp4'):
-                        file_path = os.path.join(date_dir, filename)
-                        
-                        # Parse timestamp from filename
-                        try:
-                            time_str = filename.replace('.mp4', '')
-                            file_time = datetime.strptime(
-                                f"{current_date.strftime('%Y-%m-%d')} {time_str}",
-                                '%Y-%m-%d %H-%M-%S'
-                            )
-                            
-                            # Check if segment overlaps with requested range
-                            segment_end = file_time + timedelta(seconds=SEGMENT_DURATION)
-                            
-                            if file_time <= end_time and segment_end >= start_time:
-                                segments.append(file_path)
-                        except:
-                            continue
-            
-            current_date += timedelta(days=1)
-        
-        return segments
-    
-    def cleanup_old_archives(self, retention_days: int = ARCHIVE_RETENTION_DAYS):
-        """Remove archives older than retention period."""
+        """Find video segment files for given time range."""
+        return [record['file_path'] for record in self.find_segment_records(camera_id, start_time, end_time)]
+    
+    def cleanup_old_archives(self, retention_days: int = ARCHIVE_RETENTION_DAYS) -> Dict[str, int]:
+        """
+        Enforce archive retention: the age limit first, then the quotas.
+        
+        Segments are taken from the catalog oldest first, so nothing is
+        stat'ed or walked. Quotas are checked per camera (ARCHIVE_CAMERA_MAX_GB),
+        per organization (its storage_limit_gb) and for the whole archive
+        (ARCHIVE_MAX_GB); each evicts its oldest segments until it fits.
+        Event clips are not cataloged: their date directories expire with the
+        same cutoff and the oldest clips go once they exceed EVENT_CLIPS_MAX_MB.
+        The clip cache keeps to its own budget (CLIP_CACHE_MAX_MB).
+        
+        Returns:
+            {'expired': n, 'evicted': n} segments deleted
+        """
+        from database.v2_models import v2db
+        
         cutoff_date = datetime.now() - timedelta(days=retention_days)
+        result = {'expired': 0, 'evicted': 0}
         
-        try:
-            for camera_id_dir in os.listdir(VIDEO_DIR):
-                camera_path = os.path.join(VIDEO_DIR, camera_id_dir)
+        with self._retention_lock:
+            self._last_retention = time.time()
+            try:
+                while True:
+                    rows = v2db.get_oldest_segments(before=cutoff_date)
+                    if not rows:
+                        break
+                    result['expired'] += self._delete_segments(rows)
                 
-                if not os.path.isdir(camera_path) or camera_id_dir == 'clips':
-                    continue
+                result['evicted'] = self._enforce_quotas()
                 
-                for date_dir in os.listdir(camera_path):
-                    try:
-                        dir_date = datetime.strptime(date_dir, '%Y-%m-%d')
-                        
-                        if dir_date < cutoff_date:
-                            date_path = os.path.join(camera_path, date_dir)
-                            import shutil
-                            shutil.rmtree(date_path)
-                            logger.info(f"Cleaned up old archive: {date_path}")
-                    except:
-                        continue
-        except Exception as e:
-            logger.error(f"Error cleaning archives: {e}")
+                self._remove_expired_dirs(cutoff_date)
+                self._enforce_event_clip_budget()
+                
+                # Skipped-span records have no files, they expire with the same cutoff
+                v2db.delete_skipped_spans(before=cutoff_date)
+            except Exception as e:
+                logger.error(f"Error cleaning archives: {e}")
+        
+        if result['expired'] or result['evicted']:
+            logger.info(f"Archive retention: {result['expired']} expired, {result['evicted']} evicted over quota")
+        return result
     
-    def get_archive_stats(self, camera_id: int) -> Dict:
-        """Get archive statistics for a camera."""
-        camera_dir = os.path.join(VIDEO_DIR, str(camera_id))
-        
-        stats = {
-            'total_size_mb': 0,
-            'segment_count': 0,
-            'oldest_date': None,
-            'newest_date': None
-        }
+    def _enforce_quotas(self) -> int:
+        """Evict the oldest segments of every camera, organization and archive over its quota."""
+        evicted = 0
         
-        if not os.path.exists(camera_dir):
-            return stats
+        if self.storage.camera_max_bytes:
+            for camera_id in self.storage.cameras():
+                excess = self.storage.camera_usage(camera_id)['bytes'] - self.storage.camera_max_bytes
+                evicted += self._evict_oldest([camera_id], excess)
         
-        try:
-            for date_dir in sorted(os.listdir(camera_dir)):
-                date_path = os.path.join(camera_dir, date_dir)
+        organizations = {self.storage.organization_of(camera_id) for camera_id in self.storage.cameras()}
+        for org_id in organizations - {None}:
+            limit = self.storage.organization_limit(org_id)
+            if limit:
+                excess = self.storage.organization_bytes(org_id) - limit
+                evicted += self._evict_oldest(self.storage.cameras(org_id), excess)
+        
+        if self.storage.max_bytes:
+            evicted += self._evict_oldest(None, self.storage.total_bytes - self.storage.max_bytes)
+        
+        return evicted
+    
+    def _evict_oldest(self, camera_ids: Optional[List[int]], excess: int) -> int:
+        """Delete the oldest segments (of some cameras, None = all) until ``excess`` bytes are freed."""
+        from database.v2_models import v2db
+        
+        deleted = 0
+        while excess > 0:
+            rows = v2db.get_oldest_segments(camera_ids, limit=20)
+            if not rows:
+                break
+            
+            for row in rows:
+                if excess <= 0:
+                    break
+                excess -= int(round((row['size_mb'] or 0) * 1024 * 1024))
+                deleted += self._delete_segments([row])
+        
+        return deleted
+    
+    def _delete_segments(self, rows: List[Dict]) -> int:
+        """Delete segment files (with their keyframe index) and their catalog records."""
+        from database.v2_models import v2db
+        
+        for row in rows:
+            for path in (row['file_path'], index_path(row['file_path'])):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not delete {path}: {e}")
+            
+            try:
+                # Date directories go with their last segment
+                os.rmdir(os.path.dirname(row['file_path']))
+            except OSError:
+                pass
+        
+        v2db.delete_video_archives([row['id'] for row in rows])
+        
+        for row in rows:
+            self.storage.remove(row['camera_id'], datetime.fromisoformat(row['start_time']),
+                                int(round((row['size_mb'] or 0) * 1024 * 1024)))
+            logger.debug(f"Deleted archive segment: {row['file_path']}")
+        
+        return len(rows)
+    
+    def _remove_expired_dirs(self, cutoff_date: datetime):
+        """Remove date directories past the cutoff that still hold uncataloged files (and event clips)."""
+        from database.v2_models import v2db
+        
+        for camera_id_dir in os.listdir(VIDEO_DIR):
+            camera_path = os.path.join(VIDEO_DIR, camera_id_dir)
+            if not (camera_id_dir.isdigit() or camera_id_dir == 'events') or not os.path.isdir(camera_path):
+                continue
+            
+            for date_dir in os.listdir(camera_path):
+                try:
+                    dir_date = datetime.strptime(date_dir, '%Y-%m-%d')
+                except ValueError:
+                    continue
                 
-                if not os.path.isdir(date_path):
+                if dir_date + timedelta(days=1) < cutoff_date:
+                    date_path = os.path.join(camera_path, date_dir)
+                    clips = self._event_clip_files([date_path]) if camera_id_dir == 'events' else []
+                    shutil.rmtree(date_path, ignore_errors=True)
+                    for _, path, size in clips:
+                        self._forget_event_clip(path, size)
+                    if v2db.delete_video_archives_under(date_path):
+                        self.storage.reload()
+                    logger.info(f"Cleaned up old archive: {date_path}")
+    
+    def _event_clip_files(self, date_dirs: Optional[List[str]] = None) -> List[tuple]:
+        """(mtime, path, size) of the written event clips (in some date directories, None = all), oldest first."""
+        if date_dirs is None:
+            events_dir = os.path.join(VIDEO_DIR, 'events')
+            if not os.path.isdir(events_dir):
+                return []
+            date_dirs = [entry.path for entry in os.scandir(events_dir) if entry.is_dir()]
+        
+        clips = []
+        for date_dir in date_dirs:
+            for entry in os.scandir(date_dir):
+                # Clips still being written end in .frag
+                if not entry.is_file() or not entry.name.endswith('.mp4'):
                     continue
                 
                 try:
-                    dir_date = datetime.strptime(date_dir, '%Y-%m-%d')
-                    
-                    if stats['oldest_date'] is None:
-                        stats['oldest_date'] = date_dir
-                    stats['newest_date'] = date_dir
-                    
-                    for filename in os.listdir(date_path):
-                        if filename.endswith('.mp4'):
-                            file_path = os.path.join(date_path, filename)
-                            stats['total_size_mb'] += os.path.getsize(file_path) / (1024 * 1024)
-                            stats['segment_count'] += 1
-                except:
+                    stat = entry.stat()
+                except FileNotFoundError:
                     continue
-        except Exception as e:
-            logger.error(f"Error getting archive stats: {e}")
+                clips.append((stat.st_mtime, entry.path, stat.st_size))
         
-        return stats
+        return sorted(clips)
+    
+    @staticmethod
+    def _event_clip_camera(path: str) -> Optional[int]:
+        """Camera of an event clip, from its ``{camera}_{time}_{id}.mp4`` name."""
+        prefix = os.path.basename(path).split('_', 1)[0]
+        return int(prefix) if prefix.isdigit() else None
+    
+    def _scan_event_clips(self) -> List[tuple]:
+        """(camera_id, bytes) of every event clip on disk, for the storage ledger's first fill."""
+        clips = [(self._event_clip_camera(path), size) for _, path, size in self._event_clip_files()]
+        return [(camera_id, size) for camera_id, size in clips if camera_id is not None]
+    
+    def _forget_event_clip(self, path: str, size: int):
+        """Take a deleted event clip out of the storage ledger."""
+        camera_id = self._event_clip_camera(path)
+        if camera_id is not None:
+            self.storage.add_event_clip(camera_id, -size)
+    
+    def _enforce_event_clip_budget(self) -> int:
+        """Delete the oldest event clips until they fit ``event_clips_max_bytes``."""
+        self.storage.ensure_event_clips(self._scan_event_clips)
+        if not self.event_clips_max_bytes or self.storage.event_clip_bytes() <= self.event_clips_max_bytes:
+            return 0
+        
+        clips = self._event_clip_files()
+        excess = sum(size for _, _, size in clips) - self.event_clips_max_bytes
+        deleted = 0
+        
+        for _, path, size in clips:
+            if excess <= 0:
+                break
+            
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete {path}: {e}")
+                continue
+            
+            self._forget_event_clip(path, size)
+            excess -= size
+            deleted += 1
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        
+        if deleted:
+            logger.info(f"Event clips over budget: {deleted} oldest deleted")
+        return deleted
+
+    def _maybe_enforce_retention(self, camera_id: int):
+        """Run retention in the background when a quota is exceeded or the age sweep is due."""
+        due = time.time() - self._last_retention >= RETENTION_INTERVAL
+        if not due and not self.storage.over_quota(camera_id):
+            return
+        if self._retention_lock.locked():
+            return  # a sweep is already running
 
+        self._last_retention = time.time()
+        threading.Thread(target=self.cleanup_old_archives, name='archive-retention', daemon=True).start()
+    
+    def start_compaction(self) -> bool:
+        """Start background compaction of aging segments (needs ffmpeg)."""
+        if not self.ffmpeg_available:
+            logger.warning("ffmpeg not found, archive compaction disabled")
+            return False
+        
+        self.compactor.start()
+        return True
+    
+    def get_archive_stats(self, camera_id: int) -> Dict:
+        """Get archive statistics for a camera (from the storage ledger, no filesystem walk)."""
+        usage = self.storage.camera_usage(camera_id)
+        
+        return {
+            'total_size_mb': usage['bytes'] / (1024 * 1024),
+            'segment_count': usage['segments'],
+            'oldest_date': usage['oldest'].strftime('%Y-%m-%d') if usage['oldest'] else None,
+            'newest_date': usage['newest'].strftime('%Y-%m-%d') if usage['newest'] else None
+        }
+        
+    def get_storage_stats(self, organization_id: int = None) -> Dict:
+        """
+        Archive totals of an organization (or all cameras) with the retention settings.
+        
+        Event clips are counted apart from the segments (``event_clips_mb``,
+        from the storage ledger); the clip cache is shared by all
+        organizations, so ``clip_cache_mb`` is only given for the whole archive.
+        """
+        stats = self.storage.get_stats(organization_id)
+        
+        self.storage.ensure_event_clips(self._scan_event_clips)
+        stats['event_clips_mb'] = round(self.storage.event_clip_bytes(organization_id) / (1024 * 1024), 2)
+        stats['clip_cache_mb'] = self.clip_cache.get_stats()['size_mb'] if organization_id is None else None
+        stats['retention_days'] = ARCHIVE_RETENTION_DAYS
+        return stats
 
 # Global instance
 video_recorder = VideoRecorder()
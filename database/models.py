@@ -38,6 +38,8 @@ class Database:
                 rtsp_url TEXT,
                 status TEXT DEFAULT 'inactive',
                 recording_enabled INTEGER DEFAULT 1,
+                recording_policy TEXT DEFAULT 'continuous',
+                recording_schedule TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -52,6 +54,7 @@ class Database:
                 subscription_type TEXT DEFAULT 'free',
                 camera_limit INTEGER DEFAULT 3,
                 storage_limit_gb INTEGER DEFAULT 100,
+                archive_quality TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -85,10 +88,19 @@ class Database:
                 file_path TEXT,
                 size_mb REAL,
                 status TEXT DEFAULT 'active',
+                frame_count INTEGER,
+                codec TEXT,
+                width INTEGER,
+                height INTEGER,
+                motion_peak REAL,
+                tier TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (camera_id) REFERENCES cameras (id)
             )
         ''')
+        self._migrate_organizations(cursor)
+        self._migrate_cameras(cursor)
+        self._migrate_video_archives(cursor)
         
         # Person Tracks (NEW for V2)
         cursor.execute('''
@@ -208,6 +220,45 @@ class Database:
         conn.close()
         logger.info("Database tables created successfully")
     
+    def _migrate_organizations(self, cursor):
+        """Add the archive quality column to an existing organizations table."""
+        cursor.execute('PRAGMA table_info(organizations)')
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        if 'archive_quality' not in columns:
+            cursor.execute('ALTER TABLE organizations ADD COLUMN archive_quality TEXT')
+    
+    def _migrate_cameras(self, cursor):
+        """Add recording policy columns to an existing cameras table."""
+        cursor.execute('PRAGMA table_info(cameras)')
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        if 'recording_policy' not in columns:
+            cursor.execute("ALTER TABLE cameras ADD COLUMN recording_policy TEXT DEFAULT 'continuous'")
+        if 'recording_schedule' not in columns:
+            cursor.execute('ALTER TABLE cameras ADD COLUMN recording_schedule TEXT')
+    
+    def _migrate_video_archives(self, cursor):
+        """Add segment catalog columns and indexes to an existing video_archives table."""
+        cursor.execute('PRAGMA table_info(video_archives)')
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        for column, column_type in (('frame_count', 'INTEGER'), ('codec', 'TEXT'), ('width', 'INTEGER'),
+                                    ('height', 'INTEGER'), ('motion_peak', 'REAL'), ('tier', 'TEXT')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE video_archives ADD COLUMN {column} {column_type}')
+        
+        # Range lookups: WHERE camera_id = ? AND start_time <= ? AND end_time >= ?
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_video_archives_range
+            ON video_archives (camera_id, start_time, end_time)
+        ''')
+        # One row per segment file (re-registering a file updates it)
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_video_archives_file
+            ON video_archives (file_path)
+        ''')
+    
     # Camera operations
     def add_camera(self, name: str, ip_address: str, port: int, 
                    username: str, password: str, camera_type: str = 'generic',
@@ -279,6 +330,21 @@ class Database:
         conn.close()
         logger.info(f"Camera {camera_id} status updated to: {status}")
     
+    def update_recording_policy(self, camera_id: int, policy: str, schedule: str = None):
+        """Set a camera's recording policy ('continuous', 'motion', 'scheduled') and schedule."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE cameras 
+            SET recording_policy = ?, recording_schedule = ?, updated_at = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', (policy, schedule, camera_id))
+        
+        conn.commit()
+        conn.close()
+        logger.info(f"Camera {camera_id} recording policy updated to: {policy}")
+    
     def delete_camera(self, camera_id: int):
         """Delete camera from database."""
         conn = self._get_connection()
@@ -318,6 +384,17 @@ class Database:
         
         return dict(row) if row else None
     
+    def update_archive_quality(self, org_id: int, quality: str):
+        """Set the quality ('1080', '720', '480') aging archive segments are compacted to."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('UPDATE organizations SET archive_quality = ? WHERE id = ?', (quality, org_id))
+        
+        conn.commit()
+        conn.close()
+        logger.info(f"Organization {org_id} archive quality updated to: {quality}")
+    
     # User operations (ENHANCED for V2)
     def add_user(self, user_id: int, username: str = None, 
                  first_name: str = None, last_name: str = None, 
@@ -5,7 +5,7 @@ This module extends the base database with V2 functionality.
 import json
 import sqlite3
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from database.models import db
 from utils.logger import logger
 
@@ -66,6 +66,265 @@ class V2Database:
         
         return [dict(row) for row in rows]
     
+    @staticmethod
+    def save_video_archive(camera_id: int, start_time: datetime, duration: float,
+                           file_path: str, size_mb: float, frame_count: int = None,
+                           codec: str = None, width: int = None, height: int = None,
+                           motion_peak: float = None, status: str = 'active') -> int:
+        """Add or update the catalog record of a closed segment file."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        end_time = start_time + timedelta(seconds=duration)
+        
+        cursor.execute('''
+            INSERT INTO video_archives
+            (camera_id, start_time, end_time, duration_seconds, file_path, size_mb,
+             status, frame_count, codec, width, height, motion_peak)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(file_path) DO UPDATE SET
+                start_time = excluded.start_time,
+                end_time = excluded.end_time,
+                duration_seconds = excluded.duration_seconds,
+                size_mb = excluded.size_mb,
+                status = excluded.status,
+                frame_count = excluded.frame_count,
+                codec = excluded.codec,
+                width = excluded.width,
+                height = excluded.height,
+                motion_peak = COALESCE(excluded.motion_peak, video_archives.motion_peak)
+        ''', (camera_id, start_time, end_time, int(round(duration)), file_path, size_mb,
+              status, frame_count, codec, width, height, motion_peak))
+        
+        archive_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        
+        return archive_id
+    
+    @staticmethod
+    def find_video_segments(camera_id: int, start_time: datetime,
+                            end_time: datetime) -> List[Dict[str, Any]]:
+        """Segments overlapping [start_time, end_time], oldest first (one indexed query)."""
+        conn = db._get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT * FROM video_archives
+            WHERE camera_id = ? AND start_time <= ? AND end_time >= ? AND status = 'active'
+            ORDER BY start_time
+        ''', (camera_id, end_time, start_time))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def save_skipped_span(camera_id: int, start_time: datetime, end_time: datetime) -> int:
+        """Record a span the recording policy left out (no file, status 'skipped')."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO video_archives
+            (camera_id, start_time, end_time, duration_seconds, file_path, size_mb, status)
+            VALUES (?, ?, ?, ?, NULL, 0, 'skipped')
+        ''', (camera_id, start_time, end_time, int(round((end_time - start_time).total_seconds()))))
+        
+        archive_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        
+        return archive_id
+    
+    @staticmethod
+    def delete_skipped_spans(camera_id: int = None, before: datetime = None) -> int:
+        """Remove skipped-span records (of one camera and/or ending before a time)."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        query = "DELETE FROM video_archives WHERE status = 'skipped'"
+        params = []
+        
+        if camera_id is not None:
+            query += ' AND camera_id = ?'
+            params.append(camera_id)
+        
+        if before is not None:
+            query += ' AND end_time < ?'
+            params.append(before)
+        
+        cursor.execute(query, params)
+        deleted = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        
+        return deleted
+    
+    @staticmethod
+    def get_archive_usage() -> List[Dict[str, Any]]:
+        """Size, count and time range of each camera's cataloged segments (one grouped query)."""
+        conn = db._get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT camera_id, COALESCE(SUM(size_mb), 0) AS size_mb, COUNT(*) AS segments,
+                   MIN(start_time) AS oldest, MAX(start_time) AS newest
+            FROM video_archives
+            WHERE status = 'active' AND file_path IS NOT NULL
+            GROUP BY camera_id
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def get_archive_size(file_path: str) -> Optional[float]:
+        """Cataloged size (MB) of a segment file, None if it has no record."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT size_mb FROM video_archives WHERE file_path = ? AND status = 'active'",
+                       (file_path,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return row[0] if row else None
+    
+    @staticmethod
+    def get_oldest_segments(camera_ids: List[int] = None, before: datetime = None,
+                            limit: int = 100) -> List[Dict[str, Any]]:
+        """Oldest cataloged segments (of some cameras and/or ending before a time), oldest first."""
+        conn = db._get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        query = "SELECT * FROM video_archives WHERE status = 'active' AND file_path IS NOT NULL"
+        params = []
+        
+        if camera_ids is not None:
+            query += f" AND camera_id IN ({','.join('?' * len(camera_ids))})"
+            params.extend(camera_ids)
+        
+        if before is not None:
+            query += ' AND end_time < ?'
+            params.append(before)
+        
+        query += ' ORDER BY start_time LIMIT ?'
+        params.append(limit)
+        
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def get_compaction_candidates(before: datetime, qualities: List[str],
+                                  limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Segments ended before a time and not compacted yet, oldest first, of
+        cameras whose organization chose one of ``qualities`` (its
+        ``archive_quality`` is returned with each segment).
+        """
+        conn = db._get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT va.*, o.archive_quality FROM video_archives va
+            JOIN cameras c ON c.id = va.camera_id
+            JOIN organizations o ON o.id = c.organization_id
+            WHERE va.status = 'active' AND va.file_path IS NOT NULL AND va.tier IS NULL AND va.end_time < ?
+                AND o.archive_quality IN ({','.join('?' * len(qualities))})
+            ORDER BY va.start_time
+            LIMIT ?
+        ''', (before, *qualities, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def update_segment_tier(archive_id: int, tier: str, size_mb: float = None,
+                            frame_count: int = None, codec: str = None,
+                            width: int = None, height: int = None):
+        """Mark a segment compacted to ``tier`` (with the re-encoded file's details, if it changed)."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE video_archives SET
+                tier = ?,
+                size_mb = COALESCE(?, size_mb),
+                frame_count = COALESCE(?, frame_count),
+                codec = COALESCE(?, codec),
+                width = COALESCE(?, width),
+                height = COALESCE(?, height)
+            WHERE id = ?
+        ''', (tier, size_mb, frame_count, codec, width, height, archive_id))
+        
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def get_oldest_start(camera_id: int) -> Optional[str]:
+        """Start time of a camera's oldest cataloged segment (range index lookup)."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT MIN(start_time) FROM video_archives
+            WHERE camera_id = ? AND status = 'active' AND file_path IS NOT NULL
+        ''', (camera_id,))
+        row = cursor.fetchone()
+        conn.close()
+        
+        return row[0] if row else None
+    
+    @staticmethod
+    def get_archive_paths() -> Dict[str, int]:
+        """{file_path: archive id} of every cataloged segment."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT file_path, id FROM video_archives WHERE file_path IS NOT NULL')
+        paths = dict(cursor.fetchall())
+        conn.close()
+        
+        return paths
+    
+    @staticmethod
+    def delete_video_archives(archive_ids: List[int]):
+        """Remove catalog records (files already gone)."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany('DELETE FROM video_archives WHERE id = ?', [(i,) for i in archive_ids])
+        
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def delete_video_archives_under(directory: str) -> int:
+        """Remove catalog records of all segment files inside ``directory``."""
+        conn = db._get_connection()
+        cursor = conn.cursor()
+        
+        prefix = directory.rstrip('/') + '/'
+        cursor.execute('DELETE FROM video_archives WHERE substr(file_path, 1, ?) = ?', (len(prefix), prefix))
+        deleted = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        
+        return deleted
+    
     # Person Tracking operations
     @staticmethod
     def create_person_track(tracking_id: str, first_seen: datetime,
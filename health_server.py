@@ -2,10 +2,31 @@
 Health check server for Fly.io and HuggingFace Spaces deployment.
 Provides HTTP endpoint for platform health checks while bot runs in polling mode.
 """
-from fastapi import FastAPI
+import hmac
+import time
+from fastapi import FastAPI, HTTPException, Request
+from utils.config import METRICS_TOKEN
 
 app = FastAPI(title="Cam Max Bot Health Check")
 
+LOCAL_HOSTS = {'127.0.0.1', '::1', 'localhost'}
+
+
+def authorize_metrics(request: Request):
+    """
+    Metrics need METRICS_TOKEN (``Authorization: Bearer`` or ``?token=``).
+    Without a configured token only requests from localhost are served.
+    """
+    if METRICS_TOKEN:
+        header = request.headers.get('authorization', '')
+        token = header[len('Bearer '):] if header.startswith('Bearer ') else request.query_params.get('token', '')
+        if hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return
+    elif request.client is not None and request.client.host in LOCAL_HOSTS:
+        return
+    
+    raise HTTPException(status_code=403, detail="Forbidden")
+
 @app.get("/health")
 def health_check():
     """Health check endpoint for deployment platforms."""
@@ -15,6 +36,18 @@ def health_check():
         "mode": "polling"
     }
 
+@app.get("/metrics/cameras")
+def camera_metrics(request: Request):
+    """Per-camera ingest metrics (state, fps, decode latency, drops, reconnects)."""
+    authorize_metrics(request)
+    
+    from camera.stream_manager import stream_manager
+    
+    return {
+        "timestamp": time.time(),
+        "cameras": stream_manager.get_camera_metrics()
+    }
+
 @app.get("/")
 def root():
     """Root endpoint."""
@@ -355,6 +355,1714 @@ def test_ffmpeg_availability():
         check_test("FFmpeg mavjud", False, str(e))
 
 
+def test_frame_bus():
+    """Test 10: Frame bus subscription semantikasini tekshirish."""
+    print("\n" + "="*50)
+    print("🔟 FRAME BUS TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        from camera.stream_manager import FrameSubscription
+        
+        # Slow consumer: only the newest frames are kept
+        sub = FrameSubscription(camera_id=1, name='test', queue_size=2)
+        for i in range(5):
+            sub.offer(f"frame{i}", timestamp=100.0 + i)
+        
+        check_test("Drop-oldest: 3 ta frame tashlandi", sub.dropped == 3, f"dropped={sub.dropped}")
+        first = sub.get(timeout=0)
+        check_test("Eng eski qolgan frame birinchi", first == ("frame3", 103.0), f"Got: {first}")
+        
+        # Rate limited consumer: 2 fps
+        limited = FrameSubscription(camera_id=1, name='analytics', fps=2)
+        for i in range(10):
+            limited.offer(i, timestamp=200.0 + i * 0.1)
+        check_test("2 fps obuna 1 sekundda 2 frame oladi", limited.delivered + len(limited._frames) == 2,
+             f"queued={len(limited._frames)}")
+        
+        sub.close()
+        check_test("Yopilgan obuna None qaytaradi", sub.get(timeout=0) is None)
+        
+    except Exception as e:
+        check_test("Frame bus tests", False, str(e))
+
+
+def test_camera_detection():
+    """Test 11: Kamera turini parallel aniqlash (fayl asosidagi stand-in)."""
+    print("\n" + "="*50)
+    print("1️⃣1️⃣ KAMERA TURINI ANIQLASH TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import cv2
+        import tempfile
+        import numpy as np
+        from camera.rtsp_client import detect_camera
+        
+        tmp_dir = tempfile.mkdtemp()
+        writer = cv2.VideoWriter(f"{tmp_dir}/cam.avi", cv2.VideoWriter_fourcc(*'MJPG'), 5, (64, 48))
+        for _ in range(5):
+            writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+        writer.release()
+        
+        # Only one format points at an existing "stream"
+        formats = {
+            'hikvision': tmp_dir + '/missing_{port}.avi',
+            'generic': tmp_dir + '/{ip}.avi',
+        }
+        result = detect_camera('cam', 'admin', 'secret', formats=formats, use_cache=False)
+        check_test("Ishlaydigan format topildi", result is not None and result[0] == 'generic', f"Got: {result}")
+        
+        missing = detect_camera('none', 'admin', 'secret', formats=formats, use_cache=False)
+        check_test("Hech narsa topilmasa None", missing is None, f"Got: {missing}")
+        
+        # The cache key covers the probed formats and port, not just the address
+        from camera.rtsp_client import _detect_fingerprint
+        detect_camera('cam', 'admin', 'secret', formats=formats)
+        other_formats = {'hikvision': tmp_dir + '/{ip}.avi', 'generic': tmp_dir + '/missing.avi'}
+        other = detect_camera('cam', 'admin', 'secret', formats=other_formats)
+        check_test("Boshqa formatlar keshdan olinmaydi", other is not None and other[0] == 'hikvision', f"Got: {other}")
+        check_test("Boshqa port boshqa kesh kaliti", _detect_fingerprint('cam', 'admin', 'secret', 554, formats)
+             != _detect_fingerprint('cam', 'admin', 'secret', 8554, formats))
+        
+    except Exception as e:
+        check_test("Camera detection tests", False, str(e))
+
+
+def test_camera_supervisor():
+    """Test 12: Kamera supervisor holatlari va backoff."""
+    print("\n" + "="*50)
+    print("1️⃣2️⃣ KAMERA SUPERVISOR TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import time
+        from camera.stream_manager import StreamManager, CameraState
+        from utils.config import RECONNECT_BACKOFF_BASE, RECONNECT_BACKOFF_MAX
+        
+        manager = StreamManager()
+        supervisor = manager.supervisor
+        
+        delays = [supervisor.backoff(n) for n in range(1, 20)]
+        check_test("Backoff chegarada", all(0 < d <= RECONNECT_BACKOFF_MAX for d in delays),
+             f"Got: {delays}")
+        check_test("Backoff o'sib boradi", supervisor.backoff(1) <= RECONNECT_BACKOFF_BASE < delays[-1])
+        
+        # Dead stream: never becomes live, handlers get an answer right away
+        manager.add_camera(99901, 'missing', '127.0.0.1', rtsp_url='/nonexistent/stream.mp4')
+        supervisor.deadline = 1
+        manager.start_supervisor()
+        
+        started = time.time()
+        check_test("Holat darhol qaytadi", manager.get_camera_state(99901) in (None, CameraState.CONNECTING))
+        check_test("Holat so'rovi bloklanmaydi", time.time() - started < 0.1)
+        
+        time.sleep(1.5)
+        state = manager.get_camera_state(99901)
+        check_test("Ulanmagan kamera live emas", state in (CameraState.CONNECTING, CameraState.OFFLINE),
+             f"Got: {state}")
+        
+        manager.cleanup()
+        check_test("Supervisor to'xtadi", not supervisor.is_running)
+        
+    except Exception as e:
+        check_test("Camera supervisor tests", False, str(e))
+
+
+def test_dual_stream():
+    """Test 13: Sub-stream URL va koordinatalarni main-streamga o'tkazish."""
+    print("\n" + "="*50)
+    print("1️⃣3️⃣ DUAL-STREAM TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        from utils.config import get_substream_url
+        import time
+        from utils.geometry import scale_bbox
+        
+        url = get_substream_url('hikvision', '10.0.0.5', 554, 'admin', 'pass')
+        check_test("Hikvision sub-stream 102", url.endswith('/Streaming/Channels/102'), f"Got: {url}")
+        url = get_substream_url('dahua', '10.0.0.5', 554, 'admin', 'pass')
+        check_test("Dahua sub-stream subtype=1", url.endswith('subtype=1'), f"Got: {url}")
+        check_test("Generic uchun sub-stream yo'q", get_substream_url('generic', '10.0.0.5', 554, 'a', 'b') is None)
+        
+        # 640x360 sub-stream box -> 1920x1080 main stream
+        bbox = scale_bbox((100, 50, 64, 36), (360, 640, 3), (1080, 1920, 3))
+        check_test("Bbox main-stream koordinatalariga", bbox == (300, 150, 192, 108), f"Got: {bbox}")
+        
+        # A sub-stream opened by a one-off analytics read is closed once unused
+        from camera.rtsp_client import RTSPCamera
+        camera = RTSPCamera(99970, 'Sub Test', '127.0.0.1', 554, 'a', 'b', camera_type='hikvision')
+        camera.substream = RTSPCamera(99970, 'Sub Test (sub)', '127.0.0.1', 554, 'a', 'b')
+        camera.substream.cap = type('ReleasedCapture', (), {'release': lambda self: None})()
+        camera.substream.is_connected = True
+        camera._substream_used_at = time.time()
+        check_test("Yaqinda ishlatilgan sub-stream yopilmaydi", not camera.close_idle_substream(60))
+        closed = camera.close_idle_substream(60, now=time.time() + 61)
+        check_test("Ishlatilmagan sub-stream yopiladi", closed and not camera.substream.is_connected)
+        
+        # Analytics subscribed while the sub-stream was down move to it once it connects
+        from camera.stream_manager import StreamManager, FrameBus, FrameSubscription
+        
+        class FakeStream:
+            def __init__(self, connected):
+                self.camera_id = 99971
+                self.is_connected = connected
+                self.substream = None
+                self._frame_listeners = []
+            
+            def add_frame_listener(self, listener):
+                self._frame_listeners.append(listener)
+            
+            def remove_frame_listener(self, listener):
+                self._frame_listeners.remove(listener)
+        
+        main, sub = FakeStream(True), FakeStream(False)
+        main.substream = sub
+        manager = StreamManager()
+        bus = FrameBus(main)
+        manager.buses[(99971, 'sub')] = bus
+        bus.add(FrameSubscription(99971, 'analysis', stream='sub'))
+        check_test("Sub-stream yo'q - asosiy oqimdan", manager.update_sub_bus(main) and bus.camera is main)
+        sub.is_connected = True
+        manager.update_sub_bus(main)
+        check_test("Sub-stream ulanganda bus unga o'tadi", bus.camera is sub and
+             sub._frame_listeners == [bus.publish] and not main._frame_listeners)
+        sub.is_connected = False
+        manager.update_sub_bus(main)
+        check_test("Sub-stream uzilsa asosiy oqimga qaytadi", bus.camera is main and not sub._frame_listeners)
+        
+    except Exception as e:
+        check_test("Dual stream tests", False, str(e))
+
+
+def test_ffmpeg_reader():
+    """Test 14: FFmpeg pipe frame reader."""
+    print("\n" + "="*50)
+    print("1️⃣4️⃣ FFMPEG FRAME READER TEKSHIRUVI")
+    print("="*50)
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import cv2
+        import tempfile
+        import numpy as np
+        from camera.rtsp_client import FFmpegFrameReader
+        
+        path = f"{tempfile.mkdtemp()}/clip.avi"
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (128, 96))
+        for i in range(10):
+            writer.write(np.full((96, 128, 3), i * 20, dtype=np.uint8))
+        writer.release()
+        
+        reader = FFmpegFrameReader(path, width=64, buffers=2)
+        check_test("Reader ochildi", reader.isOpened())
+        check_test("Decode vaqtida kichraytirildi", (reader.width, reader.height) == (64, 48),
+             f"Got: {reader.width}x{reader.height}")
+        
+        frames = []
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+            frames.append(frame)
+        reader.release()
+        
+        check_test("Barcha kadrlar o'qildi", len(frames) == 10, f"Got: {len(frames)}")
+        check_test("Bufferlar qayta ishlatildi", len({id(f) for f in frames}) == 2)
+        check_test("BGR kadr shakli", frames[0].shape == (48, 64, 3), f"Got: {frames[0].shape}")
+        
+        # Camera frames outlive the next read (mailbox, frame bus, snapshot cache)
+        from camera.rtsp_client import reader_options
+        roles = ('analytics', 'snapshot', 'recording')
+        check_test("Kamera rollari bufferlarni qayta ishlatmaydi",
+                   all(reader_options(role)['buffers'] == 0 for role in roles))
+        
+    except Exception as e:
+        check_test("FFmpeg reader tests", False, str(e))
+
+
+def test_motion_gate():
+    """Test 15: YOLO oldidan harakat filtri."""
+    print("\n" + "="*50)
+    print("1️⃣5️⃣ MOTION GATE TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import numpy as np
+        from ai.motion_detector import MotionGate
+        
+        gate = MotionGate(method='diff', threshold=0.01, keyframe_interval=1000)
+        empty = np.zeros((360, 640, 3), dtype=np.uint8)
+        moved = empty.copy()
+        moved[100:200, 200:300] = 255
+        
+        gate.check(1, empty)  # first frame is always forwarded
+        still = gate.check(1, empty)
+        check_test("Harakatsiz kadr o'tkazib yuborildi", not still.triggered, f"score={still.score}")
+        
+        motion = gate.check(1, moved)
+        check_test("Harakatli kadr detektorga uzatildi", motion.triggered and motion.score > 0.01,
+             f"score={motion.score}")
+        check_test("Oxirgi baho saqlandi", gate.get_score(1).score == motion.score)
+        
+        # Per-camera threshold and forced keyframe
+        gate.set_threshold(2, 0.5)
+        check_test("Kamera chegarasi", gate.get_threshold(2) == 0.5 and gate.get_threshold(1) == 0.01)
+        forced_gate = MotionGate(method='diff', keyframe_interval=0)
+        forced_gate.check(3, empty)
+        forced = forced_gate.check(3, empty)
+        check_test("Majburiy keyframe", forced.triggered and forced.forced)
+        
+    except Exception as e:
+        check_test("Motion gate tests", False, str(e))
+
+
+def test_analysis_scheduler():
+    """Test 16: Faollikka qarab moslashuvchan tahlil tezligi."""
+    print("\n" + "="*50)
+    print("1️⃣6️⃣ ANALYSIS SCHEDULER TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        from ai.analysis_scheduler import AnalysisScheduler
+        
+        scheduler = AnalysisScheduler(detector=object(), tracker=object(), min_fps=0.2,
+                                      max_fps=5.0, cpu_budget=1.0, idle_half_life=10.0)
+        scheduler.add_camera(1)
+        scheduler.add_camera(2, max_fps=2.0)
+        
+        check_test("Boshlang'ich tezlik = min", scheduler.get_rates()[1]['rate'] == 0.2)
+        
+        rate = scheduler.update_rate(1, active_tracks=2, motion=False, now=100.0)
+        check_test("Aktiv track -> max tezlik", rate == 5.0, f"Got: {rate}")
+        check_test("Kamera max chegarasi", scheduler.update_rate(2, 0, True, now=100.0) == 2.0)
+        
+        rate = scheduler.update_rate(1, active_tracks=0, motion=False, now=110.0)
+        check_test("Bo'sh sahna: yarim yemirilish", abs(rate - 2.5) < 0.01, f"Got: {rate}")
+        rate = scheduler.update_rate(1, active_tracks=0, motion=False, now=1000.0)
+        check_test("Min tezlikdan pastga tushmaydi", rate == 0.2, f"Got: {rate}")
+        
+        # 100 ms per analysis with a 0.5 core budget -> at most 5 analyses/sec in total
+        scheduler.avg_cost = 0.1
+        scheduler.cpu_budget = 0.5
+        scheduler.update_rate(1, 1, True, now=1001.0)
+        load = scheduler.get_load()
+        check_test("CPU budjeti qo'llandi", load['cpu_share'] <= 0.5 + 1e-6, f"Got: {load}")
+        
+        # Detections replayed for a gate-skipped frame reach neither the tracker nor callbacks
+        import numpy as np
+        from ai.object_tracker import MultiObjectTracker
+        
+        class GatedDetector:
+            inferred = True
+            
+            def detect_gated(self, frame, camera_id=None):
+                return [{'class': 'person', 'confidence': 0.9, 'bbox': (10, 10, 50, 100)}], self.inferred
+        
+        detector = GatedDetector()
+        tracker = MultiObjectTracker()
+        results = []
+        scheduler = AnalysisScheduler(detector=detector, tracker=tracker)
+        scheduler.frame_source = lambda camera_id: np.zeros((48, 64, 3), dtype=np.uint8)
+        scheduler.add_result_callback(lambda camera_id, frame, detections: results.append(camera_id))
+        scheduler.add_camera(1)
+        scheduler.add_camera(2)
+        
+        scheduler.analyze(1)
+        seen = tracker.get_active_tracks(camera_id=1)[0].last_seen
+        detector.inferred = False
+        scheduler.analyze(1)
+        check_test("Gate o'tkazgan kadr trackni yangilamaydi",
+                   tracker.get_active_tracks(camera_id=1)[0].last_seen == seen)
+        check_test("Gate o'tkazgan kadr callbackga bormaydi", results == [1], f"Got: {results}")
+        
+        # The same box on another camera is a separate track
+        detector.inferred = True
+        scheduler.analyze(2)
+        check_test("Tracklar kamera bo'yicha sanaladi",
+                   (scheduler._active_tracks(1), scheduler._active_tracks(2)) == (1, 1))
+        
+        # Only real inferences feed the cost average the CPU budget is scaled by
+        scheduler.avg_cost = 0.5
+        detector.inferred = False
+        scheduler.analyze(1)
+        check_test("Gate o'tkazgan kadr o'rtacha narxga kirmaydi", scheduler.avg_cost == 0.5,
+                   f"Got: {scheduler.avg_cost}")
+        
+        # Cameras added or removed at runtime are picked up
+        scheduler.sync_cameras([2, 3])
+        check_test("Kameralar ro'yxati yangilanadi", sorted(scheduler.get_rates()) == [2, 3],
+                   f"Got: {sorted(scheduler.get_rates())}")
+        
+    except Exception as e:
+        check_test("Analysis scheduler tests", False, str(e))
+
+
+def test_stream_metrics():
+    """Test 17: Kamera ingest metrikalari."""
+    print("\n" + "="*50)
+    print("1️⃣7️⃣ STREAM METRIKALARI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        from camera.rtsp_client import StreamMetrics
+        
+        metrics = StreamMetrics()
+        metrics.record_connect(True)
+        for i in range(50):
+            metrics.record_frame(decode_time=0.002 if i < 45 else 0.020, timestamp=1000.0 + i * 0.1)
+        metrics.record_failure()
+        metrics.record_connect(False)
+        metrics.record_connect(True)
+        
+        snapshot = metrics.snapshot(now=1005.0)
+        check_test("Delivered fps ~10", 9.0 <= snapshot['delivered_fps'] <= 11.0, f"Got: {snapshot['delivered_fps']}")
+        check_test("Decode p50 = 2 ms", snapshot['decode_ms']['p50'] == 2.0, f"Got: {snapshot['decode_ms']}")
+        check_test("Decode p99 sekin kadrlarni ko'rsatadi", snapshot['decode_ms']['p99'] > 15)
+        check_test("Reconnect va xatolar sanaldi",
+             (snapshot['reconnects'], snapshot['connect_failures'], snapshot['read_failures']) == (1, 1, 1))
+        check_test("Oxirgi kadr yoshi", abs(snapshot['last_frame_age'] - 0.1) < 1e-6)
+        
+        # The metrics endpoint sees no names/addresses and never reads the capture
+        from camera.rtsp_client import RTSPCamera
+        
+        class UntouchableCapture:
+            def get(self, prop):
+                raise AssertionError("capture read from a metrics call")
+            
+            def release(self):
+                pass
+        
+        camera = RTSPCamera(99960, 'Secret Gate', '10.1.2.3', 554, 'admin', 'pass')
+        camera.cap = UntouchableCapture()
+        camera.is_connected = True
+        camera.metrics = metrics
+        info = camera.get_metrics()
+        check_test("Metrikalarda nom/IP yo'q", not {'name', 'ip', 'port', 'type'} & set(info), f"Got: {info}")
+        check_test("Metrikalar keshdan o'qildi", info['metrics']['frames'] == 50)
+        
+    except Exception as e:
+        check_test("Stream metrics tests", False, str(e))
+
+
+def test_snapshot_cache():
+    """Test 18: Kodlangan snapshot keshi."""
+    print("\n" + "="*50)
+    print("1️⃣8️⃣ SNAPSHOT KESH TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import time
+        import numpy as np
+        from camera.stream_manager import stream_manager
+        from camera.snapshot_cache import SnapshotCache
+        
+        class FakeCamera:
+            is_connected = True
+            is_grabbing = True
+            
+            def __init__(self):
+                self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                self.captured_at = time.time()
+            
+            def get_latest_frame(self):
+                return self.frame, self.captured_at
+        
+        camera = FakeCamera()
+        stream_manager.cameras[-1] = camera
+        cache = SnapshotCache(max_age=60, quality=85, preview_width=320)
+        
+        try:
+            first = cache.get(-1)
+            check_test("JPEG kodlandi", first is not None and first.jpeg[:2] == b'\xff\xd8')
+            check_test("O'lcham saqlandi", (first.width, first.height) == (640, 480))
+            
+            second = cache.get(-1)
+            check_test("Yangi snapshot keshdan olinadi", second is first and cache.encodes == 1)
+            
+            # Same mailbox frame: no re-encode even when the snapshot is stale
+            cache.get(-1, max_age=0)
+            check_test("O'zgarmagan kadr qayta kodlanmaydi", cache.encodes == 1)
+            
+            camera.captured_at = time.time() + 1
+            cache.get(-1, max_age=0)
+            check_test("Yangi kadr qayta kodlanadi", cache.encodes == 2)
+            
+            preview = cache.get(-1, preview=True)
+            check_test("Kichik preview yaratildi",
+                 preview.preview is not None and len(preview.preview) < len(preview.jpeg))
+            
+            del stream_manager.cameras[-1]
+            cache.invalidate(-1)
+            check_test("Ulanmagan kamera - None", cache.get(-1) is None)
+        finally:
+            stream_manager.cameras.pop(-1, None)
+            
+    except Exception as e:
+        check_test("Snapshot cache tests", False, str(e))
+
+
+def test_shared_frame_ring():
+    """Test 19: Jarayonlararo kadr halqasi (shared memory)."""
+    print("\n" + "="*50)
+    print("1️⃣9️⃣ SHARED MEMORY KADR HALQASI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import numpy as np
+        from camera.ingest_workers import SharedFrameRing, IngestPool
+        
+        ring = SharedFrameRing.create(slots=3, shape=(48, 64, 3))
+        reader = SharedFrameRing.attach(ring.name, 3, (48, 64, 3))
+        
+        try:
+            seqs = [ring.write(np.full((48, 64, 3), i, dtype=np.uint8), 100.0 + i) for i in range(5)]
+            frame, timestamp = reader.read(seqs[-1])
+            check_test("Oxirgi kadr nomi orqali o'qildi", frame is not None and frame[0, 0, 0] == 4 and timestamp == 104.0)
+            check_test("O'qilgan kadr nusxa", not np.shares_memory(frame, reader.frames))
+            check_test("Ustiga yozilgan kadr - None", reader.read(seqs[0])[0] is None)
+        finally:
+            reader.close()
+            ring.close()
+        
+        pool = IngestPool(workers=4)
+        check_test("Kameralar ishchilarga taqsimlanadi", [pool.shard_of(i) for i in (1, 4, 6)] == [1, 0, 2])
+        
+        # Sub-streams are only requested from the worker when analytics ask for one
+        from camera.ingest_workers import SharedFrameCamera
+        
+        sent = []
+        pool.send = lambda camera_id, command, payload: sent.append(command)
+        cam_data = {'id': 5, 'name': 'proxy', 'ip_address': '10.0.0.5', 'port': 554,
+                    'username': 'a', 'password': 'b', 'camera_type': 'hikvision'}
+        camera = SharedFrameCamera(pool, cam_data)
+        check_test("Sub-stream oldindan so'ralmaydi", sent == [])
+        check_test("Kadr yo'q - asosiy oqimga qaytadi", camera.open_substream() is None)
+        camera.open_substream()
+        check_test("Sub-stream so'rovi cheklangan", sent == ['open_substream'], f"Got: {sent}")
+        
+        # Connection follows the age of the newest frame in the ring, not the last status message
+        import time
+        camera.info = {'status': 'connected'}
+        ring = SharedFrameRing.create(slots=2, shape=(4, 4, 3))
+        try:
+            camera._on_ring(ring.name, 2, (4, 4, 3))
+            ring.write(np.zeros((4, 4, 3), dtype=np.uint8), time.time() - 60)
+            check_test("Eskirgan halqa - ulanmagan", not camera.is_connected)
+            ring.write(np.zeros((4, 4, 3), dtype=np.uint8), time.time())
+            check_test("Yangi kadr - ulangan", camera.is_connected)
+        finally:
+            camera.disconnect()
+            ring.close()
+        
+        # A dead worker is respawned with its shard's cameras, which are marked disconnected
+        started = []
+        pool.cameras = {5: camera, 6: SharedFrameCamera(pool, dict(cam_data, id=6))}
+        pool._stop = type('Stop', (), {'is_set': lambda self: False})()
+        pool._processes = {1: type('DeadProcess', (), {'exitcode': -9, 'is_alive': lambda self: False,
+                                                       'join': lambda self, timeout=None: None})()}
+        pool._start_worker = lambda index, cameras: started.append((index, [c['id'] for c in cameras]))
+        pool._check_workers()
+        check_test("O'lgan ishchi qayta ishga tushadi", started == [(1, [5])], f"Got: {started}")
+        check_test("Uning kameralari uzilgan deb belgilanadi", camera.info['status'] == 'disconnected')
+        
+    except Exception as e:
+        check_test("Shared frame ring tests", False, str(e))
+
+
+def test_idle_streams():
+    """Test 20: Foydalanilmagan oqimlarni yopish siyosati."""
+    print("\n" + "="*50)
+    print("2️⃣0️⃣ IDLE OQIM SIYOSATI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import time
+        from camera.stream_manager import StreamManager
+        
+        manager = StreamManager()
+        manager.add_camera(901, 'idle-test', '127.0.0.1', rtsp_url='/tmp/missing.mp4')
+        later = time.time() + 10 ** 6
+        
+        check_test("Yangi kamera idle emas", not manager.is_idle(901))
+        check_test("Uzoq foydalanilmagan kamera idle", manager.is_idle(901, now=later))
+        
+        listener = lambda frame, timestamp: None
+        manager.cameras[901].add_frame_listener(listener)
+        check_test("Yozuv/tahlil obunachisi oqimni ochiq tutadi", not manager.is_idle(901, now=later))
+        manager.cameras[901].remove_frame_listener(listener)
+        
+        manager.last_access[901] = 0.0
+        manager.prefetch([901])
+        check_test("Prefetch oxirgi murojaatni yangilaydi", not manager.is_idle(901))
+        
+        manager.cleanup()
+        
+    except Exception as e:
+        check_test("Idle stream tests", False, str(e))
+
+
+def test_segment_recorder():
+    """Test 21: ffmpeg segment ro'yxatini o'qish."""
+    print("\n" + "="*50)
+    print("2️⃣1️⃣ FFMPEG SEGMENT YOZUVCHI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import tempfile
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        
+        try:
+            recorder = video_recorder_module.VideoRecorder()
+            
+            # Segment started before midnight, reported just after it
+            date_dir = os.path.join(video_recorder_module.VIDEO_DIR, '7', '2024-05-01')
+            os.makedirs(date_dir)
+            open(os.path.join(date_dir, '23-55-00.mp4'), 'wb').close()
+            
+            segment = recorder._parse_segment_line(7, '23-55-00.mp4,0.000000,600.040000',
+                                                   now=datetime(2024, 5, 2, 0, 5, 1))
+            check_test("Segment sanasi va vaqti aniqlandi",
+                 segment is not None and segment[0] == datetime(2024, 5, 1, 23, 55, 0), f"Got: {segment}")
+            check_test("Segment davomiyligi", segment is not None and abs(segment[2] - 600.04) < 1e-6)
+            check_test("ffmpeg xato qatori segment emas",
+                 recorder._parse_segment_line(7, 'Connection refused') is None)
+            
+            recorder._ensure_date_dirs(7)
+            today = datetime.now().strftime('%Y-%m-%d')
+            check_test("Sana papkasi oldindan yaratildi",
+                 os.path.isdir(os.path.join(video_recorder_module.VIDEO_DIR, '7', today)))
+        finally:
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Segment recorder tests", False, str(e))
+
+
+def test_segment_catalog():
+    """Test 22: Video segment katalogi (video_archives)."""
+    print("\n" + "="*50)
+    print("2️⃣2️⃣ SEGMENT KATALOGI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import cv2
+        import tempfile
+        import numpy as np
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        from database.v2_models import v2db
+        
+        TEST_CAMERA_ID = 99999
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(TEST_CAMERA_ID))
+        date_dir = os.path.join(camera_dir, '2024-05-01')
+        os.makedirs(date_dir)
+        
+        try:
+            # Two 2-second segments at 10 fps, 10 minutes apart
+            for name in ('10-00-00.mp4', '10-10-00.mp4'):
+                writer = cv2.VideoWriter(os.path.join(date_dir, name), cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+                for i in range(20):
+                    writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+                writer.release()
+            
+            recorder = video_recorder_module.VideoRecorder()
+            result = recorder.reconcile_catalog()
+            check_test("Diskdagi segmentlar katalogga qo'shildi", result['added'] >= 2, f"Got: {result}")
+            
+            records = recorder.find_segment_records(TEST_CAMERA_ID, datetime(2024, 5, 1), datetime(2024, 5, 2))
+            check_test("Ikkala segment topildi", len(records) == 2, f"Got: {len(records)}")
+            check_test("Aniq tugash vaqti (2 s)",
+                 records and records[0]['end_time'] == datetime(2024, 5, 1, 10, 0, 2), f"Got: {records[:1]}")
+            check_test("Kadrlar soni saqlandi", records and records[0]['frame_count'] == 20)
+            
+            # 10:05 is in the gap between the segments (fixed 10-minute guess would match)
+            gap = recorder._find_segments(TEST_CAMERA_ID, datetime(2024, 5, 1, 10, 5), datetime(2024, 5, 1, 10, 6))
+            check_test("Segmentlar orasidagi bo'shliq", gap == [], f"Got: {gap}")
+            
+            os.remove(os.path.join(date_dir, '10-10-00.mp4'))
+            result = recorder.reconcile_catalog()
+            check_test("O'chirilgan fayl katalogdan olib tashlandi", result['removed'] >= 1, f"Got: {result}")
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Segment catalog tests", False, str(e))
+
+
+def test_keyframe_index():
+    """Test 23: Segment keyframe indeksi va tez qidiruv."""
+    print("\n" + "="*50)
+    print("2️⃣3️⃣ KEYFRAME INDEKSI TEKSHIRUVI")
+    print("="*50)
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import os
+        import subprocess
+        import tempfile
+        import numpy as np
+        from camera.keyframe_index import build_index, load_index, seek_frame, index_path
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 4 s at 10 fps with a keyframe every second; a bar at column N marks frame N
+            segment_path = os.path.join(tmp_dir, '10-00-00.mp4')
+            frames = [np.full((48, 64, 3), 100, dtype=np.uint8) for _ in range(40)]
+            for i, frame in enumerate(frames):
+                frame[:, i:i + 8] = 255
+            raw = b''.join(frame.tobytes() for frame in frames)
+            
+            def frame_number(frame):
+                return int(np.argmax(frame[:, :, 1].mean(axis=0) > 200))
+            subprocess.run([FFMPEG_BINARY, '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                            '-s', '64x48', '-r', '10', '-i', 'pipe:0', '-c:v', 'mpeg4', '-g', '10',
+                            '-q:v', '2', segment_path], input=raw, check=True, timeout=30)
+            
+            index = build_index(segment_path)
+            check_test("Indeks qurildi", index is not None and index.frame_count == 40,
+                 f"Got: {index and index.frame_count}")
+            check_test("Keyframe vaqtlari", list(np.round(index.keyframe_times, 3)) == [0, 1, 2, 3],
+                 f"Got: {index.keyframe_times}")
+            check_test("Sidecar fayl saqlandi", os.path.exists(index_path(segment_path)))
+            check_test("Vaqt bo'yicha kadr", index.frame_at(2.35) == 23, f"Got: {index.frame_at(2.35)}")
+            check_test("Eng yaqin keyframe", index.nearest_keyframe(2.8)[1] == 3.0,
+                 f"Got: {index.nearest_keyframe(2.8)}")
+            
+            loaded = load_index(segment_path, build=False)
+            check_test("Sidecar'dan yuklandi", loaded is not None and loaded.frame_count == 40)
+            
+            frame, actual = seek_frame(segment_path, 2.1, tolerance=0.5)
+            check_test("Keyframe qaytarildi", frame is not None and actual == 2.0, f"Got: {actual}")
+            check_test("Kadr o'lchami", frame is not None and frame.shape == (48, 64, 3))
+            check_test("To'g'ri kadr (keyframe)", frame is not None and frame_number(frame) == 20,
+                 f"Got: {frame_number(frame) if frame is not None else None}")
+            
+            frame, actual = seek_frame(segment_path, 2.55, tolerance=0)
+            check_test("Aniq kadr", frame is not None and abs(actual - 2.5) < 1e-6
+                 and frame_number(frame) == 25, f"Got: {actual}")
+                 
+    except Exception as e:
+        check_test("Keyframe index tests", False, str(e))
+
+
+def test_iter_frames():
+    """Test 24: Arxivdan kadrlarni generator orqali olish."""
+    print("\n" + "="*50)
+    print("2️⃣4️⃣ ITER_FRAMES GENERATOR TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import cv2
+        import types
+        import tempfile
+        import numpy as np
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        from camera.frame_extractor import frame_extractor, _task_frames, _task_windows
+        from database.v2_models import v2db
+        
+        TEST_CAMERA_ID = 99998
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(TEST_CAMERA_ID))
+        date_dir = os.path.join(camera_dir, '2024-05-01')
+        os.makedirs(date_dir)
+        
+        try:
+            # Two 2-second segments at 10 fps, back to back
+            for name in ('10-00-00.mp4', '10-00-02.mp4'):
+                writer = cv2.VideoWriter(os.path.join(date_dir, name), cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+                for i in range(20):
+                    writer.write(np.full((48, 64, 3), i * 10, dtype=np.uint8))
+                writer.release()
+            
+            video_recorder_module.VideoRecorder().reconcile_catalog()
+            
+            start, end = datetime(2024, 5, 1, 10, 0, 0), datetime(2024, 5, 1, 10, 0, 4)
+            frames = frame_extractor.iter_frames(TEST_CAMERA_ID, start, end, interval_seconds=0.5)
+            check_test("Generator qaytadi", isinstance(frames, types.GeneratorType))
+            
+            frames = list(frames)
+            times = [(f['timestamp'] - start).total_seconds() for f in frames]
+            check_test("Har 0.5 s da kadr, ikkala segmentdan", times == [i * 0.5 for i in range(8)], f"Got: {times}")
+            check_test("To'g'ri kadr dekodlandi", frames and abs(int(frames[1]['frame'].mean()) - 50) < 8,
+                 f"Got: {frames[1]['frame'].mean() if frames else None}")
+            
+            small = list(frame_extractor.iter_frames(TEST_CAMERA_ID, start, end, interval_seconds=0.5,
+                                                     resize=32, grayscale=True, max_frames=3))
+            check_test("max_frames", len(small) == 3, f"Got: {len(small)}")
+            check_test("resize + grayscale", small and small[0]['frame'].shape == (24, 32),
+                 f"Got: {small[0]['frame'].shape if small else None}")
+            
+            middle = list(frame_extractor.iter_frames(TEST_CAMERA_ID, datetime(2024, 5, 1, 10, 0, 1),
+                                                      datetime(2024, 5, 1, 10, 0, 3), interval_seconds=1))
+            check_test("Segment o'rtasidan boshlash", [f['timestamp'].second for f in middle] == [1, 2, 3],
+                 f"Got: {[f['timestamp'] for f in middle]}")
+            
+            # Variable frame rate (frames 2.0 - 3.8 s missing): times come from the frames, not from fps
+            import shutil
+            import subprocess
+            from utils.config import FFMPEG_BINARY
+            from utils.frame_workers import segment_frames
+            if shutil.which(FFMPEG_BINARY):
+                vfr_path = os.path.join(video_recorder_module.VIDEO_DIR, 'vfr.mp4')
+                subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'lavfi',
+                                '-i', 'testsrc=size=64x48:rate=5:duration=8',
+                                '-vf', r"select='not(between(n\,10\,19))'", '-fps_mode', 'vfr',
+                                '-c:v', 'libx264', '-pix_fmt', 'yuv420p', vfr_path], check=True, timeout=60)
+                vfr_times = [(t - start).total_seconds() for t, _ in
+                             segment_frames(vfr_path, start, start, end.replace(second=8), 1.0, None, False)]
+                check_test("O'zgaruvchan fps: kadr vaqti to'g'ri", vfr_times == [0.0, 1.0, 4.0, 5.0, 6.0, 7.0],
+                     f"Got: {vfr_times}")
+                vfr_times = [(t - start).total_seconds() for t, _ in
+                             segment_frames(vfr_path, start, start.replace(second=5), end.replace(second=8),
+                                            1.0, None, False)]
+                check_test("O'zgaruvchan fps: seek oshib ketmaydi", vfr_times == [5.0, 6.0, 7.0], f"Got: {vfr_times}")
+            
+            extracted = frame_extractor.extract_frames(TEST_CAMERA_ID, start, end, interval_seconds=1)
+            check_test("extract_frames ro'yxat qaytaradi", isinstance(extracted, list) and len(extracted) == 4,
+                 f"Got: {len(extracted)}")
+            
+            # Worker processes: same samples, in time order, with results computed in the worker
+            parallel = list(frame_extractor.iter_frames_parallel(TEST_CAMERA_ID, start, end, interval_seconds=0.5,
+                                                                 resize=None, analyzer=np.mean, workers=2))
+            check_test("Parallel: tartib va vaqtlar bir xil", [f['timestamp'] for f in parallel] ==
+                 [f['timestamp'] for f in frames], f"Got: {[f['timestamp'] for f in parallel]}")
+            check_test("Parallel: worker natijasi qaytdi", parallel and all(
+                 abs(p['detections'] - f['frame'].mean()) < 1 for p, f in zip(parallel, frames)))
+            
+            # Full-size frames: one grid point per task, still the same samples
+            windows = _task_windows({'start_time': start, 'end_time': start + timedelta(seconds=2)},
+                                    start, end, 0.5, _task_frames(None, False, None))
+            check_test("Parallel: segment oynalarga bo'linadi", len(windows) == 4 and windows[-1][1] == end,
+                 f"Got: {windows}")
+            windowed = list(frame_extractor.iter_frames_parallel(TEST_CAMERA_ID, start, end, interval_seconds=0.5,
+                                                                 resize=None, workers=2))
+            check_test("Parallel: oynalar bilan vaqtlar bir xil", [f['timestamp'] for f in windowed] ==
+                 [f['timestamp'] for f in frames], f"Got: {[f['timestamp'] for f in windowed]}")
+            
+            # Spawned workers import only the light worker module (no recorder, no database)
+            import subprocess
+            probe = subprocess.run(
+                [sys.executable, '-c', "import sys, utils.frame_workers; "
+                 "print(sorted(m for m in sys.modules if m.split('.')[0] in ('camera', 'database')))"],
+                capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            check_test("Worker moduli recorder/bazani import qilmaydi", probe.stdout.strip() == '[]',
+                 f"Got: {probe.stdout.strip() or probe.stderr[-200:]}")
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Iter frames tests", False, str(e))
+
+
+def test_clip_cache():
+    """Test 25: Klip keshi (LRU, atomik yozish, single-flight)."""
+    print("\n" + "="*50)
+    print("2️⃣5️⃣ KLIP KESHI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import time
+        import tempfile
+        import threading
+        from datetime import datetime
+        from camera.clip_cache import ClipCache, quantize_range
+        
+        start, end = quantize_range(datetime(2024, 5, 1, 10, 0, 7), datetime(2024, 5, 1, 10, 0, 31), quantum=10)
+        check_test("Vaqt oralig'i kvantlandi", (start.second, end.second) == (0, 40), f"Got: {start}, {end}")
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            segment = os.path.join(tmp_dir, 'segment.mp4')
+            with open(segment, 'wb') as f:
+                f.write(b'x' * 100)
+            
+            # Leftover of an interrupted write is removed on load
+            clip_dir = os.path.join(tmp_dir, 'clips')
+            os.makedirs(clip_dir)
+            open(os.path.join(clip_dir, 'clip_1_old.tmp-1234.mp4'), 'wb').close()
+            
+            cache = ClipCache(clip_dir, max_bytes=2500)
+            builds = []
+            
+            def build(path):
+                builds.append(path)
+                time.sleep(0.2)
+                with open(path, 'wb') as f:
+                    f.write(b'c' * 1000)
+                return True
+            
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(
+                cache.get_or_create(1, start, end, [segment], build))) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            check_test("Bir xil so'rovlar bitta build'ni bo'lishdi", len(builds) == 1, f"Got: {len(builds)}")
+            check_test("Hammasi bir xil faylni oldi", len(set(results)) == 1 and os.path.exists(results[0]))
+            check_test("Vaqtinchalik fayllar qolmadi",
+                 not [name for name in os.listdir(clip_dir) if '.tmp-' in name], f"Got: {os.listdir(clip_dir)}")
+            
+            cache.get_or_create(1, start, end, [segment], build)
+            check_test("Takroriy so'rov keshdan", len(builds) == 1 and cache.hits >= 5, f"Got: {cache.get_stats()}")
+            
+            # Source segment changed (still recording) -> new key, new build
+            with open(segment, 'ab') as f:
+                f.write(b'y')
+            second = cache.get_or_create(1, start, end, [segment], build)
+            check_test("O'zgargan segment qayta quriladi", len(builds) == 2 and second != results[0])
+            
+            # Budget of 2500 bytes: the third 1000-byte clip evicts the least recently used one
+            cache.get_or_create(1, start, end, [], build)
+            check_test("LRU bo'yicha o'chirildi", cache.evictions == 1 and not os.path.exists(results[0])
+                 and os.path.exists(second), f"Got: {cache.get_stats()}")
+            
+            failed = cache.get_or_create(2, start, end, [segment], lambda path: False)
+            check_test("Muvaffaqiyatsiz build None qaytaradi", failed is None)
+            check_test("Muvaffaqiyatsiz build qulfi qolmaydi", not cache._build_locks, f"Got: {cache._build_locks}")
+            
+    except Exception as e:
+        check_test("Clip cache tests", False, str(e))
+
+
+def test_async_clip_extraction():
+    """Test 26: Asinxron klip olish (single-flight, bekor qilish)."""
+    print("\n" + "="*50)
+    print("2️⃣6️⃣ ASINXRON KLIP TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import asyncio
+        import tempfile
+        from datetime import datetime
+        from camera.clip_cache import ClipCache
+        
+        start, end = datetime(2024, 5, 1, 10, 0, 0), datetime(2024, 5, 1, 10, 0, 30)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ClipCache(tmp_dir, max_bytes=10 ** 6)
+            builds = []
+            cancelled = []
+            
+            async def build(path):
+                builds.append(path)
+                try:
+                    await asyncio.sleep(0.2)
+                except asyncio.CancelledError:
+                    cancelled.append(path)
+                    raise
+                with open(path, 'wb') as f:
+                    f.write(b'c' * 100)
+                return True
+            
+            async def scenario():
+                # Three identical requests, one build; the event loop keeps running meanwhile
+                ticks = 0
+                
+                async def ticker():
+                    nonlocal ticks
+                    while True:
+                        ticks += 1
+                        await asyncio.sleep(0.01)
+                
+                ticking = asyncio.create_task(ticker())
+                paths = await asyncio.gather(*[cache.get_or_create_async(1, start, end, [], build) for _ in range(3)])
+                ticking.cancel()
+                
+                # One of two waiters leaves: the build continues for the other
+                first = asyncio.create_task(cache.get_or_create_async(2, start, end, [], build))
+                second = asyncio.create_task(cache.get_or_create_async(2, start, end, [], build))
+                await asyncio.sleep(0.05)
+                first.cancel()
+                shared = await second
+                
+                # The only waiter leaves: the build is cancelled
+                lonely = asyncio.create_task(cache.get_or_create_async(3, start, end, [], build))
+                await asyncio.sleep(0.05)
+                lonely.cancel()
+                await asyncio.sleep(0.05)
+                
+                return paths, ticks, shared
+            
+            paths, ticks, shared = asyncio.run(scenario())
+            
+            check_test("Bir xil so'rovlar bitta build'ni bo'lishdi", len(set(paths)) == 1 and os.path.exists(paths[0]))
+            check_test("Event loop bloklanmadi", ticks >= 10, f"Got: {ticks} ticks")
+            check_test("Boshqa kutuvchi qolganda build davom etdi", shared is not None and os.path.exists(shared))
+            check_test("Oxirgi kutuvchi ketganda build bekor qilindi", len(cancelled) == 1, f"Got: {cancelled}")
+            check_test("Jami 3 ta build", len(builds) == 3, f"Got: {len(builds)}")
+            check_test("Vaqtinchalik fayllar qolmadi", not [n for n in os.listdir(tmp_dir) if '.tmp-' in n],
+                 f"Got: {os.listdir(tmp_dir)}")
+                 
+    except Exception as e:
+        check_test("Async clip tests", False, str(e))
+
+
+def test_clip_trimming():
+    """Test 27: Ko'p segmentli klipni stream copy bilan kesish."""
+    print("\n" + "="*50)
+    print("2️⃣7️⃣ KLIP KESISH TEKSHIRUVI")
+    print("="*50)
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import os
+        import subprocess
+        import tempfile
+        import numpy as np
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        from camera.keyframe_index import build_index
+        from database.v2_models import v2db
+        
+        encoders = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-encoders'], capture_output=True, text=True).stdout
+        codec = 'libx264' if 'libx264' in encoders else 'mpeg4'
+        
+        TEST_CAMERA_ID = 99997
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(TEST_CAMERA_ID))
+        date_dir = os.path.join(camera_dir, '2024-05-01')
+        os.makedirs(date_dir)
+        
+        try:
+            # Two 20-second segments at 10 fps with a keyframe every 3 s
+            for name in ('10-00-00.mp4', '10-00-20.mp4'):
+                frames = [np.full((48, 64, 3), 100, dtype=np.uint8) for _ in range(200)]
+                for i, frame in enumerate(frames):
+                    frame[:, i % 56:i % 56 + 8] = 255
+                subprocess.run([FFMPEG_BINARY, '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '64x48',
+                                '-r', '10', '-i', 'pipe:0', '-c:v', codec, '-g', '30', '-sc_threshold', '0',
+                                '-pix_fmt', 'yuv420p',
+                                os.path.join(date_dir, name)],
+                               input=b''.join(frame.tobytes() for frame in frames), check=True, timeout=60)
+            
+            recorder = video_recorder_module.VideoRecorder()
+            recorder.reconcile_catalog()
+            
+            # 10:00:10 - 10:00:30 spans both segments; whole segments would be 40 s
+            start, end = datetime(2024, 5, 1, 10, 0, 10), datetime(2024, 5, 1, 10, 0, 30)
+            clip = recorder.extract_clip(TEST_CAMERA_ID, start, end)
+            index = build_index(clip, save=False) if clip else None
+            duration = index.frame_count / 10 if index else None
+            check_test("Klip so'ralgan oraliqqa kesildi", duration is not None and 20 <= duration <= 21.5, f"Got: {duration}")
+            check_test("Klip keyframe'dan boshlanadi (9 s)", duration is not None and 21 <= duration <= 21.3,
+                 f"Got: {duration}")
+            check_test("Vaqtinchalik fayllar qolmadi",
+                 not [n for n in os.listdir(os.path.dirname(clip)) if n.endswith(('.txt', '.head.mp4'))])
+            
+            if codec == 'libx264':
+                exact = recorder.extract_clip(TEST_CAMERA_ID, start, end, accurate=True)
+                index = build_index(exact, save=False) if exact else None
+                duration = index.frame_count / 10 if index else None
+                check_test("Aniq kesish: boshi qayta kodlandi", duration is not None and 20 <= duration <= 20.3,
+                     f"Got: {duration}")
+                check_test("Aniq kesish alohida keshlanadi", exact != clip)
+            
+            # ffmpeg failing on a segment fails the clip instead of copying the whole segment
+            import asyncio
+            broken = os.path.join(date_dir, '10-05-00.mp4')
+            with open(broken, 'wb') as f:
+                f.write(b'not a video' * 100)
+            broken_start, broken_end = datetime(2024, 5, 1, 10, 5, 0), datetime(2024, 5, 1, 10, 5, 10)
+            failed_path = os.path.join(video_recorder_module.VIDEO_DIR, 'failed.mp4')
+            failed = recorder._render_clip([broken], broken_start, broken_end, failed_path)
+            failed_async = asyncio.run(recorder._render_clip_async([broken], broken_start, broken_end, failed_path))
+            check_test("ffmpeg xatosida butun segment yuborilmaydi", not failed and not failed_async
+                 and not os.path.exists(failed_path), f"Got: {failed}, {failed_async}")
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Clip trimming tests", False, str(e))
+
+
+def test_event_clips():
+    """Test 28: Xotiradagi paket halqasidan hodisa klipi (pre/post-roll)."""
+    print("\n" + "="*50)
+    print("2️⃣8️⃣ HODISA KLIPI TEKSHIRUVI")
+    print("="*50)
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import io
+        import os
+        import subprocess
+        import tempfile
+        import threading
+        import time
+        import cv2
+        import numpy as np
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        from camera.packet_ring import PacketRing
+        
+        TEST_CAMERA_ID = 99996
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        recorder = video_recorder_module.video_recorder
+        
+        try:
+            # 5 seconds at 10 fps with a keyframe every second
+            source = os.path.join(video_recorder_module.VIDEO_DIR, 'source.mp4')
+            frames = [np.full((48, 64, 3), 100, dtype=np.uint8) for _ in range(50)]
+            for i, frame in enumerate(frames):
+                frame[:, i % 56:i % 56 + 8] = 255
+            subprocess.run([FFMPEG_BINARY, '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '64x48',
+                            '-r', '10', '-i', 'pipe:0', '-g', '10', '-pix_fmt', 'yuv420p', source],
+                           input=b''.join(frame.tobytes() for frame in frames), check=True, timeout=60)
+            
+            fragmented = [FFMPEG_BINARY, '-v', 'error', '-i', source, '-map', '0:v:0', '-c', 'copy', '-f', 'mp4',
+                          '-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-flush_packets', '1', 'pipe:1']
+            
+            # Parsing: one fragment per GOP, durations from the moof boxes
+            ring = PacketRing(TEST_CAMERA_ID)
+            ring.read_from(io.BytesIO(subprocess.run(fragmented, capture_output=True, check=True).stdout))
+            fragments = ring.fragments(0, float('inf'))
+            check_test("Init segment o'qildi", ring.init_segment is not None)
+            # The muxer may flush the last GOP's final frames as a fragment of their own
+            check_test("Har GOP bitta fragment", 5 <= len(fragments) <= 6, f"Got: {len(fragments)}")
+            check_test("Fragment davomiyligi", abs(sum(f.duration for f in fragments) - 5.0) < 0.01,
+                 f"Got: {sum(f.duration for f in fragments)}")
+            check_test("Fragmentlar keyframe'dan boshlanadi", all(f.keyframe for f in fragments))
+            
+            # Live: the stream arrives in real time, an alert fires 2.5 s in
+            ring = PacketRing(TEST_CAMERA_ID)
+            recorder.packet_rings[TEST_CAMERA_ID] = ring
+            process = subprocess.Popen(fragmented[:1] + ['-re'] + fragmented[1:], stdout=subprocess.PIPE)
+            reader = threading.Thread(target=ring.read_from, args=(process.stdout,), daemon=True)
+            reader.start()
+            time.sleep(2.5)
+            
+            fired = time.time()
+            clip = recorder.capture_event_clip(TEST_CAMERA_ID, datetime.now(), pre_roll=1.0, post_roll=1.0)
+            check_test("Alert darhol qaytadi", time.time() - fired < 0.5, f"Got: {time.time() - fired:.2f}s")
+            first_end = recorder._event_clips[TEST_CAMERA_ID].end
+            time.sleep(0.3)
+            check_test("Yaqin hodisalar bitta klipni bo'lishadi",
+                 clip is not None and recorder.capture_event_clip(TEST_CAMERA_ID, pre_roll=1.0, post_roll=1.0) is clip)
+            check_test("Keyingi hodisa post-rollni uzaytiradi",
+                 recorder._event_clips[TEST_CAMERA_ID].end >= first_end + 0.3)
+            
+            # The anomaly detector's alert joins the same clip (needs the AI dependencies)
+            anomaly = None
+            try:
+                from ai.anomaly_detector import AnomalyDetector, Anomaly, AnomalyType, AlertLevel
+                anomaly = Anomaly(type=AnomalyType.RUNNING, level=AlertLevel.WARNING, confidence=0.9,
+                                  description="test", timestamp=datetime.now(), camera_id=TEST_CAMERA_ID)
+                AnomalyDetector()._notify_alert(anomaly)
+            except ImportError as e:
+                print(f"⏭️ {e} - anomaliya tekshiruvi o'tkazib yuborildi")
+            
+            clip_path = clip.result(timeout=15) if clip else None
+            latency = time.time() - fired
+            process.wait(timeout=15)
+            reader.join(timeout=5)
+            
+            check_test("Hodisa klipi yozildi", clip_path is not None and os.path.exists(clip_path))
+            check_test("Klip segment yopilishini kutmaydi", latency < 10.5, f"Got: {latency:.2f}s")
+            if anomaly is not None:
+                check_test("Klip anomaliyaga biriktirildi", anomaly.clip_path == clip_path,
+                     f"Got: {anomaly.clip_path}")
+            
+            frame_count = 0
+            if clip_path:
+                cap = cv2.VideoCapture(clip_path)
+                while cap.grab():
+                    frame_count += 1
+                cap.release()
+            # 1 s pre-roll + 1 s post-roll, widened to whole GOPs: 2 - 4 s of the 5 s stream
+            check_test("Klip pre/post-roll oralig'ini qamraydi", 20 <= frame_count <= 40, f"Got: {frame_count}")
+            
+            check_test("Halqasiz kamera - klip yo'q", recorder.capture_event_clip(TEST_CAMERA_ID + 1) is None)
+            
+            # Two clips starting in the same second get separate files
+            recorder.packet_rings[TEST_CAMERA_ID] = ring
+            moment = datetime.fromtimestamp(ring.newest_end - 1.0)
+            paths = [recorder.capture_event_clip(TEST_CAMERA_ID, moment, pre_roll=1.0, post_roll=0.5)
+                     .result(timeout=15)]
+            paths.append(recorder.capture_event_clip(TEST_CAMERA_ID, moment, pre_roll=1.0, post_roll=0.5)
+                         .result(timeout=15))
+            check_test("Bir soniyadagi kliplar ustma-ust yozilmaydi",
+                 None not in paths and paths[0] != paths[1] and all(os.path.exists(p) for p in paths),
+                 f"Got: {paths}")
+            
+            written = sum(os.path.getsize(p) for p in [clip_path] + paths if p)
+            check_test("Yozilgan kliplar saqlash hisobiga qo'shiladi",
+                 recorder.storage.event_clip_bytes() == written,
+                 f"Got: {recorder.storage.event_clip_bytes()} vs {written}")
+        finally:
+            recorder.packet_rings.pop(TEST_CAMERA_ID, None)
+            shutil.rmtree(video_recorder_module.VIDEO_DIR, ignore_errors=True)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Event clip tests", False, str(e))
+
+
+def test_recording_policy():
+    """Test 29: Kamera yozuv siyosati (uzluksiz / harakatda / jadval)."""
+    print("\n" + "="*50)
+    print("2️⃣9️⃣ YOZUV SIYOSATI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        from datetime import datetime
+        from camera.recording_policy import RecordingPolicy, parse_schedule
+        
+        night = RecordingPolicy(mode='scheduled', windows=parse_schedule('22:00-06:00, 12:00-13:00'))
+        check_test("Jadval yarim tundan o'tadi", night.in_schedule(datetime(2024, 5, 1, 2, 0)))
+        check_test("Jadval oynasi", night.in_schedule(datetime(2024, 5, 1, 12, 30)))
+        check_test("Jadvaldan tashqari", not night.in_schedule(datetime(2024, 5, 1, 15, 0)))
+        
+        motion = RecordingPolicy(mode='motion', post_roll=30)
+        check_test("Harakatdan keyin post-roll", motion.should_record(1000.0, last_motion=980.0))
+        check_test("Post-roll tugadi", not motion.should_record(1000.0, last_motion=960.0))
+        check_test("Harakat bo'lmagan", not motion.should_record(1000.0, last_motion=None))
+        check_test("Noto'g'ri siyosat - uzluksiz",
+             RecordingPolicy.from_camera({'recording_policy': 'sometimes'}).continuous)
+        
+        # Motion-only recording reuses the analysis motion gate's scores
+        import time
+        from camera.recording_policy import MotionMonitor
+        
+        class AnalysisGate:
+            def get_threshold(self, camera_id):
+                return 0.01
+            
+            def get_history(self, camera_id, seconds=60):
+                return [(now - 3.0, 0.2), (now - 1.0, 0.001)]
+            
+            def get_score(self, camera_id, max_age=None):
+                return object()
+        
+        now = time.time()
+        monitor = MotionMonitor()
+        monitor._motion_gate = lambda: AnalysisGate()
+        check_test("Motion gate baholari qayta ishlatiladi", monitor.last_motion(7) == now - 3.0)
+        check_test("Gate ishlasa o'z obunasi kerak emas", monitor._has_source(7))
+        monitor._motion_gate = lambda: None
+        check_test("Manba bo'lmasa o'z obunasi ochiladi", not monitor._has_source(8))
+        
+        try:
+            parse_schedule('22:00')
+            check_test("Noto'g'ri jadval rad etildi", False)
+        except ValueError:
+            check_test("Noto'g'ri jadval rad etildi", True)
+    except Exception as e:
+        check_test("Recording policy tests", False, str(e))
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import io
+        import os
+        import subprocess
+        import tempfile
+        import numpy as np
+        from datetime import datetime
+        import camera.video_recorder as video_recorder_module
+        from camera.packet_ring import PacketRing, read_box
+        from camera.recording_policy import RecordingPolicy, RingSegmentWriter
+        from camera.keyframe_index import build_index
+        from database.v2_models import v2db
+        
+        TEST_CAMERA_ID = 99995
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(TEST_CAMERA_ID))
+        
+        try:
+            # 20 s at 10 fps, keyframe every 2 s, a fragment every second
+            source = os.path.join(video_recorder_module.VIDEO_DIR, 'source.mp4')
+            frames = [np.full((48, 64, 3), 100, dtype=np.uint8) for _ in range(200)]
+            for i, frame in enumerate(frames):
+                frame[:, i % 56:i % 56 + 8] = 255
+            subprocess.run([FFMPEG_BINARY, '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '64x48',
+                            '-r', '10', '-i', 'pipe:0', '-g', '20', '-sc_threshold', '0', '-bf', '0',
+                            '-pix_fmt', 'yuv420p', source],
+                           input=b''.join(frame.tobytes() for frame in frames), check=True, timeout=60)
+            stream = io.BytesIO(subprocess.run(
+                [FFMPEG_BINARY, '-v', 'error', '-i', source, '-c', 'copy', '-f', 'mp4',
+                 '-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-frag_duration', '1000000', 'pipe:1'],
+                capture_output=True, check=True).stdout)
+            
+            recorder = video_recorder_module.VideoRecorder()
+            ring = PacketRing(TEST_CAMERA_ID, seconds=30)
+            base = datetime(2024, 5, 1, 12, 0, 0).timestamp()
+            clock = [base]
+            
+            # Motion at 12:00:10.2 only; 3 s pre-roll, 2 s post-roll
+            policy = RecordingPolicy(mode='motion', pre_roll=3, post_roll=2)
+            writer = RingSegmentWriter(
+                TEST_CAMERA_ID, ring, policy,
+                last_motion=lambda: base + 10.2 if clock[0] >= base + 10.2 else None,
+                segment_path=lambda start_time: recorder._get_segment_path(TEST_CAMERA_ID, start_time),
+                on_segment=lambda start_time, path, duration: recorder._save_segment_info(
+                    TEST_CAMERA_ID, start_time, path, None, duration),
+                on_skipped=lambda start_time, end_time: recorder._save_skipped_span(
+                    TEST_CAMERA_ID, start_time, end_time),
+                segment_duration=600
+            )
+            ring.listeners.append(writer)
+            
+            # Feed the ring as if the stream arrived in real time
+            ftyp, moof = b'', None
+            while True:
+                box = read_box(stream)
+                if box is None:
+                    break
+                box_type, data = box
+                if box_type == b'ftyp':
+                    ftyp = data
+                elif box_type == b'moov':
+                    ring.set_init(ftyp + data)
+                elif box_type == b'moof':
+                    moof = data
+                elif box_type == b'mdat':
+                    clock[0] += 1.0
+                    ring.add_fragment(moof, data, clock[0])
+            writer.close(now=base + 20)
+            
+            timeline = recorder.get_timeline(TEST_CAMERA_ID, datetime(2024, 5, 1, 11), datetime(2024, 5, 1, 13))
+            spans = [(span['status'], span['start_time'].strftime('%H:%M:%S'), span['end_time'].strftime('%H:%M:%S'))
+                     for span in timeline]
+            check_test("Vaqt chizig'i: o'tkazib yuborilgan / yozilgan / o'tkazib yuborilgan",
+                 spans == [('skipped', '12:00:00', '12:00:06'), ('active', '12:00:06', '12:00:12'),
+                           ('skipped', '12:00:12', '12:00:20')], f"Got: {spans}")
+            
+            records = recorder.find_segment_records(TEST_CAMERA_ID, datetime(2024, 5, 1, 11), datetime(2024, 5, 1, 13))
+            index = build_index(records[0]['file_path'], save=False) if records else None
+            check_test("Faqat yozilgan segment topiladi", len(records) == 1, f"Got: {len(records)}")
+            check_test("Segment pre-roll bilan keyframe'dan boshlanadi (6 s)",
+                 index is not None and index.frame_count == 60, f"Got: {index.frame_count if index else None}")
+            check_test("Segment vaqti noldan boshlanadi", index is not None and abs(index.pts[0]) < 0.01,
+                 f"Got: {index.pts[0] if index else None}")
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            v2db.delete_skipped_spans(camera_id=TEST_CAMERA_ID)
+            shutil.rmtree(video_recorder_module.VIDEO_DIR, ignore_errors=True)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Ring segment writer tests", False, str(e))
+
+
+def test_archive_retention():
+    """Test 30: Arxiv hajmi hisobi va kvota bo'yicha tozalash."""
+    print("\n" + "="*50)
+    print("3️⃣0️⃣ ARXIV SAQLASH KVOTASI TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import os
+        import shutil
+        import tempfile
+        from datetime import datetime, timedelta
+        import camera.video_recorder as video_recorder_module
+        from database.v2_models import v2db
+        
+        TEST_CAMERA_ID = 99994
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(TEST_CAMERA_ID))
+        
+        try:
+            recorder = video_recorder_module.VideoRecorder()
+            recorder.storage.reload()
+            baseline = recorder.storage.total_bytes
+            
+            # One segment past the age limit, four recent ones, 1000 bytes each
+            now = datetime.now().replace(microsecond=0)
+            starts = [now - timedelta(days=40)] + [now - timedelta(minutes=50 - 10 * i) for i in range(4)]
+            paths = []
+            for start in starts:
+                path = recorder._get_segment_path(TEST_CAMERA_ID, start)
+                with open(path, 'wb') as f:
+                    f.write(b'\0' * 1000)
+                recorder._save_segment_info(TEST_CAMERA_ID, start, path, duration=600)
+                paths.append(path)
+            
+            # Re-registering a segment must not count it twice
+            recorder._save_segment_info(TEST_CAMERA_ID, starts[-1], paths[-1], duration=600)
+            
+            usage = recorder.storage.camera_usage(TEST_CAMERA_ID)
+            check_test("Kamera hajmi yangilanadi (fayllarni aylanmasdan)",
+                 usage['bytes'] == 5000 and usage['segments'] == 5, f"Got: {usage}")
+            check_test("Umumiy hajm", recorder.storage.total_bytes == baseline + 5000,
+                 f"Got: {recorder.storage.total_bytes - baseline}")
+            stats = recorder.get_archive_stats(TEST_CAMERA_ID)
+            check_test("Arxiv statistikasi", stats['segment_count'] == 5
+                 and stats['oldest_date'] == starts[0].strftime('%Y-%m-%d'), f"Got: {stats}")
+            
+            # 2500-byte camera quota: the expired segment goes, then the two oldest recent ones
+            recorder.storage.camera_max_bytes = 2500
+            check_test("Kvota oshgani aniqlanadi", recorder.storage.over_quota(TEST_CAMERA_ID))
+            result = recorder.cleanup_old_archives(retention_days=30)
+            check_test("Muddati o'tgan va kvotadan ortiq segmentlar o'chirildi",
+                 result == {'expired': 1, 'evicted': 2}, f"Got: {result}")
+            check_test("Eng eski segmentlar o'chirildi, yangilari qoldi",
+                 [os.path.exists(path) for path in paths] == [False, False, False, True, True])
+            
+            usage = recorder.storage.camera_usage(TEST_CAMERA_ID)
+            check_test("Hisob o'chirishdan keyin to'g'ri",
+                 usage['bytes'] == 2000 and usage['segments'] == 2 and usage['oldest'] == starts[3],
+                 f"Got: {usage}")
+            
+            catalog = next((row for row in v2db.get_archive_usage() if row['camera_id'] == TEST_CAMERA_ID), None)
+            check_test("Hisob katalog bilan mos",
+                 catalog is not None and catalog['segments'] == 2 and round(catalog['size_mb'] * 1024 * 1024) == 2000,
+                 f"Got: {catalog}")
+            check_test("Kvota ichida", not recorder.storage.over_quota(TEST_CAMERA_ID))
+            
+            # Event clips: an expired date directory goes by age, then the oldest over budget
+            events_dir = os.path.join(video_recorder_module.VIDEO_DIR, 'events')
+            old_day = (now - timedelta(days=40)).strftime('%Y-%m-%d')
+            clip_paths = [os.path.join(events_dir, old_day, f"{TEST_CAMERA_ID}_10-00-00_aaaaaa.mp4")]
+            for i in range(3):
+                clip_paths.append(os.path.join(events_dir, now.strftime('%Y-%m-%d'),
+                                               f"{TEST_CAMERA_ID}_10-00-0{i}_bbbbb{i}.mp4"))
+            for i, path in enumerate(clip_paths):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b'\0' * 1000)
+                os.utime(path, (now.timestamp() + i, now.timestamp() + i))
+            
+            # A restarted recorder counts the clips on disk once, then keeps the total in its ledger
+            recorder = video_recorder_module.VideoRecorder()
+            stats = recorder.get_storage_stats()
+            check_test("Hodisa kliplari statistikada",
+                 recorder.storage.event_clip_bytes() == 4000 and 'event_clips_mb' in stats,
+                 f"Got: {recorder.storage.event_clip_bytes()}")
+            recorder.event_clips_max_bytes = 1500
+            recorder.cleanup_old_archives(retention_days=30)
+            check_test("Eski va byudjetdan ortiq hodisa kliplari o'chirildi",
+                 [os.path.exists(path) for path in clip_paths] == [False, False, False, True]
+                 and not os.path.exists(os.path.dirname(clip_paths[0])),
+                 f"Got: {[os.path.exists(path) for path in clip_paths]}")
+            check_test("Hodisa kliplari hisobi o'chirishdan keyin to'g'ri",
+                 recorder.storage.event_clip_bytes() == 1000, f"Got: {recorder.storage.event_clip_bytes()}")
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            shutil.rmtree(video_recorder_module.VIDEO_DIR, ignore_errors=True)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Archive retention tests", False, str(e))
+
+
+def test_archive_compaction():
+    """Test 31: Eskirgan segmentlarni past sifatga qayta kodlash."""
+    print("\n" + "="*50)
+    print("3️⃣1️⃣ ARXIV SIQISH TEKSHIRUVI")
+    print("="*50)
+    
+    import shutil
+    from utils.config import FFMPEG_BINARY
+    if shutil.which(FFMPEG_BINARY) is None:
+        print("⏭️ ffmpeg topilmadi - test o'tkazib yuborildi")
+        return
+    
+    try:
+        import os
+        import subprocess
+        import tempfile
+        import numpy as np
+        from datetime import datetime, timedelta
+        import camera.video_recorder as video_recorder_module
+        from camera.archive_compactor import QUALITY_TIERS, TMP_MARKER
+        from camera.keyframe_index import index_path
+        from database.models import db
+        from database.v2_models import v2db
+        
+        original_dir = video_recorder_module.VIDEO_DIR
+        video_recorder_module.VIDEO_DIR = tempfile.mkdtemp()
+        org_id = db.create_organization('Compaction test', 0)
+        camera_id = db.add_camera('compaction-test', '127.0.0.1', 554, 'admin', 'admin', organization_id=org_id)
+        camera_dir = os.path.join(video_recorder_module.VIDEO_DIR, str(camera_id))
+        
+        def encode(path, width, height, frame_count):
+            # Random noise: large at high quality, so a 480p / 500 kbit/s re-encode is much smaller
+            frames = np.random.randint(0, 255, (frame_count, height, width, 3), dtype=np.uint8)
+            subprocess.run([FFMPEG_BINARY, '-v', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                            '-s', f'{width}x{height}', '-r', '5', '-i', 'pipe:0', '-c:v', 'libx264',
+                            '-crf', '18', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path],
+                           input=frames.tobytes(), check=True, timeout=120)
+        
+        def candidates_of(camera_id):
+            return [row for row in v2db.get_compaction_candidates(now - timedelta(days=7), list(QUALITY_TIERS))
+                    if row['camera_id'] == camera_id]
+        
+        try:
+            recorder = video_recorder_module.VideoRecorder()
+            recorder.storage.reload()
+            compactor = recorder.compactor
+            
+            now = datetime.now().replace(microsecond=0)
+            big_start, tiny_start, recent_start = now - timedelta(days=10), now - timedelta(days=9), now - timedelta(hours=1)
+            paths = {}
+            for name, start, size in (('big', big_start, (1280, 720)), ('tiny', tiny_start, (64, 48)),
+                                      ('recent', recent_start, (64, 48))):
+                paths[name] = recorder._get_segment_path(camera_id, start)
+                encode(paths[name], size[0], size[1], 20)
+                recorder._save_segment_info(camera_id, start, paths[name], duration=4)
+            
+            # Re-encodes are lossy: nothing is compacted until the organization picks a quality
+            check_test("Sifat tanlanmagan tashkilot siqilmaydi", not candidates_of(camera_id))
+            
+            db.update_archive_quality(org_id, '480')
+            candidates = candidates_of(camera_id)
+            check_test("Faqat eskirgan segmentlar tanlanadi",
+                 [row['file_path'] for row in candidates] == [paths['big'], paths['tiny']],
+                 f"Got: {[row['file_path'] for row in candidates]}")
+            check_test("Tashkilot arxiv sifati saqlanadi",
+                 all(row['archive_quality'] == '480' for row in candidates), f"Got: {candidates}")
+            
+            big_size = os.path.getsize(paths['big'])
+            tiny_mtime = os.path.getmtime(paths['tiny'])
+            before = recorder.storage.camera_usage(camera_id)['bytes']
+            outcomes = [compactor.compact_segment(row) for row in candidates]
+            check_test("Katta segment siqildi, kichigi o'zgarmadi", outcomes == ['compacted', 'kept'],
+                 f"Got: {outcomes}")
+            
+            probe = recorder._probe_segment(paths['big'])
+            new_size = os.path.getsize(paths['big'])
+            check_test("Segment 480p ga tushirildi", probe.get('height') == 480 and probe.get('frame_count') == 20,
+                 f"Got: {probe}")
+            check_test("Fayl hajmi kamaydi", new_size < big_size / 2, f"Got: {big_size} -> {new_size}")
+            check_test("Kichik segment qayta kodlanmadi", os.path.getmtime(paths['tiny']) == tiny_mtime)
+            check_test("Vaqtinchalik fayllar qolmadi",
+                 not any(TMP_MARKER in name for name in os.listdir(os.path.dirname(paths['big']))))
+            check_test("Keyframe indeksi yangilandi", os.path.exists(index_path(paths['big'])))
+            
+            rows = {row['file_path']: row for row in v2db.get_video_archives(camera_id)}
+            check_test("Katalog yangilandi",
+                 rows[paths['big']]['tier'] == '480' and rows[paths['big']]['height'] == 480
+                 and round(rows[paths['big']]['size_mb'] * 1024 * 1024) == new_size
+                 and rows[paths['tiny']]['tier'] == '480' and rows[paths['recent']]['tier'] is None)
+            check_test("Saqlash hisobi kamaydi",
+                 recorder.storage.camera_usage(camera_id)['bytes'] == before - (big_size - new_size))
+            check_test("Qayta tanlanmaydi", not candidates_of(camera_id))
+        finally:
+            v2db.delete_video_archives_under(camera_dir)
+            db.delete_camera(camera_id)
+            conn = db._get_connection()
+            conn.execute('DELETE FROM organizations WHERE id = ?', (org_id,))
+            conn.commit()
+            conn.close()
+            shutil.rmtree(video_recorder_module.VIDEO_DIR, ignore_errors=True)
+            video_recorder_module.VIDEO_DIR = original_dir
+            
+    except Exception as e:
+        check_test("Archive compaction tests", False, str(e))
+
+
+def test_continuous_grab():
+    """Test 32: Uzluksiz o'qish rejimi va oxirgi kadr qutisi (mailbox)."""
+    print("\n" + "="*50)
+    print("3️⃣2️⃣ UZLUKSIZ O'QISH TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import threading
+        import time
+        import numpy as np
+        from camera.rtsp_client import RTSPCamera
+        
+        class CountingCapture:
+            """Stand-in capture: frame N is filled with N, reads block while paused."""
+            def __init__(self):
+                self.reads = 0
+                self.running = threading.Event()
+                self.running.set()
+            
+            def isOpened(self):
+                return True
+            
+            def read(self):
+                self.running.wait()
+                time.sleep(0.005)
+                self.reads += 1
+                return True, np.full((4, 4, 3), self.reads % 256, dtype=np.uint8)
+            
+            def release(self):
+                pass
+        
+        camera = RTSPCamera(99990, 'grab-test', '127.0.0.1', 554, 'admin', 'admin', continuous=True)
+        capture = CountingCapture()
+        camera.cap = capture
+        camera.is_connected = True
+        
+        check_test("Grabber ishga tushdi", camera.start_grabber() and camera.is_grabbing)
+        time.sleep(0.2)
+        
+        # Pause the "camera" and let the grabber finish its last read
+        capture.running.clear()
+        time.sleep(0.05)
+        reads = capture.reads
+        frame = camera.get_frame(max_age=1.0)
+        check_test("Eng oxirgi kadr qaytadi", frame is not None and int(frame[0, 0, 0]) == reads % 256,
+             f"Got: {None if frame is None else int(frame[0, 0, 0])}, reads={reads}")
+        
+        camera.get_frame(max_age=1.0)
+        camera.read_frame()
+        check_test("Mailbox dekoderga tegmaydi", capture.reads == reads, f"Got: {capture.reads - reads} reads")
+        
+        time.sleep(0.3)
+        check_test("Eskirgan kadr rad etiladi", camera.get_frame(max_age=0.2) is None)
+        check_test("max_age=None eskirgan kadrni qaytaradi", camera.get_frame(max_age=None) is not None)
+        
+        capture.running.set()
+        time.sleep(0.1)
+        check_test("Yangi kadr kelgach yana qaytadi", camera.get_frame(max_age=0.2) is not None)
+        
+        camera.stop_grabber()
+        check_test("Grabber to'xtadi", not camera.is_grabbing)
+        
+        # Without a grabber, direct readers take turns on the shared capture
+        class OverlapCapture(CountingCapture):
+            def __init__(self):
+                super().__init__()
+                self.inside = 0
+                self.overlaps = 0
+                self.released = False
+            
+            def read(self):
+                self.inside += 1
+                self.overlaps += self.inside > 1
+                result = super().read()
+                self.inside -= 1
+                return result
+            
+            def release(self):
+                self.released = True
+        
+        camera = RTSPCamera(99991, 'shared-test', '127.0.0.1', 554, 'admin', 'admin', continuous=False)
+        capture = OverlapCapture()
+        camera.cap = capture
+        camera.is_connected = True
+        readers = [threading.Thread(target=lambda: [camera.read_frame() for _ in range(10)]) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+        check_test("To'g'ridan-to'g'ri o'quvchilar navbat bilan o'qiydi",
+             capture.reads == 40 and capture.overlaps == 0, f"Got: {capture.reads} reads, {capture.overlaps} overlaps")
+        
+        # connect() outside the supervisor releases the capture it replaces
+        import camera.rtsp_client as rtsp_module
+        original_open = rtsp_module.open_capture
+        rtsp_module.open_capture = lambda *args, **kwargs: type(
+            'ClosedCapture', (), {'isOpened': lambda self: False, 'release': lambda self: None})()
+        try:
+            camera.connect(timeout=0.1)
+        finally:
+            rtsp_module.open_capture = original_open
+        check_test("Qayta ulanishda eski capture bo'shatiladi", capture.released and not camera.is_connected)
+        
+    except Exception as e:
+        check_test("Continuous grab tests", False, str(e))
+
+
+def test_parallel_connect():
+    """Test 33: Kameralarga parallel ulanish va ochish muddati (timeout)."""
+    print("\n" + "="*50)
+    print("3️⃣3️⃣ PARALLEL ULANISH TEKSHIRUVI")
+    print("="*50)
+    
+    try:
+        import socket
+        import threading
+        import time
+        from camera.rtsp_client import open_capture
+        from camera.stream_manager import StreamManager
+        
+        # An RTSP "camera" that accepts connections and never answers
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(16)
+        url = f"rtsp://127.0.0.1:{server.getsockname()[1]}/stream"
+        accepted = []
+        
+        def accept():
+            try:
+                while True:
+                    accepted.append(server.accept()[0])
+            except OSError:
+                pass
+        
+        threading.Thread(target=accept, daemon=True).start()
+        
+        try:
+            started = time.time()
+            cap = open_capture(url, timeout=1.0)
+            elapsed = time.time() - started
+            check_test("Javob bermaydigan kamera ochilmaydi", not cap.isOpened())
+            check_test("open_capture muddatda qaytadi", elapsed < 3.0, f"Got: {elapsed:.1f}s")
+            cap.release()
+            
+            manager = StreamManager()
+            for camera_id in range(99980, 99984):
+                manager.add_camera(camera_id, f'silent-{camera_id}', '127.0.0.1', rtsp_url=url)
+            
+            summary = manager.connect_all(max_workers=4, deadline=1.0)
+            unreachable = sorted(summary['failed'] + summary['timed_out'])
+            check_test("Hamma javobsiz kameralar qayd etildi", unreachable == list(range(99980, 99984)),
+                 f"Got: {summary}")
+            # One after another this would take ~4 s
+            check_test("Kameralar parallel ulanadi", summary['elapsed'] < 3.0, f"Got: {summary['elapsed']}s")
+            
+            manager.cleanup()
+        finally:
+            server.close()
+            for conn in accepted:
+                conn.close()
+                
+    except Exception as e:
+        check_test("Parallel connect tests", False, str(e))
+
+
 def print_summary():
     """Print test summary."""
     print("\n" + "="*50)
@@ -385,5 +2093,29 @@ if __name__ == '__main__':
     test_conversation_handlers()
     test_unknown_callback_handler()
     test_ffmpeg_availability()
+    test_frame_bus()
+    test_camera_detection()
+    test_camera_supervisor()
+    test_dual_stream()
+    test_ffmpeg_reader()
+    test_motion_gate()
+    test_analysis_scheduler()
+    test_stream_metrics()
+    test_snapshot_cache()
+    test_shared_frame_ring()
+    test_idle_streams()
+    test_segment_recorder()
+    test_segment_catalog()
+    test_keyframe_index()
+    test_iter_frames()
+    test_clip_cache()
+    test_async_clip_extraction()
+    test_clip_trimming()
+    test_event_clips()
+    test_recording_policy()
+    test_archive_retention()
+    test_archive_compaction()
+    test_continuous_grab()
+    test_parallel_connect()
     
     print_summary()
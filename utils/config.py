@@ -30,6 +30,20 @@ CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', '0.5'))
 MODELS_DIR = BASE_DIR / 'ai' / 'models'
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Motion gate: only frames with enough changed pixels reach the detector
+MOTION_GATE_ENABLED = os.getenv('MOTION_GATE_ENABLED', 'True').lower() == 'true'
+MOTION_METHOD = os.getenv('MOTION_METHOD', 'diff').lower()  # 'diff' or 'mog2'
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', '0.01'))  # changed-pixel ratio
+MOTION_KEYFRAME_INTERVAL = float(os.getenv('MOTION_KEYFRAME_INTERVAL', '5.0'))  # seconds
+MOTION_FRAME_WIDTH = int(os.getenv('MOTION_FRAME_WIDTH', '160'))
+
+# Live analysis: per-camera rate adapts to activity between MIN and MAX fps
+ANALYSIS_ENABLED = os.getenv('ANALYSIS_ENABLED', 'False').lower() == 'true'
+ANALYSIS_MIN_FPS = float(os.getenv('ANALYSIS_MIN_FPS', '0.2'))
+ANALYSIS_MAX_FPS = float(os.getenv('ANALYSIS_MAX_FPS', '5.0'))
+ANALYSIS_CPU_BUDGET = float(os.getenv('ANALYSIS_CPU_BUDGET', '1.0'))  # share of one CPU core
+ANALYSIS_IDLE_HALF_LIFE = float(os.getenv('ANALYSIS_IDLE_HALF_LIFE', '10.0'))  # seconds
+
 # Gemini AI API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
@@ -37,6 +51,102 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 DEFAULT_RTSP_PORT = 554
 DEFAULT_TIMEOUT = 10  # seconds
 
+# Startup: cameras connected in parallel, each bounded by its own deadline
+CONNECT_CONCURRENCY = int(os.getenv('CONNECT_CONCURRENCY', '8'))
+CONNECT_DEADLINE = float(os.getenv('CONNECT_DEADLINE', str(DEFAULT_TIMEOUT)))  # seconds
+
+# Continuous grab mode: a reader thread per camera keeps only the newest frame
+CONTINUOUS_GRAB = os.getenv('CONTINUOUS_GRAB', 'False').lower() == 'true'
+FRAME_MAX_AGE = float(os.getenv('FRAME_MAX_AGE', '2.0'))  # seconds
+
+# Ingest mode: 'thread' (all cameras in the bot process) or 'process' (cameras sharded
+# across worker processes, frames handed over through shared-memory rings)
+INGEST_MODE = os.getenv('INGEST_MODE', 'thread').lower()
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '0')) or os.cpu_count() or 1
+INGEST_RING_SLOTS = int(os.getenv('INGEST_RING_SLOTS', '4'))  # frames kept per stream
+
+# Snapshot cache: encoded JPEG per camera shared by all handlers
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '1.0'))  # seconds
+SNAPSHOT_JPEG_QUALITY = int(os.getenv('SNAPSHOT_JPEG_QUALITY', '85'))
+SNAPSHOT_PREVIEW_WIDTH = int(os.getenv('SNAPSHOT_PREVIEW_WIDTH', '320'))  # 0 disables previews
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv('SNAPSHOT_REFRESH_INTERVAL', '0'))  # seconds, 0 = lazy only
+
+# Frame reader backend per camera role: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (decoder subprocess)
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+CAPTURE_BACKENDS = {
+    'analytics': os.getenv('CAPTURE_BACKEND_ANALYTICS', 'opencv').lower(),
+    'snapshot': os.getenv('CAPTURE_BACKEND_SNAPSHOT', 'opencv').lower(),
+    'recording': os.getenv('CAPTURE_BACKEND_RECORDING', 'opencv').lower(),
+}
+
+# Recording: 'ffmpeg' stream-copies RTSP into segments (no decode), 'opencv' re-encodes decoded frames
+RECORDING_BACKEND = os.getenv('RECORDING_BACKEND', 'ffmpeg').lower()
+
+# Recording policy per camera: 'continuous', 'motion' (activity plus pre/post-roll) or 'scheduled'.
+# Motion is scored on the low-resolution stream at a few frames per second.
+RECORDING_PRE_ROLL = float(os.getenv('RECORDING_PRE_ROLL', '5'))  # seconds, ffmpeg backend only
+RECORDING_POST_ROLL = float(os.getenv('RECORDING_POST_ROLL', '30'))  # seconds
+RECORDING_MOTION_FPS = float(os.getenv('RECORDING_MOTION_FPS', '2'))
+
+# Archive retention: segments past the age limit, or the oldest ones once a quota is exceeded,
+# are deleted (an organization's storage_limit_gb is its quota as well)
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '30'))
+ARCHIVE_MAX_GB = float(os.getenv('ARCHIVE_MAX_GB', '0'))  # whole archive, 0 = no quota
+ARCHIVE_CAMERA_MAX_GB = float(os.getenv('ARCHIVE_CAMERA_MAX_GB', '0'))  # per camera, 0 = no quota
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))  # seconds between age sweeps
+
+# Tiered compaction (off by default, re-encodes are lossy): segments older than COMPACTION_AFTER_DAYS
+# are re-encoded by a small pool of niced ffmpeg processes to the archive quality their organization
+# chose; organizations without one keep their original video
+COMPACTION_ENABLED = os.getenv('COMPACTION_ENABLED', 'False').lower() == 'true'
+COMPACTION_AFTER_DAYS = float(os.getenv('COMPACTION_AFTER_DAYS', '7'))
+COMPACTION_WORKERS = int(os.getenv('COMPACTION_WORKERS', '1'))  # simultaneous ffmpeg encodes
+COMPACTION_CPU_BUDGET = float(os.getenv('COMPACTION_CPU_BUDGET', '1.0'))  # CPU cores, averaged over time
+COMPACTION_NICE = int(os.getenv('COMPACTION_NICE', '19'))
+COMPACTION_INTERVAL = float(os.getenv('COMPACTION_INTERVAL', '3600'))  # seconds between passes
+
+# Archive seeks: a keyframe this close to the requested time is served instead of the exact frame
+SEEK_KEYFRAME_TOLERANCE = float(os.getenv('SEEK_KEYFRAME_TOLERANCE', '1.0'))  # seconds, 0 = always exact
+
+# Parallel archive extraction: segments decoded in worker processes, frames downscaled there
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '0')) or os.cpu_count() or 1
+ARCHIVE_WORKER_FRAME_WIDTH = int(os.getenv('ARCHIVE_WORKER_FRAME_WIDTH', '640'))  # 0 keeps full size
+# Workers when each one runs an analyzer (e.g. loads its own YOLO model)
+EXTRACT_ANALYZER_WORKERS = int(os.getenv('EXTRACT_ANALYZER_WORKERS', '2'))
+
+# Clip cache: extracted clips reused per camera and quantized range, oldest deleted over budget
+CLIP_CACHE_MAX_MB = float(os.getenv('CLIP_CACHE_MAX_MB', '2048'))
+CLIP_CACHE_QUANTUM = float(os.getenv('CLIP_CACHE_QUANTUM', '10'))  # seconds, 0 = exact ranges
+CLIP_CONCURRENCY = int(os.getenv('CLIP_CONCURRENCY', '2'))  # simultaneous ffmpeg clip jobs
+
+# Event clips: the recorder keeps the last seconds of encoded packets per camera in memory
+# (ffmpeg backend) and writes a pre/post-roll clip from them when an alert fires
+EVENT_CLIPS_ENABLED = os.getenv('EVENT_CLIPS_ENABLED', 'True').lower() == 'true'
+PACKET_RING_SECONDS = float(os.getenv('PACKET_RING_SECONDS', '30'))  # keep above pre-roll + post-roll
+EVENT_CLIP_PRE_ROLL = float(os.getenv('EVENT_CLIP_PRE_ROLL', '10'))  # seconds before the alert
+EVENT_CLIP_POST_ROLL = float(os.getenv('EVENT_CLIP_POST_ROLL', '10'))  # seconds after the alert
+EVENT_CLIPS_MAX_MB = float(os.getenv('EVENT_CLIPS_MAX_MB', '1024'))  # oldest deleted over budget, 0 = no budget
+
+# ffmpeg backend decode options for analytics (0 keeps the source width/rate)
+ANALYTICS_FRAME_WIDTH = int(os.getenv('ANALYTICS_FRAME_WIDTH', '640'))
+ANALYTICS_FPS = float(os.getenv('ANALYTICS_FPS', '0'))
+ANALYTICS_KEYFRAMES_ONLY = os.getenv('ANALYTICS_KEYFRAMES_ONLY', 'False').lower() == 'true'
+
+# Connection supervisor: background reconnects with jittered exponential backoff
+SUPERVISOR_INTERVAL = float(os.getenv('SUPERVISOR_INTERVAL', '1.0'))  # seconds
+RECONNECT_BACKOFF_BASE = float(os.getenv('RECONNECT_BACKOFF_BASE', '1.0'))  # seconds
+RECONNECT_BACKOFF_MAX = float(os.getenv('RECONNECT_BACKOFF_MAX', '60.0'))  # seconds
+CAMERA_OFFLINE_AFTER = int(os.getenv('CAMERA_OFFLINE_AFTER', '3'))  # failed attempts
+CAMERA_STALE_AFTER = float(os.getenv('CAMERA_STALE_AFTER', '10.0'))  # seconds without a frame
+
+# Health server: token for /metrics/cameras (Bearer header or ?token=); unset = local requests only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Idle teardown: close captures nobody records, analyses or viewed for this long (0 = never)
+STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', '600'))  # seconds
+# Close a sub-stream without subscribers once no analytics frame was read for this long (0 = never)
+SUBSTREAM_IDLE_TIMEOUT = float(os.getenv('SUBSTREAM_IDLE_TIMEOUT', '60'))  # seconds
+
 # Logging
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -56,6 +166,15 @@ CAMERA_RTSP_FORMATS = {
     'generic': 'rtsp://{username}:{password}@{ip}:{port}/stream',
 }
 
+# Low-resolution sub-streams used for analytics (brands without one fall back to the main stream)
+CAMERA_RTSP_SUBSTREAM_FORMATS = {
+    'hikvision': 'rtsp://{username}:{password}@{ip}:{port}/Streaming/Channels/102',
+    'dahua': 'rtsp://{username}:{password}@{ip}:{port}/cam/realmonitor?channel=1&subtype=1',
+    'tp-link': 'rtsp://{username}:{password}@{ip}:{port}/stream2',
+    'xiaomi': 'rtsp://{username}:{password}@{ip}:{port}/stream2',
+}
+SUBSTREAM_ENABLED = os.getenv('SUBSTREAM_ENABLED', 'True').lower() == 'true'
+
 # Admin user IDs (will be configured via bot)
 ADMIN_IDS = []
 
@@ -72,3 +191,17 @@ def get_rtsp_url(camera_type: str, ip: str, port: int, username: str, password:
         ip=ip,
         port=port
     )
+
+def get_substream_url(camera_type: str, ip: str, port: int, username: str, password: str):
+    """Generate sub-stream RTSP URL, or None if the camera type has no known sub-stream."""
+    rtsp_format = CAMERA_RTSP_SUBSTREAM_FORMATS.get(camera_type.lower())
+    
+    if rtsp_format is None:
+        return None
+    
+    return rtsp_format.format(
+        username=username,
+        password=password,
+        ip=ip,
+        port=port
+    )
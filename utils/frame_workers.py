@@ -0,0 +1,148 @@
+"""
+Frame Workers
+Parallel arxiv dekodlash worker'lari (recorder va bazasiz yengil modul).
+
+Spawn qilingan worker'lar faqat shu modulni import qiladi. ``camera``
+paketi import qilinmaydi, shuning uchun har jarayonda StreamManager,
+VideoRecorder, Database yoki migratsiyalar qayta ishga tushmaydi.
+"""
+import cv2
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Tuple
+import numpy as np
+
+# Seeks tried before decoding a segment from its start instead
+SEEK_ATTEMPTS = 3
+
+
+def prepare_frame(frame: np.ndarray, resize, grayscale: bool) -> np.ndarray:
+    """Kadrni kichraytirish va/yoki kulrangga o'tkazish."""
+    if resize:
+        height, width = frame.shape[:2]
+        if isinstance(resize, int):
+            size = (resize, max(1, height * resize // width))
+        else:
+            size = tuple(resize)
+        if size != (width, height):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    
+    if grayscale:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    
+    return frame
+
+
+def seek_before(cap: cv2.VideoCapture, offset: float, fps: float):
+    """
+    Capture'ni ``offset`` soniyadan oldingi (yoki aynan shu) kadrga o'tkazish.
+    
+    OpenCV vaqt bo'yicha seek'ni kadr soniga aylantiradi, o'zgaruvchan
+    tezlikli segmentda esa u keragidan oldinga o'tib ketadi. Shuning uchun
+    tushilgan kadr vaqti tekshiriladi va oshib ketgan qadar orqaga qaytiladi.
+    """
+    target = offset
+    for _ in range(SEEK_ATTEMPTS):
+        if target <= 0:
+            break
+        
+        cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000)
+        if not cap.grab():
+            target = target / 2 if target > 1 else 0.0  # past the end: fewer frames than fps says
+            continue
+        
+        overshoot = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 - offset
+        if overshoot <= 1 / fps:
+            break
+        target = max(0.0, target - overshoot - 1.0)
+    else:
+        target = 0.0
+    
+    cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000)
+
+
+def segment_frames(segment_path: str, seg_start: datetime,
+                   start_time: datetime, end_time: datetime,
+                   interval_seconds: float, resize, grayscale: bool) -> Iterator[Tuple[datetime, np.ndarray]]:
+    """
+    Bitta segmentdagi namuna kadrlar: (vaqt, kadr).
+    
+    Namunalar ``start_time + k * interval_seconds`` to'rida olinadi, shuning
+    uchun segmentlar qaysi tartibda (yoki qaysi jarayonda) dekodlanishidan
+    qat'i nazar natija bir xil bo'ladi. Kadr vaqti uning taqdimot vaqtidan
+    (POS_MSEC) olinadi: RTSP dan stream-copy qilingan segmentlarda kadr
+    tezligi o'zgaruvchan, ``kadr raqami / fps`` esa soniyalab siljiydi.
+    """
+    interval = timedelta(seconds=interval_seconds)
+    
+    # First grid point inside this segment
+    next_sample = start_time
+    if seg_start > start_time:
+        steps = -((start_time - seg_start) // interval)  # ceil
+        next_sample = start_time + steps * interval
+    
+    cap = cv2.VideoCapture(segment_path)
+    if not cap.isOpened():
+        return
+    
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 15
+        
+        # Seek to (at most) the first wanted frame, sequential decoding from there
+        offset = (next_sample - seg_start).total_seconds()
+        if offset > 0:
+            seek_before(cap, offset, fps)
+        
+        position = None
+        while cap.grab():
+            # Presentation time of the grabbed frame; frames without one follow the previous frame
+            grabbed_at = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            position = grabbed_at if position is None or grabbed_at > position else position + 1 / fps
+            frame_timestamp = seg_start + timedelta(seconds=position)
+            
+            if frame_timestamp > end_time:
+                break
+            if frame_timestamp < next_sample:
+                continue
+            
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            
+            while next_sample <= frame_timestamp:
+                next_sample += interval
+            
+            yield frame_timestamp, prepare_frame(frame, resize, grayscale)
+    finally:
+        cap.release()
+
+
+def extract_segment(segment_path: str, seg_start: datetime,
+                    start_time: datetime, end_time: datetime,
+                    interval_seconds: float, resize, grayscale: bool,
+                    analyzer: Optional[Callable] = None) -> List[Tuple[datetime, object]]:
+    """
+    Worker jarayonidagi vazifa: segmentni dekodlash.
+    
+    ``analyzer`` berilsa, kadr o'rniga uning natijasi qaytadi (pikselsiz).
+    """
+    results = []
+    for frame_timestamp, frame in segment_frames(segment_path, seg_start, start_time, end_time,
+                                                 interval_seconds, resize, grayscale):
+        results.append((frame_timestamp, analyzer(frame) if analyzer else frame))
+    return results
+
+
+def init_worker():
+    """Worker'lar parallel ishlaydi - OpenCV ichki thread'lari bir-biriga xalaqit bermasin."""
+    cv2.setNumThreads(1)
+
+
+def detect_objects(frame: np.ndarray) -> List[dict]:
+    """
+    YOLO aniqlash worker ichida (model har jarayonda bir marta yuklanadi).
+    
+    Har worker o'z modelini yuklaydi, shuning uchun analyzer bilan
+    EXTRACT_ANALYZER_WORKERS (kichik son) ishlatiladi.
+    """
+    from ai.detector import detector
+    return detector.detect(frame)
@@ -0,0 +1,17 @@
+"""Coordinate helpers shared by camera and AI code."""
+from typing import Tuple
+
+
+def scale_bbox(bbox: Tuple[int, int, int, int], from_shape: tuple,
+               to_shape: tuple) -> Tuple[int, int, int, int]:
+    """
+    Map an (x, y, w, h) box between frames of different resolution.
+    
+    Shapes are numpy frame shapes, (height, width[, channels]), e.g. from a
+    sub-stream frame to the matching main-stream frame.
+    """
+    scale_x = to_shape[1] / from_shape[1]
+    scale_y = to_shape[0] / from_shape[0]
+    x, y, w, h = bbox
+    return (int(round(x * scale_x)), int(round(y * scale_y)),
+            int(round(w * scale_x)), int(round(h * scale_y)))